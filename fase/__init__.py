@@ -1,5 +1,21 @@
-from fase import db
-from fase.core.app import FastBase
-from fase.utils import logging
-from fase.core import config
-from fase.cli.main import cli
+from typing import TYPE_CHECKING
+
+from fase.utils import lazy
+
+if TYPE_CHECKING:
+    from fase import db
+    from fase.cli.main import cli
+    from fase.core import config
+    from fase.core.app import FastBase
+    from fase.utils import logging
+
+__getattr__, __dir__ = lazy.attributes(
+    __name__,
+    {
+        "db": ("fase.db", None),
+        "FastBase": ("fase.core.app", "FastBase"),
+        "logging": ("fase.utils.logging", None),
+        "config": ("fase.core.config", None),
+        "cli": ("fase.cli.main", "cli"),
+    },
+)
@@ -1,16 +1,33 @@
 from __future__ import annotations
 
-from typing import Any, Callable
+import asyncio
+import contextlib
+import dataclasses
+import os
+from typing import Any, Callable, Type
 
 import fastapi
 import uvicorn
-from fastapi.middleware import cors
 from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import DeclarativeBase
 from starlette import types
 
 from fase import users
-from fase.core import config
-from fase.db import connection
+from fase.core import config, diagnostics, reload, responses, scheduler
+from fase.db import connection, job_queue
+from fase.middlewares import (
+    audit,
+    coalescing,
+    compression,
+    concurrency,
+    cors,
+    idempotency,
+    log_context,
+    metrics,
+    profiling,
+    rate_limit,
+)
+from fase.utils import logging, loop_monitor, tracing
 
 
 class FastBase:
@@ -19,46 +36,450 @@ class FastBase:
         settings: str | list[str] | config.AppConfig,
         engine: AsyncEngine | None = None,
         lifespan: types.Lifespan | None = None,
+        config_cache_dir: str | None = None,
     ):
+        self.settings_paths: list[str] | None = None
+        self.settings_builder: config.TomlFileDynaConfConfigBuilder | None = None
+        self.config_cache_dir = config_cache_dir
         if isinstance(settings, str):
-            self.settings = config.TomlFileDynaConfConfigBuilder([settings]).build()
+            self.settings_paths = [settings]
+            self.settings = self.build_settings()
         elif isinstance(settings, list):
-            self.settings = config.TomlFileDynaConfConfigBuilder(settings).build()
+            self.settings_paths = settings
+            self.settings = self.build_settings()
         elif isinstance(settings, config.AppConfig):
             self.settings = settings
         else:
             raise TypeError(f"unknown type {type(settings)} for settings")
+        # an engine passed in is owned by the caller and not disposed on shutdown
+        self.owns_engine = engine is None and self.settings.db is not None
+        if self.owns_engine:
+            engine = connection.ConnectionConfigure(self.settings.db).create_engine()
+        self.engine = engine
+        if engine is not None:
+            connection.ConnectionConfigure().set_engine(engine)
+        self.engine_pid = os.getpid()
+        self.lifespans: list[types.Lifespan] = [self.db_lifespan]
+        self.user_lifespan = lifespan
+        self.scheduler: scheduler.Scheduler | None = None
         self.fast_app = fastapi.FastAPI(
-            lifespan=lifespan,
+            lifespan=self.lifespan,
             docs_url=self.settings.docs_url,
+            default_response_class=responses.get_response_class(
+                self.settings.response_class
+            ),
         )
+        profiling_config = self.settings.profiling
+        if profiling_config and (profiling_config.token or profiling_config.sample_rate):
+            self.add_profiling(profiling_config)
+        if self.settings.concurrency:
+            self.add_concurrency_limit(self.settings.concurrency)
+        if self.settings.coalescing:
+            self.add_coalescing(self.settings.coalescing)
+        if self.settings.compression:
+            self.add_compression(self.settings.compression)
+        if self.settings.idempotency:
+            self.add_idempotency(self.settings.idempotency)
+        if self.settings.rate_limit:
+            self.add_rate_limit(self.settings.rate_limit)
         if self.settings.cors:
             self.add_cors(self.settings.cors)
-        if engine:
-            connection.ConnectionConfigure().set_engine(engine)
-        elif self.settings.db:
-            connection.ConnectionConfigure(self.settings.db).create_and_set_engine()
+        if self.settings.diagnostics:
+            self.add_diagnostics(self.settings.diagnostics)
+        if self.settings.loop_monitor:
+            self.add_loop_monitor(self.settings.loop_monitor)
+        if self.settings.tracing:
+            self.add_tracing(self.settings.tracing)
+        if self.settings.logging:
+            self.init_logging(self.settings.logging)
+        # added last so it's the outermost and counts responses of other middlewares
+        if self.settings.metrics:
+            self.add_metrics(self.settings.metrics)
+        if self.settings.scheduler:
+            self.add_scheduler(self.settings.scheduler)
+        if self.settings.hot_reload_interval:
+            self.enable_hot_reload(self.settings.hot_reload_interval)
+
+    def build_settings(self) -> config.AppConfig:
+        if self.settings_paths is None:
+            raise ValueError("settings are not loaded from files")
+        if self.settings_builder is None:
+            if self.config_cache_dir:
+                self.settings_builder = config.CachedTomlConfigBuilder(
+                    self.settings_paths, self.config_cache_dir
+                )
+            else:
+                self.settings_builder = config.TomlFileDynaConfConfigBuilder(
+                    self.settings_paths
+                )
+        return self.settings_builder.build()
+
+    def find_middleware(self, middleware_class: type) -> Any:
+        app = self.fast_app.middleware_stack
+        while app is not None:
+            if isinstance(app, middleware_class):
+                return app
+            app = getattr(app, "app", None)
+        return None
+
+    def reconfigure_middleware(self, middleware_class: type, value: Any) -> bool:
+        middleware = self.find_middleware(middleware_class)
+        if middleware is None:
+            return False
+        middleware.configure(value)
+        return True
+
+    def reload_setting(self, name: str, value: Any) -> bool:
+        if value is None:
+            return False
+        if name == "cors":
+            return self.reconfigure_middleware(cors.CORSMiddleware, value)
+        if name == "rate_limit":
+            return self.reconfigure_middleware(rate_limit.RateLimitMiddleware, value)
+        if name == "logging":
+            current = self.settings.logging
+            if current is None or dataclasses.replace(value, level=current.level) != current:
+                return False
+            logging.set_level(value.level)
+            return True
+        return False
+
+    def apply_settings(self, new: config.AppConfig, changed: list[str]) -> list[str]:
+        """
+        Applies settings that are safe to change while running
+
+        Returns:
+            changed settings that need restart
+        """
+        applied = {
+            name: getattr(new, name)
+            for name in changed
+            if self.reload_setting(name, getattr(new, name))
+        }
+        # swap whole object so readers never see half applied settings
+        self.settings = dataclasses.replace(self.settings, **applied)
+        return [name for name in changed if name not in applied]
+
+    def enable_hot_reload(self, interval: float = 1) -> reload.ConfigWatcher:
+        if self.settings_builder is None:
+            raise ValueError("hot reload needs settings loaded from files")
+        watcher = reload.ConfigWatcher(
+            paths=self.settings_builder.watched_files(),
+            current=self.settings,
+            build=self.build_settings,
+            apply=self.apply_settings,
+            interval=interval,
+        )
+        self.add_lifespan(watcher.lifespan)
+        return watcher
+
+    @contextlib.asynccontextmanager
+    async def lifespan(self, app: fastapi.FastAPI):
+        """
+        Enters lifespans added by `add_lifespan` in order, then the user lifespan
+        """
+        state = {}
+        async with contextlib.AsyncExitStack() as stack:
+            lifespans = list(self.lifespans)
+            if self.user_lifespan:
+                lifespans.append(self.user_lifespan)
+            for lifespan in lifespans:
+                lifespan_state = await stack.enter_async_context(lifespan(app))
+                if lifespan_state:
+                    state.update(lifespan_state)
+            yield state or None
+
+    @contextlib.asynccontextmanager
+    async def db_lifespan(self, _app: fastapi.FastAPI):
+        """
+        Engine is created in `__init__`, so sessions work without the lifespan too.
+        A worker forked after that gets a new pool here instead of sharing sockets
+        of the parent process
+        """
+        if self.engine is None:
+            yield
+            return
+        if os.getpid() != self.engine_pid:
+            # drop connections inherited from parent process without closing them
+            await self.engine.dispose(close=False)
+            self.engine_pid = os.getpid()
+        try:
+            yield
+        finally:
+            if self.owns_engine:
+                await self.engine.dispose()
+
+    def init_logging(self, logging_config: config.LoggingConfig):
+        filters = []
+        if logging_config.filters:
+            filters = logging.create_filters(
+                **dataclasses.asdict(logging_config.filters)
+            )
+        logging.init_logging(
+            logging_config.level,
+            logging_config.path,
+            queue_size=logging_config.queue_size,
+            overflow=logging_config.overflow,
+            log_format=logging_config.format,
+            filters=filters,
+        )
+        if logging_config.format == logging.JSON:
+            self.fast_app.add_middleware(log_context.LogContextMiddleware)
+        if logging_config.queue_size:
+            self.add_lifespan(self.logging_lifespan)
+
+    @contextlib.asynccontextmanager
+    async def logging_lifespan(self, _app: fastapi.FastAPI):
+        # listener thread of a worker forked after `__init__`, like with --preload
+        logging.start_queue()
+        try:
+            yield
+        finally:
+            # records logged until shutdown are written before the process exits
+            await asyncio.to_thread(logging.flush_queue)
+
+    def add_lifespan(self, lifespan: types.Lifespan):
+        self.lifespans.append(lifespan)
 
     def config_sync_db(self) -> FastBase:
         connection.SyncConnectionConfigure(self.settings.db).create_and_set_engine()
         return self
 
     def add_cors(self, cors_config: config.CorsConfig):
+        self.fast_app.add_middleware(cors.CORSMiddleware, cors_config=cors_config)
+
+    def add_rate_limit(
+        self,
+        rate_limit_config: config.RateLimitConfig,
+        backend: rate_limit.RateLimitBackend | None = None,
+    ):
+        self.fast_app.add_middleware(
+            rate_limit.RateLimitMiddleware,
+            rate_limit_config=rate_limit_config,
+            backend=backend,
+        )
+
+    def add_idempotency(
+        self,
+        idempotency_config: config.IdempotencyConfig | None = None,
+        store: idempotency.IdempotencyStore | None = None,
+    ):
+        idempotency_config = (
+            idempotency_config or self.settings.idempotency or config.IdempotencyConfig()
+        )
+        if store is None:
+            store = idempotency.MemoryStore(
+                ttl=idempotency_config.ttl,
+                max_entries=idempotency_config.max_entries,
+                max_bytes=idempotency_config.max_bytes,
+            )
         self.fast_app.add_middleware(
-            cors.CORSMiddleware,
-            allow_origins=cors_config.allow_origins,
-            allow_credentials=True,
-            allow_methods=cors_config.allow_methods,
-            allow_headers=cors_config.allow_headers,
+            idempotency.IdempotencyMiddleware,
+            store=store,
+            header=idempotency_config.header,
+            methods=idempotency_config.methods,
+            max_body_size=idempotency_config.max_body_size,
+            max_request_size=idempotency_config.max_request_size,
+            wait_timeout=idempotency_config.wait_timeout,
+        )
+
+    def add_diagnostics(self, diagnostics_config: config.DiagnosticsConfig):
+        self.fast_app.include_router(
+            diagnostics.router,
+            prefix=diagnostics_config.prefix,
+            dependencies=[diagnostics.admin_token_dep(diagnostics_config.token)],
+            include_in_schema=False,
+        )
+
+    def add_scheduler(
+        self, scheduler_config: config.SchedulerConfig | None = None
+    ) -> scheduler.Scheduler:
+        """
+        Jobs run from lifespan start to shutdown with their own db pool,
+        handlers reach the scheduler through `scheduler.SchedulerDep`
+        """
+        if self.scheduler is not None:
+            return self.scheduler
+        self.scheduler = scheduler.Scheduler(
+            scheduler_config or self.settings.scheduler,
+            self.settings.db,
+        )
+        self.add_lifespan(self.scheduler.lifespan)
+        return self.scheduler
+
+    def add_loop_monitor(
+        self,
+        loop_monitor_config: config.LoopMonitorConfig,
+        registry: metrics.Registry = metrics.REGISTRY,
+    ) -> loop_monitor.LoopMonitor:
+        monitor = loop_monitor.LoopMonitor(
+            interval=loop_monitor_config.interval,
+            threshold=loop_monitor_config.threshold,
+            strict_ms=loop_monitor_config.strict_ms,
+            registry=registry,
+        )
+        self.fast_app.add_middleware(loop_monitor.LoopMonitorMiddleware, monitor=monitor)
+        self.add_lifespan(monitor.lifespan)
+        return monitor
+
+    def add_tracing(
+        self,
+        tracing_config: config.TracingConfig | None = None,
+        exporter: tracing.Exporter | None = None,
+    ) -> tracing.Tracer:
+        """
+        Added before logging so `trace_id` of log context is the one of the recorded trace
+        """
+        tracing_config = tracing_config or self.settings.tracing or config.TracingConfig()
+        if exporter is None:
+            if tracing_config.exporter == "log":
+                exporter = tracing.LogExporter()
+            elif tracing_config.exporter == "file":
+                exporter = tracing.FileExporter(
+                    tracing_config.path, queue_size=tracing_config.queue_size
+                )
+            elif tracing_config.exporter == "otlp":
+                exporter = tracing.OTLPExporter(
+                    tracing_config.endpoint,
+                    service_name=tracing_config.service_name,
+                    queue_size=tracing_config.queue_size,
+                )
+            else:
+                raise ValueError(f"unknown tracing exporter {tracing_config.exporter}")
+        tracer = tracing.configure(exporter, tracing_config.sample_rate)
+        if tracing_config.record_db:
+            tracing.listen_db()
+        self.fast_app.add_middleware(tracing.TracingMiddleware, tracer=tracer)
+        self.add_lifespan(self.tracing_lifespan)
+        return tracer
+
+    @contextlib.asynccontextmanager
+    async def tracing_lifespan(self, _app: fastapi.FastAPI):
+        try:
+            yield
+        finally:
+            if tracing.tracer is not None:
+                # exported traces are sent before the process exits
+                await asyncio.to_thread(tracing.tracer.exporter.close)
+
+    def add_profiling(self, profiling_config: config.ProfilingConfig):
+        self.fast_app.add_middleware(
+            profiling.ProfilingMiddleware,
+            profiling_config=profiling_config,
+        )
+
+    def add_concurrency_limit(self, concurrency_config: config.ConcurrencyConfig):
+        self.fast_app.add_middleware(
+            concurrency.ConcurrencyMiddleware,
+            concurrency_config=concurrency_config,
+        )
+
+    def add_coalescing(self, coalescing_config: config.CoalescingConfig | None = None):
+        """
+        Identical concurrent GETs to `coalescing_config.paths` and routes marked
+        with `coalescing.safe` share one endpoint run
+        """
+        coalescing_config = coalescing_config or config.CoalescingConfig()
+        self.fast_app.add_middleware(
+            coalescing.CoalescingMiddleware,
+            paths=coalescing_config.paths,
+            scope=coalescing_config.scope,
+            max_wait=coalescing_config.max_wait,
+            max_body_size=coalescing_config.max_body_size,
+            routes=lambda: self.fast_app.routes,
+        )
+
+    def add_compression(self, compression_config: config.CompressionConfig):
+        self.fast_app.add_middleware(
+            compression.CompressionMiddleware,
+            minimum_size=compression_config.minimum_size,
+            algorithms=compression_config.algorithms,
+            content_types=compression_config.content_types,
+            levels=compression_config.levels,
+        )
+
+    def add_metrics(
+        self,
+        metrics_config: config.MetricsConfig,
+        registry: metrics.Registry = metrics.REGISTRY,
+    ):
+        kwargs = {}
+        if metrics_config.buckets:
+            kwargs["buckets"] = metrics_config.buckets
+        self.fast_app.add_middleware(
+            metrics.MetricsMiddleware,
+            registry=registry,
+            max_series=metrics_config.max_series,
+            **kwargs,
+        )
+        registry.add_collector(metrics.collect_db_pool(registry), name="db_pool")
+
+        def render_metrics() -> fastapi.Response:
+            return fastapi.Response(
+                registry.render(),
+                media_type="text/plain; version=0.0.4; charset=utf-8",
+            )
+
+        self.fast_app.add_api_route(
+            metrics_config.path,
+            render_metrics,
+            methods=["GET"],
+            include_in_schema=False,
+        )
+
+    def add_audit_log(
+        self,
+        model_class: Type[DeclarativeBase],
+        audit_config: config.AuditConfig | None = None,
+    ) -> audit.AuditWriter:
+        audit_config = audit_config or self.settings.audit or config.AuditConfig()
+        writer = audit.AuditWriter(
+            model_class=model_class,
+            queue_size=audit_config.queue_size,
+            batch_size=audit_config.batch_size,
+            flush_interval=audit_config.flush_interval,
+            overflow=audit_config.overflow,
+            spill_path=audit_config.spill_path,
+        )
+        self.fast_app.add_middleware(
+            audit.AuditMiddleware,
+            writer=writer,
+            methods=audit_config.methods,
+        )
+        self.add_lifespan(writer.lifespan)
+        return writer
+
+    def add_job_worker(
+        self,
+        model_class: Type[DeclarativeBase],
+        job_queue_config: config.JobQueueConfig | None = None,
+    ) -> job_queue.JobWorker:
+        job_queue_config = job_queue_config or self.settings.job_queue or config.JobQueueConfig()
+        worker = job_queue.JobWorker(
+            model_class=model_class,
+            **dataclasses.asdict(job_queue_config),
         )
+        self.add_lifespan(worker.lifespan)
+        return worker
 
     def run(self):
-        if self.settings.uvicorn is None:
+        uvicorn_config = self.settings.uvicorn
+        if uvicorn_config is None:
             raise ValueError("set uvicorn settings")
+        if uvicorn_config.workers > 1 and uvicorn_config.app is None:
+            raise ValueError(
+                "set uvicorn.app to import string of the app to run more than one worker"
+            )
         uvicorn.run(
-            app=self.fast_app,
-            host=self.settings.uvicorn.host,
-            port=self.settings.uvicorn.port,
+            app=uvicorn_config.app or self.fast_app,
+            host=uvicorn_config.host,
+            port=uvicorn_config.port,
+            workers=uvicorn_config.workers,
+            loop=uvicorn_config.loop,
+            http=uvicorn_config.http,
+            backlog=uvicorn_config.backlog,
+            timeout_keep_alive=uvicorn_config.timeout_keep_alive,
+            limit_concurrency=uvicorn_config.limit_concurrency,
         )
 
     def set_user_manager(
@@ -1,8 +1,15 @@
 import abc
+import dataclasses
 import enum
-from dataclasses import dataclass
+import hashlib
+import os
+import pickle
+import tempfile
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
 
-import dynaconf
+if TYPE_CHECKING:
+    import dynaconf
 
 
 class DBType(str, enum.Enum):
@@ -66,19 +73,238 @@ class CorsConfig:
 class UvicornConfig:
     host: str
     port: int
+    # import string like "example.main:app", required when workers > 1
+    app: str | None = None
+    workers: int = 1
+    loop: str = "auto"
+    http: str = "auto"
+    backlog: int = 2048
+    timeout_keep_alive: int = 5
+    limit_concurrency: int | None = None
+
+
+@dataclass
+class RateLimitRule:
+    requests: int
+    period: float
+    key: str = "ip"
+
+
+@dataclass
+class RateLimitConfig:
+    default: RateLimitRule | None = None
+    paths: dict[str, RateLimitRule] = field(default_factory=dict)
+    compact_interval: float = 60
+    # addresses or networks of proxies whose X-Forwarded-For is trusted
+    trusted_proxies: list[str] = field(default_factory=list)
+
+
+@dataclass
+class MetricsConfig:
+    path: str = "/metrics"
+    max_series: int = 1000
+    buckets: list[float] | None = None
+
+
+@dataclass
+class AuditConfig:
+    queue_size: int = 10000
+    batch_size: int = 500
+    flush_interval: float = 1
+    overflow: str = "drop"
+    spill_path: str | None = None
+    methods: list[str] | None = None
+
+
+@dataclass
+class CompressionConfig:
+    minimum_size: int = 500
+    algorithms: list[str] = field(default_factory=lambda: ["br", "zstd", "gzip"])
+    content_types: list[str] = field(
+        default_factory=lambda: [
+            "application/json",
+            "text/",
+            "application/javascript",
+            "application/xml",
+        ]
+    )
+    levels: dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class LoggingFilterConfig:
+    # records per `rate_limit_period` seconds from each call site
+    rate_limit: float | None = None
+    rate_limit_period: float = 1
+    # level name -> ratio of records kept
+    sampling: dict[str, float] = field(default_factory=dict)
+    # same message of a logger is logged once in this many seconds
+    dedup_window: float | None = None
+
+
+@dataclass
+class LoggingConfig:
+    level: str = "INFO"
+    path: str = "/tmp"
+    # records are written by a listener thread when set
+    queue_size: int | None = None
+    # "drop" or "drop_oldest" when queue is full
+    overflow: str = "drop"
+    # "text" or "json"
+    format: str = "text"
+    filters: LoggingFilterConfig | None = None
+
+
+@dataclass
+class ConcurrencyLimit:
+    initial: int = 20
+    min_limit: int = 1
+    max_limit: int = 200
+    target_latency: float = 0.5
+    backoff: float = 0.9
+    queue_size: int = 100
+    queue_timeout: float = 1
+    # request deadline in seconds, also used as db statement timeout
+    timeout: float | None = None
+
+
+@dataclass
+class ConcurrencyConfig:
+    default: ConcurrencyLimit | None = None
+    paths: dict[str, ConcurrencyLimit] = field(default_factory=dict)
+    cancel_on_disconnect: bool = True
+    timeout_header: str = "X-Request-Timeout"
+
+
+@dataclass
+class ProfilingConfig:
+    # requests with `header: token` are profiled, None disables the header
+    token: str | None = None
+    sample_rate: float = 0
+    header: str = "X-Fase-Profile"
+    output_dir: str = "/tmp/fase-profiles"
+    # older profiles in output_dir are removed
+    max_files: int = 100
+    max_concurrent: int = 1
+    # sampling interval of pyinstrument
+    interval: float = 0.001
+
+
+@dataclass
+class DiagnosticsConfig:
+    token: str
+    prefix: str = "/_fase/diagnostics"
+
+
+@dataclass
+class LoopMonitorConfig:
+    # seconds between two lag measurements
+    interval: float = 0.1
+    # stack of loop is logged when it's blocked this many seconds
+    threshold: float = 0.1
+    # fail on shutdown when loop was blocked more than this many milliseconds, for tests
+    strict_ms: float | None = None
+
+
+@dataclass
+class SchedulerConfig:
+    thread_workers: int = 4
+    # 0 disables process pool
+    process_workers: int = 0
+    # pool of jobs' own engine, used by postgres
+    pool_size: int = 2
+    max_overflow: int = 0
+    # seconds running jobs get to finish on shutdown before they are cancelled
+    shutdown_timeout: float = 10
+
+
+@dataclass
+class JobQueueConfig:
+    queue: str = "default"
+    batch_size: int = 10
+    concurrency: int = 10
+    poll_interval: float = 1
+    # claimed jobs are retried by other workers after this many seconds
+    visibility_timeout: float = 300
+    # retry n waits up to min(backoff_max, backoff_base ** n) seconds
+    backoff_base: float = 2
+    backoff_max: float = 3600
+    shutdown_timeout: float = 10
+
+
+@dataclass
+class IdempotencyConfig:
+    header: str = "Idempotency-Key"
+    methods: list[str] = field(default_factory=lambda: ["POST", "PATCH"])
+    # seconds a response is replayed
+    ttl: float = 86400
+    # entries and total bytes kept by the in-memory store
+    max_entries: int = 10000
+    max_bytes: int = 100_000_000
+    # larger responses are not stored
+    max_body_size: int = 1_000_000
+    # requests with an idempotency key and a larger body get 413
+    max_request_size: int = 1_000_000
+    # seconds a duplicate waits for the original before getting 409
+    wait_timeout: float = 10
+
+
+@dataclass
+class CoalescingConfig:
+    # path prefixes coalesced besides routes marked with `coalescing.safe`
+    paths: list[str] = field(default_factory=list)
+    # "user" or "global", global scope is for responses that are the same for everyone
+    scope: str = "user"
+    # seconds a request waits for identical one before running itself
+    max_wait: float = 5
+    # larger responses are not shared
+    max_body_size: int = 10_000_000
+
+
+@dataclass
+class TracingConfig:
+    # share of requests without `traceparent` header that are recorded
+    sample_rate: float = 0.01
+    # "log", "file" or "otlp"
+    exporter: str = "log"
+    # file of "file" exporter
+    path: str = "/tmp/fase_spans.jsonl"
+    # collector of "otlp" exporter
+    endpoint: str = "http://127.0.0.1:4318/v1/traces"
+    service_name: str = "fase"
+    # traces waiting for file and otlp exporters, more are dropped
+    queue_size: int = 1000
+    # records a span for each db statement
+    record_db: bool = True
 
 
 @dataclass
 class AppConfig:
     docs_url: str | None = None
+    response_class: str = "auto"
+    hot_reload_interval: float | None = None
     db_type: DBType | None = None
     db: DBConfig | None = None
     cors: CorsConfig | None = None
     uvicorn: UvicornConfig | None = None
+    rate_limit: RateLimitConfig | None = None
+    metrics: MetricsConfig | None = None
+    audit: AuditConfig | None = None
+    compression: CompressionConfig | None = None
+    logging: LoggingConfig | None = None
+    concurrency: ConcurrencyConfig | None = None
+    profiling: ProfilingConfig | None = None
+    diagnostics: DiagnosticsConfig | None = None
+    loop_monitor: LoopMonitorConfig | None = None
+    scheduler: SchedulerConfig | None = None
+    job_queue: JobQueueConfig | None = None
+    idempotency: IdempotencyConfig | None = None
+    coalescing: CoalescingConfig | None = None
+    tracing: TracingConfig | None = None
 
 
 class DynaConfConfigBuilder:
-    def __init__(self, settings=dynaconf.base.Settings) -> None:
+    def __init__(self, settings: "dynaconf.base.Settings") -> None:
         self.settings = settings
 
     def build(self) -> AppConfig:
@@ -96,10 +322,26 @@ class DynaConfConfigBuilder:
 
         return AppConfig(
             docs_url=self.settings.FASE.docs_url,
+            response_class=self.settings.FASE.get("response_class", "auto"),
+            hot_reload_interval=self.settings.FASE.get("hot_reload_interval", None),
             db=db_config,
             db_type=db_type,
             uvicorn=self.uvicorn_from_settings(),
             cors=self.cors_from_settings(),
+            rate_limit=self.rate_limit_from_settings(),
+            metrics=self.metrics_from_settings(),
+            audit=self.audit_from_settings(),
+            compression=self.compression_from_settings(),
+            logging=self.logging_from_settings(),
+            concurrency=self.concurrency_from_settings(),
+            profiling=self.profiling_from_settings(),
+            diagnostics=self.diagnostics_from_settings(),
+            loop_monitor=self.loop_monitor_from_settings(),
+            scheduler=self.scheduler_from_settings(),
+            job_queue=self.job_queue_from_settings(),
+            idempotency=self.idempotency_from_settings(),
+            coalescing=self.coalescing_from_settings(),
+            tracing=self.tracing_from_settings(),
         )
 
     def db_postgres_from_config(self) -> PostgresConfig:
@@ -130,20 +372,282 @@ class DynaConfConfigBuilder:
     def uvicorn_from_settings(self) -> UvicornConfig | None:
         if "UVICORN" not in self.settings.keys():
             return None
+        settings = self.settings.UVICORN
         return UvicornConfig(
-            host=self.settings.UVICORN.host,
-            port=self.settings.UVICORN.port,
+            host=settings.host,
+            port=settings.port,
+            app=settings.get("app", None),
+            workers=settings.get("workers", 1),
+            loop=settings.get("loop", "auto"),
+            http=settings.get("http", "auto"),
+            backlog=settings.get("backlog", 2048),
+            timeout_keep_alive=settings.get("timeout_keep_alive", 5),
+            limit_concurrency=settings.get("limit_concurrency", None),
+        )
+
+    @staticmethod
+    def rate_limit_rule(settings) -> RateLimitRule:
+        return RateLimitRule(
+            requests=settings.requests,
+            period=settings.period,
+            key=settings.get("key", "ip"),
+        )
+
+    def rate_limit_from_settings(self) -> RateLimitConfig | None:
+        if "RATE_LIMIT" not in self.settings.keys():
+            return None
+        settings = self.settings.RATE_LIMIT
+        return RateLimitConfig(
+            default=self.rate_limit_rule(settings) if "requests" in settings else None,
+            paths={
+                path: self.rate_limit_rule(rule)
+                for path, rule in settings.get("paths", {}).items()
+            },
+            compact_interval=settings.get("compact_interval", 60),
+            trusted_proxies=list(settings.get("trusted_proxies", [])),
+        )
+
+    def metrics_from_settings(self) -> MetricsConfig | None:
+        if "METRICS" not in self.settings.keys():
+            return None
+        return MetricsConfig(
+            path=self.settings.METRICS.get("path", "/metrics"),
+            max_series=self.settings.METRICS.get("max_series", 1000),
+            buckets=self.settings.METRICS.get("buckets", None),
+        )
+
+    def audit_from_settings(self) -> AuditConfig | None:
+        if "AUDIT" not in self.settings.keys():
+            return None
+        settings = self.settings.AUDIT
+        return AuditConfig(
+            queue_size=settings.get("queue_size", 10000),
+            batch_size=settings.get("batch_size", 500),
+            flush_interval=settings.get("flush_interval", 1),
+            overflow=settings.get("overflow", "drop"),
+            spill_path=settings.get("spill_path", None),
+            methods=settings.get("methods", None),
+        )
+
+    def compression_from_settings(self) -> CompressionConfig | None:
+        if "COMPRESSION" not in self.settings.keys():
+            return None
+        settings = self.settings.COMPRESSION
+        default = CompressionConfig()
+        return CompressionConfig(
+            minimum_size=settings.get("minimum_size", default.minimum_size),
+            algorithms=settings.get("algorithms", default.algorithms),
+            content_types=settings.get("content_types", default.content_types),
+            levels=dict(settings.get("levels", {})),
+        )
+
+    def logging_from_settings(self) -> LoggingConfig | None:
+        if "LOGGING" not in self.settings.keys():
+            return None
+        return LoggingConfig(
+            level=self.settings.LOGGING.get("level", "INFO"),
+            path=self.settings.LOGGING.get("path", "/tmp"),
+            queue_size=self.settings.LOGGING.get("queue_size", None),
+            overflow=self.settings.LOGGING.get("overflow", "drop"),
+            format=self.settings.LOGGING.get("format", "text"),
+            filters=self.logging_filters_from_settings(),
+        )
+
+    def logging_filters_from_settings(self) -> LoggingFilterConfig | None:
+        settings = self.settings.LOGGING.get("filters", None)
+        if settings is None:
+            return None
+        return LoggingFilterConfig(
+            rate_limit=settings.get("rate_limit", None),
+            rate_limit_period=settings.get("rate_limit_period", 1),
+            sampling={
+                str(level).upper(): rate
+                for level, rate in settings.get("sampling", {}).items()
+            },
+            dedup_window=settings.get("dedup_window", None),
+        )
+
+    @staticmethod
+    def concurrency_limit(settings) -> ConcurrencyLimit:
+        default = ConcurrencyLimit()
+        return ConcurrencyLimit(
+            **{
+                limit_field.name: settings.get(
+                    limit_field.name, getattr(default, limit_field.name)
+                )
+                for limit_field in dataclasses.fields(ConcurrencyLimit)
+            }
+        )
+
+    def concurrency_from_settings(self) -> ConcurrencyConfig | None:
+        if "CONCURRENCY" not in self.settings.keys():
+            return None
+        settings = self.settings.CONCURRENCY
+        limit_fields = {limit_field.name for limit_field in dataclasses.fields(ConcurrencyLimit)}
+        return ConcurrencyConfig(
+            default=(
+                self.concurrency_limit(settings)
+                if limit_fields & {key.lower() for key in settings.keys()}
+                else None
+            ),
+            paths={
+                path: self.concurrency_limit(limit)
+                for path, limit in settings.get("paths", {}).items()
+            },
+            cancel_on_disconnect=settings.get("cancel_on_disconnect", True),
+            timeout_header=settings.get("timeout_header", "X-Request-Timeout"),
+        )
+
+    def profiling_from_settings(self) -> ProfilingConfig | None:
+        if "PROFILING" not in self.settings.keys():
+            return None
+        settings = self.settings.PROFILING
+        default = ProfilingConfig()
+        return ProfilingConfig(
+            token=settings.get("token", None),
+            sample_rate=settings.get("sample_rate", 0),
+            header=settings.get("header", default.header),
+            output_dir=settings.get("output_dir", default.output_dir),
+            max_files=settings.get("max_files", default.max_files),
+            max_concurrent=settings.get("max_concurrent", 1),
+            interval=settings.get("interval", default.interval),
+        )
+
+    def diagnostics_from_settings(self) -> DiagnosticsConfig | None:
+        if "DIAGNOSTICS" not in self.settings.keys():
+            return None
+        return DiagnosticsConfig(
+            token=self.settings.DIAGNOSTICS.token,
+            prefix=self.settings.DIAGNOSTICS.get("prefix", "/_fase/diagnostics"),
+        )
+
+    def loop_monitor_from_settings(self) -> LoopMonitorConfig | None:
+        if "LOOP_MONITOR" not in self.settings.keys():
+            return None
+        settings = self.settings.LOOP_MONITOR
+        default = LoopMonitorConfig()
+        return LoopMonitorConfig(
+            interval=settings.get("interval", default.interval),
+            threshold=settings.get("threshold", default.threshold),
+            strict_ms=settings.get("strict_ms", None),
+        )
+
+    def scheduler_from_settings(self) -> SchedulerConfig | None:
+        if "SCHEDULER" not in self.settings.keys():
+            return None
+        settings = self.settings.SCHEDULER
+        default = SchedulerConfig()
+        return SchedulerConfig(
+            thread_workers=settings.get("thread_workers", default.thread_workers),
+            process_workers=settings.get("process_workers", default.process_workers),
+            pool_size=settings.get("pool_size", default.pool_size),
+            max_overflow=settings.get("max_overflow", default.max_overflow),
+            shutdown_timeout=settings.get("shutdown_timeout", default.shutdown_timeout),
         )
 
+    def job_queue_from_settings(self) -> JobQueueConfig | None:
+        if "JOB_QUEUE" not in self.settings.keys():
+            return None
+        settings = self.settings.JOB_QUEUE
+        default = JobQueueConfig()
+        return JobQueueConfig(
+            **{
+                name: settings.get(name, getattr(default, name))
+                for name in (
+                    "queue",
+                    "batch_size",
+                    "concurrency",
+                    "poll_interval",
+                    "visibility_timeout",
+                    "backoff_base",
+                    "backoff_max",
+                    "shutdown_timeout",
+                )
+            }
+        )
+
+    def idempotency_from_settings(self) -> IdempotencyConfig | None:
+        if "IDEMPOTENCY" not in self.settings.keys():
+            return None
+        settings = self.settings.IDEMPOTENCY
+        default = IdempotencyConfig()
+        return IdempotencyConfig(
+            header=settings.get("header", default.header),
+            methods=list(settings.get("methods", default.methods)),
+            ttl=settings.get("ttl", default.ttl),
+            max_entries=settings.get("max_entries", default.max_entries),
+            max_bytes=settings.get("max_bytes", default.max_bytes),
+            max_body_size=settings.get("max_body_size", default.max_body_size),
+            max_request_size=settings.get("max_request_size", default.max_request_size),
+            wait_timeout=settings.get("wait_timeout", default.wait_timeout),
+        )
+
+    def coalescing_from_settings(self) -> CoalescingConfig | None:
+        if "COALESCING" not in self.settings.keys():
+            return None
+        settings = self.settings.COALESCING
+        default = CoalescingConfig()
+        return CoalescingConfig(
+            paths=list(settings.get("paths", [])),
+            scope=settings.get("scope", default.scope),
+            max_wait=settings.get("max_wait", default.max_wait),
+            max_body_size=settings.get("max_body_size", default.max_body_size),
+        )
+
+    def tracing_from_settings(self) -> TracingConfig | None:
+        if "TRACING" not in self.settings.keys():
+            return None
+        settings = self.settings.TRACING
+        default = TracingConfig()
+        return TracingConfig(
+            **{
+                name: settings.get(name, getattr(default, name))
+                for name in (
+                    "sample_rate",
+                    "exporter",
+                    "path",
+                    "endpoint",
+                    "service_name",
+                    "queue_size",
+                    "record_db",
+                )
+            }
+        )
+
+
+def local_filename(path: str) -> str:
+    """
+    `settings.local.toml` of `settings.toml`, dynaconf loads it over the file when it exists
+    """
+    directory, name = os.path.split(path)
+    base, _, extension = name.rpartition(".")
+    return os.path.join(directory, f"{base}.local.{extension}")
+
 
 class TomlFileDynaConfConfigBuilder:
     def __init__(self, paths: list[str]) -> None:
         self.paths = paths
+        # settings files dynaconf read in the last build
+        self.loaded_files: list[str] = []
 
     def build(self) -> AppConfig:
-        return DynaConfConfigBuilder(self.from_toml(self.paths)).build()
+        settings = self.from_toml(self.paths)
+        app_config = DynaConfConfigBuilder(settings).build()
+        self.loaded_files = list(settings._loaded_files)
+        return app_config
+
+    def watched_files(self) -> list[str]:
+        """
+        Files that change the built config when they are edited, created or removed
+        """
+        files = [os.path.abspath(path) for path in [*self.paths, *self.loaded_files]]
+        files += [local_filename(path) for path in files if ".local." not in path]
+        return list(dict.fromkeys([*files, os.path.abspath(".env")]))
+
+    def from_toml(self, paths: list[str]) -> "dynaconf.base.Settings":
+        # imported here so modules that only need config classes don't pay for dynaconf
+        import dynaconf
 
-    def from_toml(self, paths: list[str]) -> dynaconf.base.Settings:
         return dynaconf.Dynaconf(
             settings_files=paths,
             environments=True,
@@ -151,3 +655,93 @@ class TomlFileDynaConfConfigBuilder:
             load_dotenv=True,
             auto_cast=True,
         )
+
+
+def to_builtin(value: Any) -> Any:
+    """
+    Replaces dynaconf boxes with dict and list so config can be pickled
+    and unpickled without importing dynaconf
+    """
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.replace(
+            value,
+            **{
+                config_field.name: to_builtin(getattr(value, config_field.name))
+                for config_field in dataclasses.fields(value)
+                if config_field.init
+            },
+        )
+    if isinstance(value, dict):
+        return {str(key): to_builtin(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_builtin(item) for item in value]
+    return value
+
+
+def hash_files(digest: "hashlib._Hash", paths: list[str]) -> None:
+    for path in paths:
+        digest.update(path.encode())
+        try:
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        except FileNotFoundError:
+            digest.update(b"\0")
+
+
+class CachedTomlConfigBuilder(TomlFileDynaConfConfigBuilder):
+    """
+    Stores built config in `cache_dir` keyed by hash of every input of dynaconf
+    (settings files and their `.local.` files, `.env` and `DYNACONF_` environment
+    variables), a hit skips importing and running dynaconf. Files dynaconf found
+    elsewhere are stored with the config and checked on a hit.
+    """
+
+    ENV_PREFIXES = ("DYNACONF_", "ENV_FOR_DYNACONF")
+
+    def __init__(self, paths: list[str], cache_dir: str = ".fase_cache") -> None:
+        super().__init__(paths)
+        self.cache_dir = cache_dir
+
+    def cache_key(self) -> str:
+        digest = hashlib.sha256()
+        # config classes are part of the key, a cache written by another version is ignored
+        hash_files(digest, [__file__, *self.watched_files()])
+        for key, value in sorted(os.environ.items()):
+            if key.startswith(self.ENV_PREFIXES):
+                digest.update(f"{key}={value}".encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def loaded_digest(loaded_files: list[str]) -> str:
+        digest = hashlib.sha256()
+        hash_files(digest, loaded_files)
+        return digest.hexdigest()
+
+    def build(self) -> AppConfig:
+        cache_path = os.path.join(self.cache_dir, f"{self.cache_key()}.pickle")
+        try:
+            with open(cache_path, "rb") as f:
+                loaded_files, loaded_digest, app_config = pickle.load(f)
+            if self.loaded_digest(loaded_files) == loaded_digest:
+                self.loaded_files = loaded_files
+                return app_config
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+            pass
+        app_config = to_builtin(super().build())
+        self.write(
+            cache_path,
+            (self.loaded_files, self.loaded_digest(self.loaded_files), app_config),
+        )
+        return app_config
+
+    def write(self, cache_path: str, entry: tuple) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # write then rename so other workers never read a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(entry, f)
+            os.replace(tmp_path, cache_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
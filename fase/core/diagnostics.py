@@ -0,0 +1,277 @@
+"""
+Memory diagnostics, protected by `X-Fase-Admin-Token` header.
+
+Usage:
+    fp.add_diagnostics(config.DiagnosticsConfig(token="..."))
+
+Every endpoint returns json, or a text report with `?format=text`.
+"""
+import collections
+import gc
+import itertools
+import logging as std_logging
+import secrets
+import tracemalloc
+from typing import Annotated, Any
+
+import fastapi
+from fastapi import responses
+from sqlalchemy import orm
+
+from fase.db import connection
+from fase.utils import cache, logging
+
+MAX_SNAPSHOTS = 10
+GROUP_BY = ("lineno", "filename", "traceback")
+
+snapshots: collections.OrderedDict[int, tracemalloc.Snapshot] = collections.OrderedDict()
+snapshot_ids = itertools.count(1)
+
+
+def start_tracemalloc(frames: int = 1) -> dict[str, Any]:
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    return tracemalloc_status()
+
+
+def stop_tracemalloc() -> dict[str, Any]:
+    tracemalloc.stop()
+    snapshots.clear()
+    return tracemalloc_status()
+
+
+def tracemalloc_status() -> dict[str, Any]:
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "tracing": tracemalloc.is_tracing(),
+        "current": current,
+        "peak": peak,
+        "snapshots": list(snapshots),
+    }
+
+
+def take_snapshot() -> dict[str, Any]:
+    if not tracemalloc.is_tracing():
+        raise ValueError("tracemalloc is not started")
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        (tracemalloc.Filter(False, tracemalloc.__file__),)
+    )
+    snapshot_id = next(snapshot_ids)
+    snapshots[snapshot_id] = snapshot
+    while len(snapshots) > MAX_SNAPSHOTS:
+        snapshots.popitem(last=False)
+    return {"id": snapshot_id, **tracemalloc_status()}
+
+
+def get_snapshot(snapshot_id: int) -> tracemalloc.Snapshot:
+    if snapshot_id not in snapshots:
+        raise KeyError(f"snapshot {snapshot_id} not found")
+    return snapshots[snapshot_id]
+
+
+def snapshot_stats(snapshot_id: int, group_by: str = "lineno", limit: int = 25) -> list[dict[str, Any]]:
+    return [
+        {
+            "trace": stat.traceback.format(),
+            "size": stat.size,
+            "count": stat.count,
+        }
+        for stat in get_snapshot(snapshot_id).statistics(group_by)[:limit]
+    ]
+
+
+def diff_snapshots(
+    first: int,
+    second: int,
+    group_by: str = "lineno",
+    limit: int = 25,
+) -> list[dict[str, Any]]:
+    stats = get_snapshot(second).compare_to(get_snapshot(first), group_by)
+    return [
+        {
+            "trace": stat.traceback.format(),
+            "size": stat.size,
+            "size_diff": stat.size_diff,
+            "count": stat.count,
+            "count_diff": stat.count_diff,
+        }
+        for stat in stats[:limit]
+    ]
+
+
+def gc_stats() -> dict[str, Any]:
+    return {
+        "counts": gc.get_count(),
+        "thresholds": gc.get_threshold(),
+        "generations": gc.get_stats(),
+        "garbage": len(gc.garbage),
+    }
+
+
+def type_counts(limit: int = 25) -> list[dict[str, Any]]:
+    counter = collections.Counter(
+        f"{type(obj).__module__}.{type(obj).__qualname__}" for obj in gc.get_objects()
+    )
+    return [{"type": name, "count": count} for name, count in counter.most_common(limit)]
+
+
+def orm_counts() -> dict[str, Any]:
+    models: collections.Counter[str] = collections.Counter()
+    sessions = 0
+    identity_map = 0
+    for obj in gc.get_objects():
+        if isinstance(obj, orm.DeclarativeBase):
+            models[type(obj).__qualname__] += 1
+        elif isinstance(obj, orm.Session):
+            sessions += 1
+            identity_map += len(obj.identity_map)
+    return {
+        "models": dict(models.most_common()),
+        "sessions": sessions,
+        "identity_map_size": identity_map,
+    }
+
+
+def fase_stats() -> dict[str, Any]:
+    caches = [
+        {"name": item.name or repr(item), "size": len(item), "ttl": item.ttl}
+        for item in list(cache.CACHES)
+    ]
+    pool = None
+    engine = connection.ConnectionConfigure.get_engine()
+    if engine is not None:
+        pool = {"status": engine.pool.status()}
+        for state in ("size", "checkedin", "checkedout", "overflow"):
+            value = getattr(engine.pool, state, None)
+            if callable(value):
+                pool[state] = value()
+    handlers = [
+        {"logger": name, "handlers": [repr(handler) for handler in logger.handlers]}
+        for name, logger in [("root", std_logging.getLogger())]
+        + [
+            (name, logger)
+            for name, logger in std_logging.Logger.manager.loggerDict.items()
+            if isinstance(logger, std_logging.Logger) and logger.handlers
+        ]
+    ]
+    return {
+        "caches": caches,
+        "db_pool": pool,
+        "logging": handlers,
+        "logging_queue": logging.queue_stats(),
+    }
+
+
+def to_text(value: Any, indent: int = 0) -> str:
+    prefix = "  " * indent
+    if isinstance(value, dict):
+        return "\n".join(
+            f"{prefix}{key}:\n{to_text(item, indent + 1)}"
+            if isinstance(item, (dict, list)) and item
+            else f"{prefix}{key}: {item}"
+            for key, item in value.items()
+        )
+    if isinstance(value, list):
+        return "\n".join(
+            f"{prefix}-\n{to_text(item, indent + 1)}"
+            if isinstance(item, dict)
+            else f"{prefix}- {item}"
+            for item in value
+        )
+    return f"{prefix}{value}"
+
+
+def respond(value: Any, format: str) -> Any:
+    if format == "text":
+        return responses.PlainTextResponse(to_text(value) + "\n")
+    return value
+
+
+def admin_token_dep(token: str):
+    def dependency(
+        x_fase_admin_token: Annotated[str | None, fastapi.Header()] = None,
+    ) -> None:
+        if x_fase_admin_token is None or not secrets.compare_digest(
+            x_fase_admin_token.encode(), token.encode()
+        ):
+            raise fastapi.HTTPException(status_code=fastapi.status.HTTP_403_FORBIDDEN)
+
+    return fastapi.Depends(dependency)
+
+
+def not_found(error: KeyError) -> fastapi.HTTPException:
+    return fastapi.HTTPException(status_code=404, detail=str(error))
+
+
+def conflict(error: ValueError) -> fastapi.HTTPException:
+    return fastapi.HTTPException(status_code=409, detail=str(error))
+
+
+router = fastapi.APIRouter()
+Format = Annotated[str, fastapi.Query(pattern="^(json|text)$")]
+GroupBy = Annotated[str, fastapi.Query(pattern=f"^({'|'.join(GROUP_BY)})$")]
+
+
+@router.post("/tracemalloc/start")
+def tracemalloc_start(frames: int = 1, format: Format = "json"):
+    return respond(start_tracemalloc(frames), format)
+
+
+@router.post("/tracemalloc/stop")
+def tracemalloc_stop(format: Format = "json"):
+    return respond(stop_tracemalloc(), format)
+
+
+@router.get("/tracemalloc")
+def tracemalloc_get(format: Format = "json"):
+    return respond(tracemalloc_status(), format)
+
+
+@router.post("/snapshots")
+def snapshot_take(format: Format = "json"):
+    try:
+        return respond(take_snapshot(), format)
+    except ValueError as error:
+        raise conflict(error)
+
+
+@router.get("/snapshots/{snapshot_id}")
+def snapshot_get(
+    snapshot_id: int,
+    group_by: GroupBy = "lineno",
+    limit: int = 25,
+    format: Format = "json",
+):
+    try:
+        return respond(snapshot_stats(snapshot_id, group_by, limit), format)
+    except KeyError as error:
+        raise not_found(error)
+
+
+@router.get("/snapshots/{first}/diff/{second}")
+def snapshot_diff(
+    first: int,
+    second: int,
+    group_by: GroupBy = "lineno",
+    limit: int = 25,
+    format: Format = "json",
+):
+    try:
+        return respond(diff_snapshots(first, second, group_by, limit), format)
+    except KeyError as error:
+        raise not_found(error)
+
+
+@router.get("/gc")
+def gc_get(format: Format = "json"):
+    return respond(gc_stats(), format)
+
+
+@router.get("/objects")
+def objects_get(limit: int = 25, format: Format = "json"):
+    return respond({"types": type_counts(limit), "orm": orm_counts()}, format)
+
+
+@router.get("/fase")
+def fase_get(format: Format = "json"):
+    return respond(fase_stats(), format)
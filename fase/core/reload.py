@@ -0,0 +1,91 @@
+"""
+Watches settings files and applies changes without restart where it's safe.
+"""
+import asyncio
+import contextlib
+import dataclasses
+import os
+from typing import Any, Callable
+
+from fase.core import config
+from fase.utils import logging
+
+logger = logging.get_logger("reload")
+
+
+def changed_settings(old: config.AppConfig, new: config.AppConfig) -> list[str]:
+    return [
+        config_field.name
+        for config_field in dataclasses.fields(old)
+        if getattr(old, config_field.name) != getattr(new, config_field.name)
+    ]
+
+
+class ConfigWatcher:
+    """
+    Polls modification time of `paths`, when one changes config is built again
+    and `apply` is called with new config and names of changed settings.
+    `apply` returns settings it couldn't apply, they are reported as needing a restart.
+    """
+
+    def __init__(
+        self,
+        paths: list[str],
+        current: config.AppConfig,
+        build: Callable[[], config.AppConfig],
+        apply: Callable[[config.AppConfig, list[str]], list[str]],
+        interval: float = 1,
+    ) -> None:
+        self.paths = paths
+        self.current = current
+        self.build = build
+        self.apply = apply
+        self.interval = interval
+        self.task: asyncio.Task | None = None
+
+    def stat(self) -> list[tuple[int, int] | None]:
+        stats: list[tuple[int, int] | None] = []
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+                stats.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                stats.append(None)
+        return stats
+
+    async def reload(self) -> None:
+        try:
+            new = await asyncio.to_thread(self.build)
+        except Exception:
+            logger.exception("failed to reload settings from %s", self.paths)
+            return
+        changed = changed_settings(self.current, new)
+        if not changed:
+            return
+        need_restart = self.apply(new, changed)
+        applied = [name for name in changed if name not in need_restart]
+        if applied:
+            logger.info("settings %s reloaded", applied)
+        if need_restart:
+            logger.warning("settings %s changed and need restart", need_restart)
+        self.current = new
+
+    async def run(self) -> None:
+        last = self.stat()
+        while True:
+            await asyncio.sleep(self.interval)
+            stat = self.stat()
+            if stat != last:
+                last = stat
+                await self.reload()
+
+    @contextlib.asynccontextmanager
+    async def lifespan(self, _app: Any):
+        self.task = asyncio.create_task(self.run())
+        try:
+            yield
+        finally:
+            self.task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.task
+            self.task = None
@@ -0,0 +1,76 @@
+"""
+Json responses backed by the fastest installed encoder.
+
+`orjson` and `msgspec` are optional, `json` is always available.
+"""
+import json
+from typing import Any, Callable, Type
+
+from fastapi import responses
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore[assignment]
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover
+    msgspec = None  # type: ignore[assignment]
+
+AUTO = "auto"
+ORJSON = "orjson"
+MSGSPEC = "msgspec"
+JSON = "json"
+
+
+def json_dumps(content: Any) -> bytes:
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def orjson_dumps(content: Any) -> bytes:
+    # same options as `ORJSONResponse`
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+# encoders of the response classes, by the same name
+DUMPS: dict[str, Callable[[Any], bytes]] = {JSON: json_dumps}
+if orjson is not None:
+    DUMPS[ORJSON] = orjson_dumps
+if msgspec is not None:
+    DUMPS[MSGSPEC] = msgspec.json.Encoder().encode
+
+
+class MsgspecJSONResponse(responses.JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return DUMPS[MSGSPEC](content)
+
+
+RESPONSE_CLASSES: dict[str, Type[responses.JSONResponse]] = {
+    ORJSON: responses.ORJSONResponse,
+    MSGSPEC: MsgspecJSONResponse,
+    JSON: responses.JSONResponse,
+}
+
+
+def get_encoder_name(name: str = AUTO) -> str:
+    if name == AUTO:
+        for name in (ORJSON, MSGSPEC, JSON):
+            if name in DUMPS:
+                return name
+    if name not in RESPONSE_CLASSES:
+        raise ValueError(f"unknown response class {name}")
+    if name not in DUMPS:
+        raise ValueError(f"{name} is not installed")
+    return name
+
+
+def get_response_class(name: str = AUTO) -> Type[responses.JSONResponse]:
+    return RESPONSE_CLASSES[get_encoder_name(name)]
+
@@ -0,0 +1,391 @@
+"""
+Background jobs owned by the app lifespan.
+
+Usage:
+    scheduler = fp.add_scheduler(config.SchedulerConfig(process_workers=2))
+
+    @scheduler.interval(60, jitter=5)
+    async def cleanup():
+        async with scheduler.session() as session:
+            ...
+
+    @scheduler.cron("0 3 * * *", executor=scheduler.PROCESS)
+    def rebuild_index():
+        ...
+
+    @app.post("/reports")
+    async def report(scheduler: scheduler.SchedulerDep):
+        scheduler.defer(build_report, 10, delay=1)
+"""
+import abc
+import asyncio
+import concurrent.futures
+import contextlib
+import dataclasses
+import functools
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Annotated, Any, Callable
+
+import fastapi
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from fase.core import config
+from fase.db import connection
+from fase.utils import logging
+
+ASYNC = "async"
+THREAD = "thread"
+PROCESS = "process"
+
+logger = logging.get_logger("scheduler")
+
+
+class Trigger(abc.ABC):
+    @abc.abstractmethod
+    def next_run(self, now: float) -> float | None:
+        """
+        Returns timestamp of the next run after `now`, None when there is none
+        """
+
+
+class Interval(Trigger):
+    def __init__(self, seconds: float, start_immediately: bool = False) -> None:
+        if seconds <= 0:
+            raise ValueError("interval must be positive")
+        self.seconds = seconds
+        self.start_immediately = start_immediately
+        self.started = False
+
+    def next_run(self, now: float) -> float:
+        if not self.started:
+            self.started = True
+            if self.start_immediately:
+                return now
+        return now + self.seconds
+
+
+class Once(Trigger):
+    def __init__(self, delay: float = 0) -> None:
+        self.delay = delay
+        self.done = False
+
+    def next_run(self, now: float) -> float | None:
+        if self.done:
+            return None
+        self.done = True
+        return now + self.delay
+
+
+class Cron(Trigger):
+    """
+    Five field cron expression: minute hour day-of-month month day-of-week, in local time.
+    Fields accept `*`, `a`, `a-b`, `*/n`, `a-b/n` and comma separated lists of them.
+    """
+
+    RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression: str) -> None:
+        self.expression = expression
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron expression {expression!r} must have 5 fields")
+        (
+            self.minutes,
+            self.hours,
+            self.days,
+            self.months,
+            weekdays,
+        ) = (
+            self.parse_field(field, low, high)
+            for field, (low, high) in zip(fields, self.RANGES)
+        )
+        # 0 and 7 are both sunday
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def parse_field(field: str, low: int, high: int) -> set[int]:
+        values: set[int] = set()
+        for part in field.split(","):
+            value_range, _, step = part.partition("/")
+            if value_range == "*":
+                start, end = low, high
+            elif "-" in value_range:
+                start, end = (int(value) for value in value_range.split("-", 1))
+            else:
+                start = end = int(value_range)
+                if step:
+                    end = high
+            if start < low or end > high or start > end:
+                raise ValueError(f"cron field {field!r} is out of range {low}-{high}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        # python weekday is 0 for monday, cron is 0 for sunday
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_run(self, now: float) -> float:
+        moment = datetime.fromtimestamp(now).replace(second=0, microsecond=0)
+        moment += timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self.day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment.timestamp()
+        raise ValueError(f"cron expression {self.expression!r} never matches")
+
+
+@dataclasses.dataclass
+class Job:
+    name: str
+    func: Callable[..., Any]
+    trigger: Trigger
+    executor: str = ASYNC
+    max_instances: int = 1
+    jitter: float = 0
+    args: tuple = ()
+    kwargs: dict[str, Any] = dataclasses.field(default_factory=dict)
+    running: int = 0
+    task: asyncio.Task | None = None
+
+
+class Scheduler:
+    ASYNC = ASYNC
+    THREAD = THREAD
+    PROCESS = PROCESS
+
+    def __init__(
+        self,
+        scheduler_config: config.SchedulerConfig | None = None,
+        db_config: config.DBConfig | str | None = None,
+    ) -> None:
+        self.config = scheduler_config or config.SchedulerConfig()
+        self.db_config = db_config
+        self.jobs: dict[str, Job] = {}
+        self.runs: set[asyncio.Task] = set()
+        self.deferred: dict[str, asyncio.Semaphore] = {}
+        self.engine: AsyncEngine | None = None
+        self.thread_pool: concurrent.futures.ThreadPoolExecutor | None = None
+        self.process_pool: concurrent.futures.ProcessPoolExecutor | None = None
+        self.started = False
+
+    def check_executor(self, executor: str) -> None:
+        if executor not in (ASYNC, THREAD, PROCESS):
+            raise ValueError(f"unknown executor {executor}")
+        if executor == PROCESS and not self.config.process_workers:
+            # default executor of the loop would run it in a thread
+            raise ValueError("process executor needs process_workers of scheduler config")
+
+    def add_job(
+        self,
+        func: Callable[..., Any],
+        trigger: Trigger,
+        name: str | None = None,
+        executor: str = ASYNC,
+        max_instances: int = 1,
+        jitter: float = 0,
+        args: tuple = (),
+        kwargs: dict[str, Any] | None = None,
+    ) -> Job:
+        self.check_executor(executor)
+        name = name or f"{func.__module__}.{func.__qualname__}"
+        if name in self.jobs:
+            raise ValueError(f"job {name} is already added")
+        job = Job(
+            name=name,
+            func=func,
+            trigger=trigger,
+            executor=executor,
+            max_instances=max_instances,
+            jitter=jitter,
+            args=args,
+            kwargs=kwargs or {},
+        )
+        self.jobs[name] = job
+        if self.started:
+            job.task = asyncio.create_task(self.schedule(job))
+        return job
+
+    def interval(self, seconds: float, start_immediately: bool = False, **kwargs):
+        def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+            self.add_job(func, Interval(seconds, start_immediately), **kwargs)
+            return func
+
+        return decorator
+
+    def cron(self, expression: str, **kwargs):
+        def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+            self.add_job(func, Cron(expression), **kwargs)
+            return func
+
+        return decorator
+
+    def defer(
+        self,
+        func: Callable[..., Any],
+        *args: Any,
+        delay: float = 0,
+        executor: str = ASYNC,
+        max_instances: int | None = None,
+        **kwargs: Any,
+    ) -> asyncio.Task:
+        """
+        Runs `func` once after `delay` seconds, runs of the same function over
+        `max_instances` wait for a free slot
+        """
+        if not self.started:
+            raise RuntimeError("scheduler is not running")
+        self.check_executor(executor)
+        name = f"{func.__module__}.{func.__qualname__}"
+        semaphore = None
+        if max_instances is not None:
+            semaphore = self.deferred.setdefault(name, asyncio.Semaphore(max_instances))
+
+        async def run() -> Any:
+            if delay:
+                await asyncio.sleep(delay)
+            async with semaphore or contextlib.nullcontext():
+                return await self.call(executor, func, args, kwargs)
+
+        task = asyncio.create_task(run(), name=name)
+        self.track(task, name)
+        return task
+
+    def track(self, task: asyncio.Task, name: str) -> None:
+        self.runs.add(task)
+
+        def done(task: asyncio.Task) -> None:
+            self.runs.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                logger.error("job %s failed", name, exc_info=task.exception())
+
+        task.add_done_callback(done)
+
+    async def call(
+        self,
+        executor: str,
+        func: Callable[..., Any],
+        args: tuple,
+        kwargs: dict[str, Any],
+    ) -> Any:
+        if executor == ASYNC:
+            return await func(*args, **kwargs)
+        pool = self.thread_pool if executor == THREAD else self.process_pool
+        return await asyncio.get_running_loop().run_in_executor(
+            pool, functools.partial(func, *args, **kwargs)
+        )
+
+    async def run_job(self, job: Job) -> None:
+        job.running += 1
+        try:
+            await self.call(job.executor, job.func, job.args, job.kwargs)
+        finally:
+            job.running -= 1
+
+    async def schedule(self, job: Job) -> None:
+        next_run = job.trigger.next_run(time.time())
+        while next_run is not None:
+            if job.jitter:
+                next_run += random.uniform(0, job.jitter)
+            await asyncio.sleep(max(0.0, next_run - time.time()))
+            if job.running >= job.max_instances:
+                logger.warning(
+                    "job %s skipped, %s instances are running", job.name, job.running
+                )
+            else:
+                self.track(asyncio.create_task(self.run_job(job), name=job.name), job.name)
+            next_run = job.trigger.next_run(time.time())
+
+    @contextlib.asynccontextmanager
+    async def session(self):
+        """
+        Session from the scheduler's own pool, so jobs don't use up connections of requests
+        """
+        async with connection.session(bind=self.engine) as db_session:
+            yield db_session
+
+    def create_engine(self) -> AsyncEngine | None:
+        db_config = self.db_config
+        if db_config is None:
+            return None
+        if isinstance(db_config, config.PostgresConfig):
+            db_config = dataclasses.replace(
+                db_config,
+                pool_size=self.config.pool_size,
+                max_overflow=self.config.max_overflow,
+            )
+        return connection.ConnectionConfigure(db_config).create_engine()
+
+    async def start(self) -> None:
+        self.engine = self.create_engine()
+        self.thread_pool = concurrent.futures.ThreadPoolExecutor(
+            self.config.thread_workers, thread_name_prefix="fase-scheduler"
+        )
+        if self.config.process_workers:
+            self.process_pool = concurrent.futures.ProcessPoolExecutor(
+                self.config.process_workers
+            )
+        self.started = True
+        for job in self.jobs.values():
+            job.task = asyncio.create_task(self.schedule(job))
+
+    async def stop(self) -> None:
+        """
+        Stops scheduling, gives running jobs `shutdown_timeout` seconds to finish
+        and cancels the rest. Jobs already running in a pool can't be cancelled,
+        their results are dropped.
+        """
+        self.started = False
+        for job in self.jobs.values():
+            if job.task is not None:
+                job.task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await job.task
+                job.task = None
+        if self.runs:
+            _, pending = await asyncio.wait(
+                set(self.runs), timeout=self.config.shutdown_timeout
+            )
+            for task in pending:
+                logger.warning("job %s cancelled on shutdown", task.get_name())
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+        for pool in (self.thread_pool, self.process_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self.thread_pool = self.process_pool = None
+        self.deferred.clear()
+        if self.engine is not None:
+            await self.engine.dispose()
+            self.engine = None
+
+    @contextlib.asynccontextmanager
+    async def lifespan(self, _app: Any):
+        await self.start()
+        try:
+            yield {"scheduler": self}
+        finally:
+            await self.stop()
+
+
+def get_scheduler(request: fastapi.Request) -> Scheduler:
+    return request.state.scheduler
+
+
+SchedulerDep = Annotated[Scheduler, fastapi.Depends(get_scheduler)]
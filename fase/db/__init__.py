@@ -1,6 +1,30 @@
-from fase.db import base, connection, repository
-from fase.db.base import Base, TimeStamp, ClassNameAsTableName
-from fase.db.connection import session
-from fase.db.repository import Repository
-from fase.db.sync_repository import SyncRepository
-from fase.db import deps
+from typing import TYPE_CHECKING
+
+from fase.utils import lazy
+
+if TYPE_CHECKING:
+    from fase.db import base, connection, crud, deps, repository
+    from fase.db.base import Base, ClassNameAsTableName, TimeStamp, UUIDv7PrimaryKey
+    from fase.db.connection import session
+    from fase.db.crud import crud_router
+    from fase.db.repository import Repository
+    from fase.db.sync_repository import SyncRepository
+
+__getattr__, __dir__ = lazy.attributes(
+    __name__,
+    {
+        "base": ("fase.db.base", None),
+        "connection": ("fase.db.connection", None),
+        "repository": ("fase.db.repository", None),
+        "deps": ("fase.db.deps", None),
+        "crud": ("fase.db.crud", None),
+        "Base": ("fase.db.base", "Base"),
+        "TimeStamp": ("fase.db.base", "TimeStamp"),
+        "ClassNameAsTableName": ("fase.db.base", "ClassNameAsTableName"),
+        "UUIDv7PrimaryKey": ("fase.db.base", "UUIDv7PrimaryKey"),
+        "session": ("fase.db.connection", "session"),
+        "crud_router": ("fase.db.crud", "crud_router"),
+        "Repository": ("fase.db.repository", "Repository"),
+        "SyncRepository": ("fase.db.sync_repository", "SyncRepository"),
+    },
+)
@@ -1,3 +1,4 @@
+import uuid
 from datetime import datetime
 from typing import ForwardRef
 
@@ -5,6 +6,8 @@ import sqlalchemy
 from sqlalchemy import orm
 from sqlalchemy import sql
 
+from fase.utils import uuid7
+
 
 class Base(orm.DeclarativeBase):
     pass
@@ -30,3 +33,19 @@ class ClassNameAsTableName:
     @orm.declared_attr.directive
     def __tablename__(cls) -> str:
         return cls.__name__.lower()  # type: ignore
+
+
+@orm.declarative_mixin
+class UUIDv7PrimaryKey:
+    """
+    `id` primary key with time ordered UUIDv7 values made by the application,
+    stored in a native UUID column on postgres
+    """
+
+    id: orm.Mapped[uuid.UUID] = orm.mapped_column(
+        sqlalchemy.UUID(), primary_key=True, default=uuid7.uuid7
+    )
+
+    @property
+    def id_time(self) -> datetime:
+        return uuid7.timestamp(self.id)
@@ -5,6 +5,7 @@ from typing import Generator
 import sqlalchemy
 
 from fase.core import config
+from fase.utils import deadline
 from sqlalchemy import Engine, exc
 from sqlalchemy.ext.asyncio import (
     async_sessionmaker,
@@ -22,6 +23,19 @@ async_session_maker = async_sessionmaker(
 )
 
 
+@sqlalchemy.event.listens_for(Session, "after_begin")
+def set_statement_timeout(_session: Session, _transaction, connection) -> None:
+    """
+    Limits statements of each transaction to what is left of request deadline
+    """
+    remaining = deadline.remaining()
+    if remaining is None or connection.dialect.name != "postgresql":
+        return
+    connection.exec_driver_sql(
+        f"SET LOCAL statement_timeout = {max(1, int(remaining * 1000))}"
+    )
+
+
 @asynccontextmanager
 async def session(
     bind: AsyncEngine | None = None,
@@ -96,7 +110,7 @@ class ConnectionConfigure:
         )
 
     def set_engine(self, engine: AsyncEngine) -> None:
-        self.ENGINE = engine
+        ConnectionConfigure.__ENGINE = engine
         async_session_maker.configure(bind=engine)
 
     def create_and_set_engine(self) -> None:
@@ -126,7 +140,7 @@ class SyncConnectionConfigure:
         )
 
     def set_engine(self, engine: Engine) -> None:
-        self.ENGINE = engine
+        SyncConnectionConfigure.__ENGINE = engine
         sync_session_maker.configure(bind=engine)
 
     def create_and_set_engine(self) -> None:
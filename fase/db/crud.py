@@ -0,0 +1,394 @@
+"""
+Generated CRUD endpoints of a Repository.
+
+Usage:
+    class NoteRepository(db.Repository[Note]):
+        model_class = Note
+        profiles = {"detail": [orm.selectinload(Note.tags)], "list": [orm.selectinload(Note.tags)]}
+
+    class TagOut(pydantic.BaseModel):
+        value: str
+
+    class NoteOut(pydantic.BaseModel):
+        id: uuid.UUID
+        text: str
+        tags: list[TagOut]
+
+    router = crud.crud_router(NoteRepository, NoteOut)
+    fp.fast_app.include_router(router, prefix="/notes")
+
+Relationship fields of the response schema are read from loaded models, so they
+should be schemas of the related models. Create and update bodies only have
+columns: by default they are the response schema without relationships and
+generated primary keys.
+
+Endpoints, `{pk}` is primary key of the model:
+    GET    /               keyset paginated list, `{"items": [...], "next": cursor}`
+    GET    /{pk}
+    POST   /
+    PATCH  /{pk}
+    DELETE /{pk}
+    POST   /batch          inserts items with one executemany
+    POST   /batch/delete   deletes keys with one statement
+
+List is streamed from a server side cursor, pass `next` as `after` for the next
+page. With `fields` query parameter list and get select only those columns.
+
+Deletes and batch inserts are plain statements, ORM cascades and events don't run.
+"""
+import base64
+import contextlib
+import json
+from typing import Annotated, Any, AsyncIterator, Optional, Type
+
+import fastapi
+import pydantic
+import pydantic_core
+import sqlalchemy
+
+from fase.db import connection, deps, repository
+
+ENDPOINTS = ("list", "get", "create", "update", "delete", "batch_create", "batch_delete")
+
+
+def write_schema(
+    schema: Type[pydantic.BaseModel], exclude: set[str]
+) -> Type[pydantic.BaseModel]:
+    """
+    Copy of `schema` without `exclude` fields, for POST bodies
+    """
+    return pydantic.create_model(  # type: ignore[call-overload]
+        f"{schema.__name__}Create",
+        **{
+            name: (field.annotation, field)
+            for name, field in schema.model_fields.items()
+            if name not in exclude
+        },
+    )
+
+
+def is_generated(column: Any) -> bool:
+    """
+    Whether value of a primary key column is made when it's not given
+    """
+    return (
+        column.default is not None
+        or column.server_default is not None
+        or column is column.table._autoincrement_column
+    )
+
+
+def partial_schema(
+    schema: Type[pydantic.BaseModel], exclude: set[str]
+) -> Type[pydantic.BaseModel]:
+    """
+    Copy of `schema` without `exclude` fields and with every field optional, for PATCH bodies
+    """
+    return pydantic.create_model(  # type: ignore[call-overload]
+        f"{schema.__name__}Update",
+        **{
+            name: (Optional[field.annotation], None)
+            for name, field in schema.model_fields.items()
+            if name not in exclude
+        },
+    )
+
+
+def python_type(column: Any) -> Any:
+    try:
+        return column.type.python_type
+    except NotImplementedError:
+        return Any
+
+
+class Cursor:
+    """
+    Opaque keyset cursor, values of order columns of the last row of a page
+    """
+
+    def __init__(self, order_by: list) -> None:
+        self.order_by = order_by
+        self.adapters = [pydantic.TypeAdapter(python_type(column)) for column in order_by]
+
+    def encode(self, key: tuple) -> str:
+        return base64.urlsafe_b64encode(pydantic_core.to_json(key)).decode()
+
+    def decode(self, cursor: str) -> tuple:
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if not isinstance(values, list) or len(values) != len(self.adapters):
+                raise ValueError("wrong number of values")
+            return tuple(
+                adapter.validate_python(value)
+                for adapter, value in zip(self.adapters, values)
+            )
+        except ValueError as error:
+            raise fastapi.HTTPException(
+                status_code=fastapi.status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"invalid cursor: {error}",
+            )
+
+
+def crud_router(
+    repository_class: Type[repository.Repository],
+    schema: Type[pydantic.BaseModel],
+    create_schema: Type[pydantic.BaseModel] | None = None,
+    update_schema: Type[pydantic.BaseModel] | None = None,
+    list_profile: str | None = None,
+    detail_profile: str | None = None,
+    order_by: str | None = None,
+    page_size: int = 50,
+    max_page_size: int = 1000,
+    batch_size: int = 1000,
+    chunk_size: int = 500,
+    endpoints: tuple[str, ...] = ENDPOINTS,
+    **router_kwargs: Any,
+) -> fastapi.APIRouter:
+    """
+    `schema` is the response of every endpoint, its fields are read from model attributes.
+    `create_schema` defaults to `schema` without relationship and generated primary key
+    fields, and `update_schema` to an all-optional copy of it without the primary key.
+    Models are loaded with `list_profile` and `detail_profile` loading profiles of the
+    repository, "list" and "detail" by default.
+    List is ordered by `order_by` column then primary key.
+    """
+    model: Any = repository_class.model_class
+    if model is None:
+        raise TypeError("model_class of repository should be set")
+    primary_key = sqlalchemy.inspect(model).primary_key
+    if len(primary_key) != 1:
+        raise ValueError(f"{model.__name__} should have exactly one primary key column")
+    pk_name = primary_key[0].key
+    pk_column = getattr(model, pk_name)
+    pk_type = python_type(primary_key[0])
+    relationships = set(sqlalchemy.inspect(model).relationships.keys())
+    if create_schema is None:
+        generated = {column.key for column in primary_key if is_generated(column)}
+        create_schema = write_schema(schema, relationships | generated)
+    update_schema = update_schema or partial_schema(create_schema, {pk_name})
+    for body_schema in (create_schema, update_schema):
+        nested = relationships.intersection(body_schema.model_fields)
+        if nested:
+            raise TypeError(
+                f"{body_schema.__name__} has relationship fields {sorted(nested)}, "
+                "only columns can be written"
+            )
+    order_columns = [getattr(model, order_by), pk_column] if order_by else [pk_column]
+    cursor = Cursor(order_columns)
+    column_names = set(sqlalchemy.inspect(model).column_attrs.keys())
+    # fields that can be selected without loading the model
+    selectable = [name for name in schema.model_fields if name in column_names]
+    items_adapter = pydantic.TypeAdapter(list[schema])  # type: ignore[valid-type]
+    page_schema = pydantic.create_model(  # type: ignore[call-overload]
+        f"{schema.__name__}Page", items=(list[schema], ...), next=(Optional[str], None)  # type: ignore[valid-type]
+    )
+    router = fastapi.APIRouter(**router_kwargs)
+
+    def get_columns(fields: str | None) -> list | None:
+        if fields is None:
+            return None
+        names = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = [name for name in names if name not in selectable]
+        if unknown or not names:
+            raise fastapi.HTTPException(
+                status_code=fastapi.status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"fields should be some of {selectable}, unknown {unknown}",
+            )
+        return [getattr(model, name) for name in names]
+
+    def dump_items(chunk: Any, columns: list | None) -> bytes:
+        if columns is None:
+            return items_adapter.dump_json(
+                items_adapter.validate_python(chunk, from_attributes=True)
+            )
+        return pydantic_core.to_json(
+            [{column.key: row[column.key] for column in columns} for row in chunk]
+        )
+
+    def json_response(content: bytes, status_code: int = 200) -> fastapi.Response:
+        return fastapi.Response(content, status_code=status_code, media_type="application/json")
+
+    async def reload(crud: repository.Repository, pk: Any) -> Any:
+        # values set by database and relationships are loaded again after writes
+        stmt = crud.statement(
+            where=[pk_column == pk],
+            load_profile=crud.pick_profile(detail_profile, repository.DETAIL),
+        )
+        result = await crud.session.execute(stmt.execution_options(populate_existing=True))
+        return result.scalars().one()
+
+    if "list" in endpoints:
+
+        @router.get("/", response_model=page_schema)
+        async def list_items(
+            after: str | None = None,
+            limit: Annotated[int, fastapi.Query(ge=1, le=max_page_size)] = page_size,
+            fields: str | None = None,
+        ) -> fastapi.Response:
+            columns = get_columns(fields)
+            key = cursor.decode(after) if after is not None else None
+            selected = None
+            if columns is not None:
+                # order columns are selected for the cursor, but not returned
+                names = {column.key for column in columns}
+                selected = columns + [
+                    column for column in order_columns if column.key not in names
+                ]
+
+            async def parts(crud: repository.Repository) -> AsyncIterator[bytes]:
+                prefix = b'{"items":['
+                count = 0
+                last = None
+                more = False
+                async for chunk in crud.stream(
+                    load_profile=list_profile,
+                    columns=selected,
+                    order_by=order_columns,
+                    after=key,
+                    # one more row tells if there is a next page
+                    limit=limit + 1,
+                    chunk_size=min(chunk_size, limit + 1),
+                ):
+                    if count + len(chunk) > limit:
+                        more = True
+                        chunk = chunk[: limit - count]
+                    if not chunk:
+                        continue
+                    yield prefix + (b"," if count else b"") + dump_items(chunk, columns)[1:-1]
+                    prefix = b""
+                    count += len(chunk)
+                    last = repository.key_of(chunk[-1], order_columns)
+                next_cursor = cursor.encode(last) if more and last is not None else None
+                yield prefix + b'],"next":' + pydantic_core.to_json(next_cursor) + b"}"
+
+            # own session, session of request is closed before response is streamed
+            stack = contextlib.AsyncExitStack()
+            session = await stack.enter_async_context(connection.session())
+            rest = parts(repository_class(session))
+
+            async def close(error: BaseException | None = None) -> None:
+                await rest.aclose()
+                if error is None:
+                    await stack.aclose()
+                else:
+                    # session is rolled back on database errors
+                    await stack.__aexit__(type(error), error, error.__traceback__)
+
+            try:
+                # errors of query and first chunk still get an error status
+                first = await rest.__anext__()
+            except BaseException as error:
+                await close(error)
+                raise
+
+            async def body() -> AsyncIterator[bytes]:
+                try:
+                    yield first
+                    async for part in rest:
+                        yield part
+                except BaseException as error:
+                    await close(error)
+                    raise
+                await close()
+
+            return fastapi.responses.StreamingResponse(body(), media_type="application/json")
+
+    if "get" in endpoints:
+
+        @router.get("/{pk}", response_model=schema)
+        async def get_item(
+            pk: pk_type, session: deps.Session, fields: str | None = None  # type: ignore[valid-type]
+        ) -> fastapi.Response:
+            columns = get_columns(fields)
+            crud = repository_class(session)
+            if columns is None:
+                row = await crud.read(where=[pk_column == pk], load_profile=detail_profile)
+            else:
+                result = await session.execute(
+                    crud.statement(columns=columns, where=[pk_column == pk])
+                )
+                row = result.mappings().one_or_none()
+            if row is None:
+                raise fastapi.HTTPException(status_code=fastapi.status.HTTP_404_NOT_FOUND)
+            return json_response(dump_items([row], columns)[1:-1])
+
+    if "create" in endpoints:
+
+        @router.post("/", response_model=schema, status_code=fastapi.status.HTTP_201_CREATED)
+        async def create_item(
+            item: create_schema, session: deps.Session  # type: ignore[valid-type]
+        ) -> fastapi.Response:
+            crud = repository_class(session)
+            created = crud.create(model(**item.model_dump()))
+            await session.flush()
+            created = await reload(crud, getattr(created, pk_name))
+            await crud.commit()
+            return json_response(
+                dump_items([created], None)[1:-1], fastapi.status.HTTP_201_CREATED
+            )
+
+    if "update" in endpoints:
+
+        @router.patch("/{pk}", response_model=schema)
+        async def update_item(
+            pk: pk_type, item: update_schema, session: deps.Session  # type: ignore[valid-type]
+        ) -> fastapi.Response:
+            crud = repository_class(session)
+            values = item.model_dump(exclude_unset=True)
+            if values:
+                result = await session.execute(
+                    sqlalchemy.update(model)
+                    .where(pk_column == pk)
+                    .values(**values)
+                    .execution_options(synchronize_session=False)
+                )
+                if result.rowcount == 0:  # type: ignore[attr-defined]
+                    raise fastapi.HTTPException(status_code=fastapi.status.HTTP_404_NOT_FOUND)
+                # custom update schema may change primary key
+                updated = await reload(crud, values.get(pk_name, pk))
+            else:
+                updated = await crud.read(where=[pk_column == pk], load_profile=detail_profile)
+                if updated is None:
+                    raise fastapi.HTTPException(status_code=fastapi.status.HTTP_404_NOT_FOUND)
+            await crud.commit()
+            return json_response(dump_items([updated], None)[1:-1])
+
+    if "delete" in endpoints:
+
+        @router.delete("/{pk}", status_code=fastapi.status.HTTP_204_NO_CONTENT)
+        async def delete_item(pk: pk_type, session: deps.Session) -> None:  # type: ignore[valid-type]
+            result = await session.execute(sqlalchemy.delete(model).where(pk_column == pk))
+            if result.rowcount == 0:  # type: ignore[attr-defined]
+                raise fastapi.HTTPException(status_code=fastapi.status.HTTP_404_NOT_FOUND)
+            await session.commit()
+
+    if "batch_create" in endpoints:
+
+        @router.post("/batch", status_code=fastapi.status.HTTP_201_CREATED)
+        async def create_items(
+            items: Annotated[list[create_schema], pydantic.Field(min_length=1, max_length=batch_size)],  # type: ignore[valid-type]
+            session: deps.Session,
+        ) -> list[pk_type]:  # type: ignore[valid-type]
+            crud = repository_class(session)
+            rows = await crud.bulk_insert(
+                [item.model_dump() for item in items], returning=[pk_column]
+            )
+            await crud.commit()
+            return [row[0] for row in rows or []]
+
+    if "batch_delete" in endpoints:
+
+        @router.post("/batch/delete")
+        async def delete_items(
+            pks: Annotated[list[pk_type], pydantic.Field(min_length=1, max_length=batch_size)],  # type: ignore[valid-type]
+            session: deps.Session,
+        ) -> int:
+            result = await session.execute(
+                sqlalchemy.delete(model)
+                .where(pk_column.in_(pks))
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+            return result.rowcount  # type: ignore[attr-defined]
+
+    return router
@@ -5,11 +5,14 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import orm as so
 
 from fase.db import connection
+from fase.utils import tracing
 
 
 async def session_dep():
-    async with connection.session() as session:
-        yield session
+    # not activated since the whole request runs while session is open
+    with tracing.span("db.session", activate=False):
+        async with connection.session() as session:
+            yield session
 
 
 def sync_session_dep():
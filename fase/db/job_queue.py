@@ -0,0 +1,357 @@
+"""
+Durable job queue on the app database, without a broker.
+
+Usage:
+    class Job(db.Base, job_queue.JobMixin):
+        __tablename__ = "job"
+
+    worker = fp.add_job_worker(Job)
+
+    @worker.handler()
+    async def send_email(payload: dict) -> None:
+        ...
+
+    @app.post("/signup")
+    async def signup(session: deps.Session):
+        session.add(user)
+        # committed or rolled back together with user
+        job_queue.enqueue(session, Job, "send_email", {"to": user.email})
+
+Workers claim batches with `SELECT ... FOR UPDATE SKIP LOCKED` on postgres. SQLite
+serializes writers so the same claim statement is atomic there, and a claim
+token is used when the driver can't return updated rows.
+
+A claimed job is visible again after `visibility_timeout` if its worker dies, so
+handlers should be idempotent and finish within the timeout.
+"""
+import asyncio
+import contextlib
+import random
+import secrets
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Type
+
+import sqlalchemy
+from sqlalchemy import orm
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import DeclarativeBase
+
+from fase.db import connection
+from fase.middlewares import metrics
+from fase.utils import logging
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+Handler = Callable[[Any], Awaitable[Any]]
+
+logger = logging.get_logger("job_queue")
+
+
+@orm.declarative_mixin
+class JobMixin:
+    id: orm.Mapped[int] = orm.mapped_column(
+        sqlalchemy.BigInteger().with_variant(sqlalchemy.Integer(), "sqlite"),
+        primary_key=True,
+        autoincrement=True,
+    )
+    queue: orm.Mapped[str] = orm.mapped_column(sqlalchemy.String(64), default="default")
+    name: orm.Mapped[str] = orm.mapped_column(sqlalchemy.String(255))
+    payload: orm.Mapped[Any] = orm.mapped_column(sqlalchemy.JSON(), nullable=True)
+    status: orm.Mapped[str] = orm.mapped_column(sqlalchemy.String(16), default=QUEUED)
+    attempts: orm.Mapped[int] = orm.mapped_column(sqlalchemy.Integer(), default=0)
+    max_attempts: orm.Mapped[int] = orm.mapped_column(sqlalchemy.Integer(), default=5)
+    # job can be claimed from this time
+    run_at: orm.Mapped[datetime] = orm.mapped_column(sqlalchemy.DateTime(timezone=True))
+    # claimed job is visible to other workers again after this time
+    locked_until: orm.Mapped[datetime | None] = orm.mapped_column(
+        sqlalchemy.DateTime(timezone=True)
+    )
+    locked_by: orm.Mapped[str | None] = orm.mapped_column(sqlalchemy.String(64))
+    last_error: orm.Mapped[str | None] = orm.mapped_column(sqlalchemy.Text())
+    created_at: orm.Mapped[datetime] = orm.mapped_column(sqlalchemy.DateTime(timezone=True))
+    finished_at: orm.Mapped[datetime | None] = orm.mapped_column(
+        sqlalchemy.DateTime(timezone=True)
+    )
+
+    @orm.declared_attr.directive
+    def __table_args__(cls):
+        return (
+            sqlalchemy.Index(f"ix_{cls.__tablename__}_claim", "queue", "status", "run_at"),  # type: ignore[attr-defined]
+        )
+
+
+def now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def as_utc(value: datetime) -> datetime:
+    # sqlite returns naive datetimes
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def enqueue(
+    session: AsyncSession,
+    model_class: Type[DeclarativeBase],
+    name: str,
+    payload: Any = None,
+    queue: str = "default",
+    delay: float = 0,
+    max_attempts: int = 5,
+) -> Any:
+    """
+    Adds a job to `session`, it's visible to workers when session is committed
+    """
+    created_at = now()
+    job = model_class(
+        queue=queue,
+        name=name,
+        payload=payload,
+        status=QUEUED,
+        attempts=0,
+        max_attempts=max_attempts,
+        run_at=created_at + timedelta(seconds=delay),
+        created_at=created_at,
+    )
+    session.add(job)
+    return job
+
+
+class JobWorker:
+    def __init__(
+        self,
+        model_class: Type[DeclarativeBase],
+        queue: str = "default",
+        batch_size: int = 10,
+        concurrency: int = 10,
+        poll_interval: float = 1,
+        visibility_timeout: float = 300,
+        backoff_base: float = 2,
+        backoff_max: float = 3600,
+        shutdown_timeout: float = 10,
+        registry: metrics.Registry | None = metrics.REGISTRY,
+    ) -> None:
+        self.model_class: Any = model_class
+        self.queue = queue
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.shutdown_timeout = shutdown_timeout
+        self.token = secrets.token_hex(8)
+        self.handlers: dict[str, Handler] = {}
+        self.running: dict[asyncio.Task, Any] = {}
+        self.slots_freed = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.closing = False
+        self.jobs_metric = self.duration_metric = self.lag_metric = None
+        if registry is not None:
+            self.jobs_metric = registry.counter(
+                "fase_jobs_total", "Finished job attempts", ("queue", "name", "result")
+            )
+            self.duration_metric = registry.histogram(
+                "fase_job_duration_seconds", "Job run time", ("queue", "name")
+            )
+            self.lag_metric = registry.histogram(
+                "fase_job_lag_seconds",
+                "Time between job becoming runnable and being claimed",
+                ("queue",),
+                buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 1800, 3600),
+            )
+
+    def handler(self, name: str | None = None):
+        def decorator(func: Handler) -> Handler:
+            self.handlers[name or func.__name__] = func
+            return func
+
+        return decorator
+
+    def backoff(self, attempts: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base ** attempts)
+        return delay * random.uniform(0.5, 1)
+
+    def claimable(self, moment: datetime, limit: int) -> Any:
+        model = self.model_class
+        return (
+            sqlalchemy.select(model.id)
+            .where(
+                model.queue == self.queue,
+                sqlalchemy.or_(
+                    sqlalchemy.and_(model.status == QUEUED, model.run_at <= moment),
+                    # claimed by a worker that died
+                    sqlalchemy.and_(model.status == RUNNING, model.locked_until <= moment),
+                ),
+            )
+            .order_by(model.run_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+
+    async def claim(self, limit: int) -> list[Any]:
+        model = self.model_class
+        moment = now()
+        token = f"{self.token}-{secrets.token_hex(4)}"
+        ids = self.claimable(moment, limit)
+        values = {
+            "status": RUNNING,
+            "locked_by": token,
+            "locked_until": moment + timedelta(seconds=self.visibility_timeout),
+            "attempts": model.attempts + 1,
+        }
+        async with connection.session() as session:
+            if session.bind.dialect.update_returning:  # type: ignore[union-attr]
+                result = await session.execute(
+                    sqlalchemy.update(model)
+                    .where(model.id.in_(ids))
+                    .values(**values)
+                    .returning(model)
+                    .execution_options(synchronize_session=False)
+                )
+                jobs = list(result.scalars())
+            else:
+                await session.execute(
+                    sqlalchemy.update(model)
+                    .where(model.id.in_(ids))
+                    .values(**values)
+                    .execution_options(synchronize_session=False)
+                )
+                result = await session.execute(
+                    sqlalchemy.select(model).where(model.locked_by == token)
+                )
+                jobs = list(result.scalars())
+        if self.lag_metric is not None:
+            for job in jobs:
+                self.lag_metric.observe(
+                    max(0.0, (moment - as_utc(job.run_at)).total_seconds()),
+                    (self.queue,),
+                )
+        return jobs
+
+    async def finish(self, job: Any, values: dict[str, Any]) -> None:
+        model = self.model_class
+        async with connection.session() as session:
+            # job is not updated if it's claimed again after visibility timeout
+            await session.execute(
+                sqlalchemy.update(model)
+                .where(model.id == job.id, model.locked_by == job.locked_by)
+                .values(locked_by=None, locked_until=None, **values)
+                .execution_options(synchronize_session=False)
+            )
+
+    async def process(self, job: Any) -> None:
+        handler = self.handlers.get(job.name)
+        start = time.perf_counter()
+        try:
+            if handler is None:
+                raise LookupError(f"no handler for job {job.name}")
+            await handler(job.payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            self.observe(job, "failed" if job.attempts >= job.max_attempts else "retry", start)
+            logger.exception("job %s %s attempt %s failed", job.name, job.id, job.attempts)
+            if job.attempts >= job.max_attempts:
+                values = {"status": FAILED, "finished_at": now()}
+            else:
+                values = {
+                    "status": QUEUED,
+                    "run_at": now() + timedelta(seconds=self.backoff(job.attempts)),
+                }
+            await self.finish(job, {"last_error": repr(error), **values})
+            return
+        self.observe(job, "done", start)
+        await self.finish(job, {"status": DONE, "finished_at": now(), "last_error": None})
+
+    def observe(self, job: Any, result: str, start: float) -> None:
+        if self.jobs_metric is not None:
+            self.jobs_metric.inc((self.queue, job.name, result))
+        if self.duration_metric is not None:
+            self.duration_metric.observe(time.perf_counter() - start, (self.queue, job.name))
+
+    def done(self, task: asyncio.Task) -> None:
+        self.running.pop(task, None)
+        self.slots_freed.set()
+
+    async def run(self) -> None:
+        while not self.closing:
+            free = self.concurrency - len(self.running)
+            if free <= 0:
+                self.slots_freed.clear()
+                await self.slots_freed.wait()
+                continue
+            try:
+                jobs = await self.claim(min(free, self.batch_size))
+            except Exception:
+                logger.exception("failed to claim jobs of queue %s", self.queue)
+                jobs = []
+            for job in jobs:
+                task = asyncio.create_task(self.process(job))
+                self.running[task] = job
+                task.add_done_callback(self.done)
+            if not jobs:
+                self.slots_freed.clear()
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self.slots_freed.wait(), self.poll_interval)
+
+    def wake(self) -> None:
+        """
+        Claims without waiting for `poll_interval`, call it after committing new jobs
+        """
+        self.slots_freed.set()
+
+    async def release(self, jobs: list[Any]) -> None:
+        """
+        Gives back jobs cancelled on shutdown, without counting the attempt
+        """
+        model = self.model_class
+        async with connection.session() as session:
+            for job in jobs:
+                await session.execute(
+                    sqlalchemy.update(model)
+                    .where(model.id == job.id, model.locked_by == job.locked_by)
+                    .values(
+                        status=QUEUED,
+                        locked_by=None,
+                        locked_until=None,
+                        attempts=model.attempts - 1,
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+
+    def start(self) -> None:
+        # event is bound to the running loop, so it's created again for each start
+        self.slots_freed = asyncio.Event()
+        self.closing = False
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        self.closing = True
+        if self.task is not None:
+            self.slots_freed.set()
+            await self.task
+            self.task = None
+        if not self.running:
+            return
+        _, pending = await asyncio.wait(set(self.running), timeout=self.shutdown_timeout)
+        cancelled = [self.running[task] for task in pending]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+        if cancelled:
+            logger.warning("%s jobs of queue %s released on shutdown", len(cancelled), self.queue)
+            await self.release(cancelled)
+
+    @contextlib.asynccontextmanager
+    async def lifespan(self, _app: Any):
+        self.start()
+        try:
+            yield
+        finally:
+            await self.stop()
@@ -1,24 +1,53 @@
-from typing import Any, Generic, Type, TypeVar
+import json
+from typing import Any, AsyncIterator, ClassVar, Generic, Sequence, Type, TypeVar
 
 import fastapi
 import sqlalchemy
+from sqlalchemy import orm
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import DeclarativeBase
 
 from fase.db import deps
+from fase.utils import tracing
 
 T = TypeVar("T", bound="Repository")
 RepositoryModel = TypeVar("RepositoryModel", bound=DeclarativeBase)
 RepositoryClass = TypeVar("RepositoryClass", bound="Repository")
 
+# profiles used when none is passed, if the repository declares them
+DETAIL = "detail"
+LIST = "list"
+
+
+def key_of(row: Any, order_by: list) -> tuple:
+    """
+    Values of `order_by` columns of a model or a row mapping, to use as `after`
+    """
+    if isinstance(row, sqlalchemy.RowMapping):
+        return tuple(row[column.key] for column in order_by)
+    return tuple(getattr(row, column.key) for column in order_by)
+
 
 class Repository(Generic[RepositoryModel]):
     """
+    Loading profiles are named loader options, `read` uses "detail" profile and
+    `readall`, `stream` and `paginate` use "list" profile unless `load_profile` is passed:
+
+        class NoteRepository(Repository[Note]):
+            model_class = Note
+            profiles = {"detail": [orm.selectinload(Note.tags)], "list": []}
+
+    With `strict`, relationships that are not loaded by the profile raise on access
+    instead of lazy loading, which fails under AsyncSession or causes N+1 queries.
+    Setting `Repository.strict = True` in tests enables it for every repository.
+
     Note:
         Repository doesn't commit by default
     """
 
     model_class: Type[RepositoryModel] | None = None
+    profiles: ClassVar[dict[str, list]] = {}
+    strict: ClassVar[bool] = False
 
     def __init__(
         self,
@@ -80,48 +109,220 @@ class Repository(Generic[RepositoryModel]):
         self.session.add(data)
         return data
 
+    @tracing.traced("repository.bulk_insert")
+    async def bulk_insert(
+        self, rows: list[dict[str, Any]], returning: list | None = None
+    ) -> list[Any] | None:
+        """
+        Inserts all rows with one executemany, rows are not added to session.
+        Values of `returning` columns are returned in order of rows
+        """
+        if not rows:
+            return [] if returning else None
+        stmt = sqlalchemy.insert(self._model_class)
+        if returning:
+            result = await self.session.execute(
+                stmt.returning(*returning, sort_by_parameter_order=True), rows
+            )
+            return list(result.all())
+        await self.session.execute(stmt, rows)
+        return None
+
     # async def createall(self, all_data: list[CrudModel]) -> None:
     #     async with anyio.create_task_group() as tg:
     #         for data in all_data:
     #             tg.start_soon(self.create, data)
 
+    def pick_profile(self, load_profile: str | None, default: str) -> str | None:
+        if load_profile is not None:
+            return load_profile
+        return default if default in self.profiles else None
+
+    def loader_options(self, load_profile: str | None = None) -> list:
+        if load_profile is None:
+            options = []
+        elif load_profile in self.profiles:
+            options = self.profiles[load_profile]
+        else:
+            raise ValueError(
+                f"{type(self).__name__} has no loading profile {load_profile}"
+            )
+        if self.strict:
+            # loaders of the profile take precedence over the wildcard
+            return [*options, orm.raiseload("*")]
+        return options
+
+    def statement(
+        self,
+        options: list | None = None,
+        filters: list | None = None,
+        where: list | None = None,
+        columns: list | None = None,
+        order_by: list | None = None,
+        after: tuple | None = None,
+        limit: int | None = None,
+        filter_by: dict[str, Any] | None = None,
+        load_profile: str | None = None,
+    ) -> sqlalchemy.Select:
+        """
+        Select of models, or of `columns` only. With `after`, only rows that come after
+        it in `order_by` order are selected, order_by should end with a unique column
+        """
+        if columns:
+            # loader options don't apply to column selects
+            stmt = sqlalchemy.select(*columns)
+        else:
+            stmt = sqlalchemy.select(self._model_class).options(
+                *self.loader_options(load_profile), *(options or [])
+            )
+        stmt = (
+            stmt.filter_by(**(filter_by or {}))
+            .filter(*(filters or []))
+            .where(*(where or []))
+        )
+        if order_by:
+            stmt = stmt.order_by(*order_by)
+            if after is not None:
+                if len(order_by) == 1:
+                    stmt = stmt.where(order_by[0] > after[0])
+                else:
+                    stmt = stmt.where(
+                        sqlalchemy.tuple_(*order_by) > sqlalchemy.tuple_(*after)
+                    )
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        return stmt
+
+    @tracing.traced("repository.select")
     async def select(
         self,
         options: list | None = None,
         filters: list | None = None,
         where: list | None = None,
+        load_profile: str | None = None,
         **kwargs: Any,
     ):
-        options = options or []
-        filters = filters or []
-        where = where or []
-        stmt = (
-            sqlalchemy.select(self._model_class)
-            .filter_by(**kwargs)
-            .filter(*filters)
-            .where(*where)
-            .options(*options)
+        stmt = self.statement(
+            options=options,
+            filters=filters,
+            where=where,
+            filter_by=kwargs,
+            load_profile=load_profile,
         )
         return await self.session.execute(stmt)
 
+    @tracing.traced("repository.read")
     async def read(
         self,
         options: list | None = None,
         filters: list | None = None,
         where: list | None = None,
+        load_profile: str | None = None,
         **kwargs: Any,
     ) -> RepositoryModel | None:
         return (
-            (await self.select(options=options, filters=filters, where=where, **kwargs))
+            (
+                await self.select(
+                    options=options,
+                    filters=filters,
+                    where=where,
+                    load_profile=self.pick_profile(load_profile, DETAIL),
+                    **kwargs,
+                )
+            )
             .scalars()
             .one_or_none()
         )
 
+    @tracing.traced("repository.get")
+    async def get(
+        self,
+        pk: Any,
+        options: list | None = None,
+        load_profile: str | None = None,
+    ) -> RepositoryModel | None:
+        """
+        Model by primary key, without a query when it's already in the session
+        """
+        return await self.session.get(
+            self._model_class,
+            pk,
+            options=[
+                *self.loader_options(self.pick_profile(load_profile, DETAIL)),
+                *(options or []),
+            ],
+        )
+
+    @tracing.traced("repository.get_many")
+    async def get_many(
+        self,
+        pks: Sequence[Any],
+        options: list | None = None,
+        load_profile: str | None = None,
+        chunk_size: int | None = None,
+    ) -> list[RepositoryModel | None]:
+        """
+        Models of `pks` in the same order, None for missing ones. Models in the
+        session are not queried, others are selected with `IN` in chunks that stay
+        under parameter limit of the dialect. Composite keys are passed as tuples.
+        """
+        mapper = sqlalchemy.inspect(self._model_class)
+        pk_columns = list(mapper.primary_key)
+        found: dict[Any, Any] = {}
+        missing = []
+        for pk in dict.fromkeys(pks):
+            model = self.session.identity_map.get(
+                orm.util.identity_key(self._model_class, pk)
+            )
+            state = sqlalchemy.inspect(model) if model is not None else None
+            if state is None or state.expired or state.deleted:
+                missing.append(pk)
+            else:
+                found[pk] = model
+        if missing:
+            if chunk_size is None:
+                dialect = self.session.get_bind().dialect
+                chunk_size = dialect.insertmanyvalues_max_parameters // len(pk_columns)
+            if len(pk_columns) == 1:
+                key_column = pk_columns[0]
+            else:
+                key_column = sqlalchemy.tuple_(*pk_columns)
+            for start in range(0, len(missing), chunk_size):
+                result = await self.select(
+                    options=options,
+                    where=[key_column.in_(missing[start : start + chunk_size])],
+                    load_profile=self.pick_profile(load_profile, LIST),
+                )
+                for model in result.scalars():
+                    identity = mapper.primary_key_from_instance(model)
+                    found[identity[0] if len(identity) == 1 else tuple(identity)] = model
+        return [found.get(pk) for pk in pks]
+
+    @tracing.traced("repository.exists")
+    async def exists(
+        self,
+        filters: list | None = None,
+        where: list | None = None,
+        **kwargs: Any,
+    ) -> bool:
+        """
+        Runs `SELECT EXISTS`, no row is loaded
+        """
+        stmt = self.statement(
+            filters=filters,
+            where=where,
+            columns=list(sqlalchemy.inspect(self._model_class).primary_key),
+            filter_by=kwargs,
+        )
+        return bool(await self.session.scalar(sqlalchemy.select(stmt.exists())))
+
+    @tracing.traced("repository.readall")
     async def readall(
         self,
         options: list | None = None,
         filters: list | None = None,
         where: list | None = None,
+        load_profile: str | None = None,
         **kwargs: Any,
     ) -> list[RepositoryModel]:
         return list(
@@ -130,6 +331,7 @@ class Repository(Generic[RepositoryModel]):
                     options=options,
                     filters=filters,
                     where=where,
+                    load_profile=self.pick_profile(load_profile, LIST),
                     **kwargs,
                 )
             )
@@ -137,6 +339,77 @@ class Repository(Generic[RepositoryModel]):
             .all()
         )
 
+    async def stream(
+        self,
+        options: list | None = None,
+        filters: list | None = None,
+        where: list | None = None,
+        columns: list | None = None,
+        order_by: list | None = None,
+        after: tuple | None = None,
+        limit: int | None = None,
+        chunk_size: int = 1000,
+        load_profile: str | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[Sequence[Any]]:
+        """
+        Yields models, or row mappings of `columns`, in chunks of `chunk_size`
+        from a server side cursor, whole result is never loaded
+        """
+        stmt = self.statement(
+            options=options,
+            filters=filters,
+            where=where,
+            columns=columns,
+            order_by=order_by,
+            after=after,
+            limit=limit,
+            filter_by=kwargs,
+            load_profile=self.pick_profile(load_profile, LIST),
+        ).execution_options(yield_per=chunk_size)
+        result = await self.session.stream(stmt)
+        try:
+            rows = result.mappings() if columns else result.scalars()
+            async for chunk in rows.partitions():
+                yield chunk
+        finally:
+            await result.close()
+
+    @tracing.traced("repository.paginate")
+    async def paginate(
+        self,
+        order_by: list,
+        after: tuple | None = None,
+        limit: int = 50,
+        options: list | None = None,
+        filters: list | None = None,
+        where: list | None = None,
+        columns: list | None = None,
+        load_profile: str | None = None,
+        **kwargs: Any,
+    ) -> tuple[list[Any], tuple | None]:
+        """
+        Keyset pagination, returns a page and key of its last row to pass as `after`
+        for the next page, key is None on the last page
+        """
+        stmt = self.statement(
+            options=options,
+            filters=filters,
+            where=where,
+            columns=columns,
+            order_by=order_by,
+            after=after,
+            limit=limit + 1,
+            filter_by=kwargs,
+            load_profile=self.pick_profile(load_profile, LIST),
+        )
+        result = await self.session.execute(stmt)
+        rows = list(result.mappings() if columns else result.scalars())
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, key_of(rows[-1], order_by)
+
     def add_to_session(self, data: RepositoryModel) -> RepositoryModel:
         self.session.add(data)
         return data
@@ -145,15 +418,114 @@ class Repository(Generic[RepositoryModel]):
         await self.session.merge(data)
         return data
 
-    async def count(self, filters: list | None = None, where: list | None = None) -> int:
-        if not filters:
-            filters = []
-        if not where:
-            where = []
-        query = sqlalchemy.select(sqlalchemy.func.count()).select_from(self._model_class).filter(*filters).where(*where)
+    @tracing.traced("repository.count")
+    async def count(
+        self,
+        filters: list | None = None,
+        where: list | None = None,
+        estimated: bool = False,
+        **kwargs: Any,
+    ) -> int:
+        """
+        With `estimated` on postgres, count is read from planner statistics
+        instead of scanning the table, it's exact on other databases
+        """
+        query = (
+            sqlalchemy.select(sqlalchemy.func.count())
+            .select_from(self._model_class)
+            .filter_by(**kwargs)
+            .filter(*(filters or []))
+            .where(*(where or []))
+        )
+        if estimated and self.session.get_bind().dialect.name == "postgresql":
+            stmt = None
+            if filters or where or kwargs:
+                stmt = self.statement(
+                    columns=list(sqlalchemy.inspect(self._model_class).primary_key),
+                    filters=filters,
+                    where=where,
+                    filter_by=kwargs,
+                )
+            estimate = await self.estimate_count(stmt)
+            if estimate is not None:
+                return estimate
         result = await self.session.scalar(query)
         return result # type: ignore
 
+    async def estimate_count(self, stmt: sqlalchemy.Select | None = None) -> int | None:
+        """
+        Rows planner expects for `stmt` on postgres, or rows of the table from
+        pg_class without it. None when the table is not analyzed yet
+        """
+        dialect = self.session.get_bind().dialect
+        if stmt is None:
+            table: Any = self._model_class.__table__  # type: ignore[attr-defined]
+            result = await self.session.scalar(
+                sqlalchemy.text(
+                    "SELECT reltuples FROM pg_class WHERE oid = to_regclass(:name)"
+                ),
+                {"name": dialect.identifier_preparer.format_table(table)},
+            )
+            return int(result) if result is not None and result >= 0 else None
+        compiled = stmt.compile(
+            dialect=dialect, compile_kwargs={"render_postcompile": True}
+        )
+        params: Any = compiled.params
+        if compiled.positiontup is not None:
+            params = tuple(compiled.params[name] for name in compiled.positiontup)
+        connection = await self.session.connection()
+        result = await connection.exec_driver_sql(
+            f"EXPLAIN (FORMAT JSON) {compiled}", params
+        )
+        plan = result.scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    @tracing.traced("repository.aggregate")
+    async def aggregate(
+        self,
+        metrics: dict[str, Any],
+        group_by: list | None = None,
+        filters: list | None = None,
+        where: list | None = None,
+        having: list | None = None,
+        order_by: list | None = None,
+        limit: int | None = None,
+        **kwargs: Any,
+    ) -> list[sqlalchemy.Row]:
+        """
+        Runs one GROUP BY query, rows have `group_by` columns then `metrics` by name.
+        `order_by` can refer to metrics by name:
+
+            await crud.aggregate(
+                group_by=[Order.status],
+                metrics={"n": func.count(), "total": func.sum(Order.amount)},
+                having=[func.count() > 10],
+                order_by=[sqlalchemy.desc("total")],
+            )
+        """
+        group_by = group_by or []
+        stmt = (
+            sqlalchemy.select(
+                *group_by,
+                *(metric.label(name) for name, metric in metrics.items()),
+            )
+            .select_from(self._model_class)
+            .filter_by(**kwargs)
+            .filter(*(filters or []))
+            .where(*(where or []))
+        )
+        if group_by:
+            stmt = stmt.group_by(*group_by)
+        if having:
+            stmt = stmt.having(*having)
+        if order_by:
+            stmt = stmt.order_by(*order_by)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        return list((await self.session.execute(stmt)).all())
+
     # async def update_or_create(self, data: CrudModel) -> None:
     #     await data.update_or_create()
 
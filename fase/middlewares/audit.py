@@ -0,0 +1,237 @@
+"""
+Audit log that doesn't write in request path.
+
+Usage:
+    class AuditLog(db.Base, audit.AuditLogMixin):
+        __tablename__ = "audit_log"
+
+    fp.add_audit_log(AuditLog)
+"""
+import asyncio
+import contextlib
+import json
+import time
+from datetime import datetime, timezone
+from typing import Any, Type
+
+import sqlalchemy
+from sqlalchemy import orm
+from sqlalchemy.orm import DeclarativeBase
+from starlette import types
+
+from fase.db import connection, repository
+from fase.utils import logging
+
+DROP = "drop"
+SPILL = "spill"
+UNMATCHED = "unmatched"
+ROUTE_LENGTH = 255
+METHOD_LENGTH = 16
+
+logger = logging.get_logger("audit")
+
+
+@orm.declarative_mixin
+class AuditLogMixin:
+    id: orm.Mapped[int] = orm.mapped_column(
+        sqlalchemy.BigInteger().with_variant(sqlalchemy.Integer(), "sqlite"),
+        primary_key=True,
+        autoincrement=True,
+    )
+    principal: orm.Mapped[str | None] = orm.mapped_column(sqlalchemy.String(255))
+    method: orm.Mapped[str] = orm.mapped_column(sqlalchemy.String(METHOD_LENGTH))
+    route: orm.Mapped[str] = orm.mapped_column(sqlalchemy.String(ROUTE_LENGTH))
+    status: orm.Mapped[int] = orm.mapped_column(sqlalchemy.Integer())
+    duration: orm.Mapped[float] = orm.mapped_column(sqlalchemy.Float())
+    created_at: orm.Mapped[datetime] = orm.mapped_column(
+        sqlalchemy.DateTime(timezone=True)
+    )
+
+
+class AuditWriter:
+    """
+    Bulk inserts queued records from a background task.
+
+    When queue is full records are dropped or appended to `spill_path` as json lines.
+    Spilled records are written in batches from a thread, up to `queue_size` of
+    them wait for the file and the rest are dropped.
+    """
+
+    def __init__(
+        self,
+        model_class: Type[DeclarativeBase],
+        queue_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1,
+        overflow: str = DROP,
+        spill_path: str | None = None,
+    ) -> None:
+        if overflow not in (DROP, SPILL):
+            raise ValueError(f"unknown overflow policy {overflow}")
+        if overflow == SPILL and spill_path is None:
+            raise ValueError("spill_path should be set for spill overflow policy")
+        self.model_class = model_class
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.spill_path = spill_path
+        self.queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(queue_size)
+        self.task: asyncio.Task | None = None
+        self.closing = False
+        self.spill_buffer: list[dict[str, Any]] = []
+        self.spill_task: asyncio.Task | None = None
+        self.written = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.failed = 0
+
+    def put(self, record: dict[str, Any]) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except asyncio.QueueFull:
+            if self.overflow == SPILL:
+                self.spill(record)
+            else:
+                self.dropped += 1
+
+    def spill(self, record: dict[str, Any]) -> None:
+        if len(self.spill_buffer) >= self.queue_size:
+            self.dropped += 1
+            return
+        self.spill_buffer.append(record)
+        if self.spill_task is None or self.spill_task.done():
+            self.spill_task = asyncio.create_task(self.flush_spill())
+
+    async def flush_spill(self) -> None:
+        while self.spill_buffer:
+            records, self.spill_buffer = self.spill_buffer, []
+            try:
+                await asyncio.to_thread(self.write_spill, records)
+                self.spilled += len(records)
+            except Exception:
+                self.failed += len(records)
+                logger.exception("failed to spill %s audit records", len(records))
+
+    def write_spill(self, records: list[dict[str, Any]]) -> None:
+        with open(self.spill_path, "a") as f:  # type: ignore[arg-type]
+            f.write("".join(json.dumps(record, default=str) + "\n" for record in records))
+
+    async def next_batch(self) -> list[dict[str, Any]]:
+        batch: list[dict[str, Any]] = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def write(self, batch: list[dict[str, Any]]) -> None:
+        try:
+            async with connection.session() as session:
+                await repository.Repository(
+                    session=session,
+                    model_class=self.model_class,
+                ).bulk_insert(batch)
+            self.written += len(batch)
+        except Exception:
+            self.failed += len(batch)
+            logger.exception("failed to write %s audit records", len(batch))
+
+    async def run(self) -> None:
+        while not self.closing:
+            batch = await self.next_batch()
+            if batch:
+                await self.write(batch)
+
+    def start(self) -> None:
+        # queue is bound to the running loop, so it's created again for each start
+        self.queue = asyncio.Queue(self.queue_size)
+        self.closing = False
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        # task is not cancelled so a batch being collected or written is not lost
+        self.closing = True
+        if self.task is not None:
+            await self.task
+            self.task = None
+        batch: list[dict[str, Any]] = []
+        while not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+            if len(batch) >= self.batch_size:
+                await self.write(batch)
+                batch = []
+        if batch:
+            await self.write(batch)
+        if self.spill_task is not None:
+            await self.spill_task
+            self.spill_task = None
+
+    @contextlib.asynccontextmanager
+    async def lifespan(self, _app: Any):
+        self.start()
+        try:
+            yield
+        finally:
+            await self.stop()
+
+
+def get_principal(scope: types.Scope) -> str | None:
+    # set by `users.deps.token_payload` when route is authenticated
+    token_payload = scope.get("state", {}).get("token_payload")
+    return getattr(token_payload, "sub", None)
+
+
+def get_route(scope: types.Scope) -> str:
+    # raw path of unmatched requests is client controlled, so it's not stored
+    route = getattr(scope.get("route"), "path", UNMATCHED)
+    return route[:ROUTE_LENGTH]
+
+
+class AuditMiddleware:
+    def __init__(
+        self,
+        app: types.ASGIApp,
+        writer: AuditWriter,
+        methods: list[str] | None = None,
+    ) -> None:
+        self.app = app
+        self.writer = writer
+        self.methods = set(methods) if methods else None
+
+    async def __call__(
+        self, scope: types.Scope, receive: types.Receive, send: types.Send
+    ) -> None:
+        if scope["type"] != "http" or (
+            self.methods is not None and scope["method"] not in self.methods
+        ):
+            await self.app(scope, receive, send)
+            return
+        created_at = datetime.now(timezone.utc)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message: types.Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.writer.put(
+                {
+                    "principal": get_principal(scope),
+                    "method": scope["method"][:METHOD_LENGTH],
+                    "route": get_route(scope),
+                    "status": status,
+                    "duration": time.perf_counter() - start,
+                    "created_at": created_at,
+                }
+            )
@@ -0,0 +1,159 @@
+"""
+Single-flight for identical concurrent GET requests.
+
+Usage:
+    fp.add_coalescing(config.CoalescingConfig(paths=["/products"]))
+
+    @app.get("/top")
+    @coalescing.safe
+    async def top():
+        ...
+
+The first request runs the endpoint, identical requests arriving while it runs
+wait for it and get the same status, headers and body. Nothing is kept after
+the response is complete, so it's not a cache.
+
+Requests are identical when path, query, `Accept` and `Accept-Encoding` headers
+are the same, and with `user` scope also `Authorization` and `Cookie` headers.
+Use `global` scope only for responses that are the same for every user, requests
+with `Authorization` or `Cookie` headers are never coalesced in it since their
+auth dependencies have to run. `Set-Cookie` headers are never shared.
+"""
+import asyncio
+import hashlib
+from typing import Any, Callable, Iterable
+
+from starlette import routing, types
+
+GLOBAL = "global"
+USER = "user"
+
+VARY_HEADERS = {b"accept", b"accept-encoding"}
+USER_HEADERS = {b"authorization", b"cookie"}
+PRIVATE_HEADERS = {b"set-cookie"}
+
+
+def safe(endpoint: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Marks a GET endpoint whose concurrent identical requests can share one response
+    """
+    endpoint.__fase_coalesce__ = True  # type: ignore[attr-defined]
+    return endpoint
+
+
+class CoalescingMiddleware:
+    def __init__(
+        self,
+        app: types.ASGIApp,
+        paths: list[str] | None = None,
+        scope: str = USER,
+        max_wait: float = 5,
+        max_body_size: int = 10_000_000,
+        routes: Callable[[], Iterable[routing.BaseRoute]] | None = None,
+    ) -> None:
+        if scope not in (GLOBAL, USER):
+            raise ValueError(f"unknown coalescing scope {scope}")
+        self.app = app
+        self.paths = tuple(paths or ())
+        self.per_user = scope == USER
+        self.headers = VARY_HEADERS | USER_HEADERS if self.per_user else VARY_HEADERS
+        self.max_wait = max_wait
+        self.max_body_size = max_body_size
+        self.get_routes = routes
+        self.safe_routes: list[routing.BaseRoute] | None = None
+        self.in_flight: dict[str, asyncio.Future] = {}
+
+    def is_safe(self, scope: types.Scope) -> bool:
+        if not self.per_user and any(name in USER_HEADERS for name, _ in scope["headers"]):
+            return False
+        if self.paths and scope["path"].startswith(self.paths):
+            return True
+        if self.get_routes is None:
+            return False
+        if self.safe_routes is None:
+            # routes are all added before first request
+            self.safe_routes = [
+                route
+                for route in self.get_routes()
+                if getattr(getattr(route, "endpoint", None), "__fase_coalesce__", False)
+            ]
+        return any(
+            route.matches(scope)[0] == routing.Match.FULL for route in self.safe_routes
+        )
+
+    def get_key(self, scope: types.Scope) -> str:
+        key = hashlib.sha256(scope["path"].encode())
+        key.update(b"?" + scope["query_string"])
+        for name, value in sorted(scope["headers"]):
+            if name in self.headers:
+                key.update(b"\0" + name + b":" + value)
+        return key.hexdigest()
+
+    async def __call__(
+        self, scope: types.Scope, receive: types.Receive, send: types.Send
+    ) -> None:
+        if scope["type"] != "http" or scope["method"] != "GET" or not self.is_safe(scope):
+            await self.app(scope, receive, send)
+            return
+        key = self.get_key(scope)
+        leader = self.in_flight.get(key)
+        if leader is None:
+            await self.lead(key, scope, receive, send)
+            return
+        try:
+            response = await asyncio.wait_for(asyncio.shield(leader), self.max_wait)
+        except asyncio.TimeoutError:
+            response = None
+        if response is None:
+            # leader failed, was too slow or too large to share
+            await self.app(scope, receive, send)
+            return
+        start, body = response
+        headers = [
+            (name, value)
+            for name, value in start["headers"]
+            if name.lower() not in PRIVATE_HEADERS
+        ]
+        await send({**start, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    async def lead(
+        self, key: str, scope: types.Scope, receive: types.Receive, send: types.Send
+    ) -> None:
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        start: types.Message | None = None
+        chunks: list[bytes] = []
+        size = 0
+        shareable = True
+
+        async def send_wrapper(message: types.Message) -> None:
+            nonlocal start, size, shareable
+            if message["type"] == "http.response.start":
+                # copied since outer middlewares may change headers in place
+                start = {**message, "headers": list(message.get("headers", []))}
+            elif message["type"] == "http.response.body" and shareable:
+                body = message.get("body", b"")
+                size += len(body)
+                if size > self.max_body_size:
+                    shareable = False
+                    chunks.clear()
+                    self.resolve(key, future, None)
+                else:
+                    chunks.append(body)
+                    if not message.get("more_body", False):
+                        self.resolve(key, future, (start, b"".join(chunks)))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # followers run the request themselves when leader couldn't share
+            self.resolve(key, future, None)
+
+    def resolve(self, key: str, future: asyncio.Future, response: Any) -> None:
+        if future.done():
+            return
+        if self.in_flight.get(key) is future:
+            del self.in_flight[key]
+        future.set_result(response)
@@ -0,0 +1,225 @@
+"""
+Response compression with gzip, brotli (optional) and zstd (optional).
+
+Unlike `starlette.middleware.gzip` only allowed content types are compressed
+and the algorithm is negotiated from `Accept-Encoding`.
+"""
+import abc
+import zlib
+from typing import Iterable
+
+from starlette import datastructures, types
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+GZIP = "gzip"
+BROTLI = "br"
+ZSTD = "zstd"
+
+DEFAULT_LEVELS = {GZIP: 6, BROTLI: 4, ZSTD: 3}
+DEFAULT_CONTENT_TYPES = (
+    "application/json",
+    "text/",
+    "application/javascript",
+    "application/xml",
+)
+
+
+class Compressor(abc.ABC):
+    @abc.abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        pass
+
+    @abc.abstractmethod
+    def flush(self) -> bytes:
+        """
+        Makes everything compressed until now decodable, used between stream chunks
+        """
+
+    @abc.abstractmethod
+    def finish(self) -> bytes:
+        pass
+
+
+class GzipCompressor(Compressor):
+    def __init__(self, level: int) -> None:
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+
+class BrotliCompressor(Compressor):
+    def __init__(self, level: int) -> None:
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush()
+
+    def finish(self) -> bytes:
+        return self.compressor.finish()
+
+
+class ZstdCompressor(Compressor):
+    def __init__(self, level: int) -> None:
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+
+COMPRESSORS: dict[str, type[Compressor]] = {GZIP: GzipCompressor}
+if brotli is not None:
+    COMPRESSORS[BROTLI] = BrotliCompressor
+if zstandard is not None:
+    COMPRESSORS[ZSTD] = ZstdCompressor
+
+
+def accepted_encodings(headers: datastructures.Headers) -> set[str]:
+    encodings = set()
+    for item in headers.get("accept-encoding", "").split(","):
+        encoding, _, params = item.partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        encodings.add(encoding.strip().lower())
+    return encodings
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: types.ASGIApp,
+        minimum_size: int = 500,
+        algorithms: Iterable[str] = (BROTLI, ZSTD, GZIP),
+        content_types: Iterable[str] = DEFAULT_CONTENT_TYPES,
+        levels: dict[str, int] | None = None,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        # algorithms that are not installed are skipped
+        self.algorithms = [
+            algorithm for algorithm in algorithms if algorithm in COMPRESSORS
+        ]
+        self.content_types = tuple(content_types)
+        self.levels = {**DEFAULT_LEVELS, **(levels or {})}
+
+    def choose(self, scope: types.Scope) -> str | None:
+        accepted = accepted_encodings(datastructures.Headers(scope=scope))
+        for algorithm in self.algorithms:
+            if algorithm in accepted:
+                return algorithm
+        return None
+
+    async def __call__(
+        self, scope: types.Scope, receive: types.Receive, send: types.Send
+    ) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        algorithm = self.choose(scope)
+        if algorithm is None:
+            await self.app(scope, receive, send)
+            return
+        responder = CompressionResponder(
+            send,
+            algorithm,
+            self.levels[algorithm],
+            self.minimum_size,
+            self.content_types,
+        )
+        await self.app(scope, receive, responder.send)
+
+
+class CompressionResponder:
+    def __init__(
+        self,
+        send: types.Send,
+        algorithm: str,
+        level: int,
+        minimum_size: int,
+        content_types: tuple[str, ...],
+    ) -> None:
+        self.downstream = send
+        self.algorithm = algorithm
+        self.level = level
+        self.minimum_size = minimum_size
+        self.content_types = content_types
+        self.start_message: types.Message | None = None
+        self.compressor: Compressor | None = None
+        self.passthrough = False
+
+    def should_compress(self, headers: datastructures.MutableHeaders) -> bool:
+        if "content-encoding" in headers:
+            return False
+        return headers.get("content-type", "").startswith(self.content_types)
+
+    def set_headers(self, headers: datastructures.MutableHeaders) -> None:
+        headers["Content-Encoding"] = self.algorithm
+        headers.add_vary_header("Accept-Encoding")
+
+    async def send(self, message: types.Message) -> None:
+        if message["type"] == "http.response.start":
+            # wait for first body to know if response is big enough
+            self.start_message = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.downstream(message)
+            return
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.compressor is not None:
+            data = self.compressor.compress(body)
+            data += self.compressor.flush() if more_body else self.compressor.finish()
+            await self.downstream({**message, "body": data})
+            return
+
+        assert self.start_message is not None
+        headers = datastructures.MutableHeaders(raw=self.start_message["headers"])
+        if not self.should_compress(headers) or (
+            not more_body and len(body) < self.minimum_size
+        ):
+            self.passthrough = True
+            await self.downstream(self.start_message)
+            await self.downstream(message)
+            return
+
+        self.compressor = COMPRESSORS[self.algorithm](self.level)
+        self.set_headers(headers)
+        data = self.compressor.compress(body)
+        if more_body:
+            del headers["Content-Length"]
+            data += self.compressor.flush()
+        else:
+            data += self.compressor.finish()
+            headers["Content-Length"] = str(len(data))
+        self.start_message["headers"] = headers.raw
+        await self.downstream(self.start_message)
+        await self.downstream({**message, "body": data})
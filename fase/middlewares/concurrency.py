@@ -0,0 +1,198 @@
+"""
+Adaptive concurrency limit, load shedding and request deadlines.
+
+Limit grows by `1 / limit` for each request faster than `target_latency` and
+is multiplied by `backoff` for each slower one (AIMD). Requests over the limit
+wait in a bounded queue, when queue is full or wait times out they get 503.
+"""
+import asyncio
+import collections
+import contextlib
+import time
+
+from starlette import responses, types
+
+from fase.core import config
+from fase.utils import deadline
+
+
+class AdaptiveLimiter:
+    def __init__(self, limit_config: config.ConcurrencyLimit) -> None:
+        self.config = limit_config
+        self.limit = float(limit_config.initial)
+        self.in_flight = 0
+        self.waiters: collections.deque[asyncio.Future] = collections.deque()
+        self.rejected = 0
+
+    async def acquire(self) -> bool:
+        if self.in_flight < int(self.limit) and not self.waiters:
+            self.in_flight += 1
+            return True
+        if len(self.waiters) >= self.config.queue_size:
+            self.rejected += 1
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            # wait_for returns the result if slot is given right when timeout fires
+            return await asyncio.wait_for(waiter, self.config.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False
+        finally:
+            if not waiter.done() or waiter.cancelled():
+                with contextlib.suppress(ValueError):
+                    self.waiters.remove(waiter)
+
+    def release(self, latency: float) -> None:
+        if latency <= self.config.target_latency:
+            self.limit = min(self.config.max_limit, self.limit + 1 / self.limit)
+        else:
+            self.limit = max(self.config.min_limit, self.limit * self.config.backoff)
+        self.in_flight -= 1
+        while self.waiters and self.in_flight < int(self.limit):
+            waiter = self.waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(True)
+
+
+class ReceiveProxy:
+    """
+    Reads messages of client on behalf of the app, so disconnect is seen
+    even when app is not reading the request
+    """
+
+    def __init__(self, receive: types.Receive) -> None:
+        self.receive = receive
+        self.queue: asyncio.Queue[types.Message] = asyncio.Queue(8)
+
+    async def watch(self) -> None:
+        while True:
+            message = await self.receive()
+            await self.queue.put(message)
+            if message["type"] == "http.disconnect":
+                return
+
+    async def __call__(self) -> types.Message:
+        return await self.queue.get()
+
+
+class ConcurrencyMiddleware:
+    def __init__(
+        self,
+        app: types.ASGIApp,
+        concurrency_config: config.ConcurrencyConfig,
+    ) -> None:
+        self.app = app
+        self.config = concurrency_config
+        self.timeout_header = concurrency_config.timeout_header.lower().encode()
+        self.default = (
+            AdaptiveLimiter(concurrency_config.default)
+            if concurrency_config.default
+            else None
+        )
+        self.paths = sorted(
+            (
+                (prefix, AdaptiveLimiter(limit_config))
+                for prefix, limit_config in concurrency_config.paths.items()
+            ),
+            key=lambda item: len(item[0]),
+            reverse=True,
+        )
+
+    def match(self, path: str) -> AdaptiveLimiter | None:
+        for prefix, limiter in self.paths:
+            if path.startswith(prefix):
+                return limiter
+        return self.default
+
+    def get_timeout(self, scope: types.Scope, limiter: AdaptiveLimiter) -> float | None:
+        timeout = limiter.config.timeout
+        for name, value in scope["headers"]:
+            if name == self.timeout_header:
+                try:
+                    requested = float(value)
+                except ValueError:
+                    break
+                timeout = requested if timeout is None else min(timeout, requested)
+                break
+        return timeout
+
+    async def __call__(
+        self, scope: types.Scope, receive: types.Receive, send: types.Send
+    ) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        limiter = self.match(scope["path"])
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+        if not await limiter.acquire():
+            response = responses.PlainTextResponse(
+                "Service Unavailable",
+                status_code=503,
+                headers={"Retry-After": "1"},
+            )
+            await response(scope, receive, send)
+            return
+        start = time.perf_counter()
+        try:
+            timeout = self.get_timeout(scope, limiter)
+            if timeout is None and not self.config.cancel_on_disconnect:
+                await self.app(scope, receive, send)
+            elif timeout is None:
+                await self.call(scope, receive, send, None)
+            else:
+                with deadline.timeout(timeout):
+                    await self.call(scope, receive, send, timeout)
+        finally:
+            limiter.release(time.perf_counter() - start)
+
+    async def call(
+        self,
+        scope: types.Scope,
+        receive: types.Receive,
+        send: types.Send,
+        timeout: float | None,
+    ) -> None:
+        response_started = False
+        response_complete = False
+
+        async def send_wrapper(message: types.Message) -> None:
+            nonlocal response_started, response_complete
+            if message["type"] == "http.response.start":
+                response_started = True
+            elif message["type"] == "http.response.body" and not message.get(
+                "more_body", False
+            ):
+                response_complete = True
+            await send(message)
+
+        proxy = ReceiveProxy(receive) if self.config.cancel_on_disconnect else None
+        task = asyncio.ensure_future(self.app(scope, proxy or receive, send_wrapper))
+        watcher = asyncio.ensure_future(proxy.watch()) if proxy else None
+        waiters = {task, watcher} if watcher else {task}
+        try:
+            done, _ = await asyncio.wait(
+                waiters,
+                timeout=timeout,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if task in done or response_complete:
+                # work after response like background tasks is not cut
+                await task
+                return
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+            if watcher in done or response_started:
+                # client is gone or it's too late to change the response
+                return
+            response = responses.PlainTextResponse("Gateway Timeout", status_code=504)
+            await response(scope, receive, send)
+        finally:
+            if watcher is not None:
+                watcher.cancel()
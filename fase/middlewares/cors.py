@@ -0,0 +1,25 @@
+from fastapi.middleware import cors
+from starlette import types
+
+from fase.core import config
+
+
+class CORSMiddleware(cors.CORSMiddleware):
+    """
+    CORS middleware that can be reconfigured while app is running
+    """
+
+    def __init__(self, app: types.ASGIApp, cors_config: config.CorsConfig) -> None:
+        self.configure_app(app, cors_config)
+
+    def configure_app(self, app: types.ASGIApp, cors_config: config.CorsConfig) -> None:
+        super().__init__(
+            app,
+            allow_origins=cors_config.allow_origins,
+            allow_credentials=True,
+            allow_methods=cors_config.allow_methods,
+            allow_headers=cors_config.allow_headers,
+        )
+
+    def configure(self, cors_config: config.CorsConfig) -> None:
+        self.configure_app(self.app, cors_config)
@@ -0,0 +1,361 @@
+"""
+Replays stored responses of requests with `Idempotency-Key` header.
+
+Usage:
+    fp.add_idempotency(config.IdempotencyConfig())
+
+    # or shared between workers
+    class IdempotencyKey(db.Base, idempotency.IdempotencyKeyMixin):
+        __tablename__ = "idempotency_key"
+
+    fp.add_idempotency(store=idempotency.DBStore(IdempotencyKey))
+
+Keys are scoped by `Authorization` and `Cookie` headers, method and path. A duplicate of a
+request that is still running waits for it in the same process. A completed one
+is replayed with `Idempotent-Replayed: true` header, and a reused key with
+another body gets 422. 5xx responses are not stored so the client can retry.
+Request bodies are buffered to compare them, a keyed request with a body larger
+than `max_request_size` gets 413.
+"""
+import abc
+import asyncio
+import dataclasses
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Type
+
+import sqlalchemy
+from sqlalchemy import exc, orm
+from sqlalchemy.orm import DeclarativeBase
+from starlette import responses, types
+
+from fase.db import connection, repository
+from fase.utils import cache
+
+# keys of different users don't collide
+SCOPE_HEADERS = (b"authorization", b"cookie")
+
+
+@dataclasses.dataclass
+class StoredResponse:
+    fingerprint: str
+    status: int
+    headers: list[tuple[bytes, bytes]]
+    body: bytes
+
+
+class IdempotencyStore(abc.ABC):
+    @abc.abstractmethod
+    async def get(self, key: str) -> StoredResponse | None:
+        pass
+
+    @abc.abstractmethod
+    async def put(self, key: str, response: StoredResponse) -> None:
+        pass
+
+
+def stored_size(response: StoredResponse) -> int:
+    return len(response.body) + sum(len(name) + len(value) for name, value in response.headers)
+
+
+class MemoryStore(IdempotencyStore):
+    """
+    Oldest responses are evicted when there are more than `max_entries` of them,
+    or they take more than `max_bytes`
+    """
+
+    def __init__(
+        self, ttl: float = 86400, max_entries: int = 10000, max_bytes: int = 100_000_000
+    ) -> None:
+        self.cache: cache.Cache[StoredResponse] = cache.Cache(
+            timedelta(seconds=ttl),
+            name="idempotency",
+            max_size=max_entries,
+            max_weight=max_bytes,
+            weigh=stored_size,
+        )
+
+    async def get(self, key: str) -> StoredResponse | None:
+        return self.cache.get(key, None)
+
+    async def put(self, key: str, response: StoredResponse) -> None:
+        self.cache.put(key, response)
+
+
+@orm.declarative_mixin
+class IdempotencyKeyMixin:
+    key: orm.Mapped[str] = orm.mapped_column(sqlalchemy.String(64), primary_key=True)
+    fingerprint: orm.Mapped[str] = orm.mapped_column(sqlalchemy.String(64))
+    status: orm.Mapped[int] = orm.mapped_column(sqlalchemy.Integer())
+    headers: orm.Mapped[list] = orm.mapped_column(sqlalchemy.JSON())
+    body: orm.Mapped[bytes] = orm.mapped_column(sqlalchemy.LargeBinary())
+    expires_at: orm.Mapped[datetime] = orm.mapped_column(
+        sqlalchemy.DateTime(timezone=True), index=True
+    )
+
+
+class DBStore(IdempotencyStore):
+    """
+    Expired rows are deleted every `purge_every` puts
+    """
+
+    def __init__(
+        self,
+        model_class: Type[DeclarativeBase],
+        ttl: float = 86400,
+        purge_every: int = 1000,
+    ) -> None:
+        self.model_class: Type = model_class
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self.puts = 0
+
+    async def get(self, key: str) -> StoredResponse | None:
+        async with connection.session() as session:
+            row = await repository.Repository(session, self.model_class).read(key=key)
+        if row is None:
+            return None
+        expires_at = row.expires_at
+        if expires_at.tzinfo is None:
+            # sqlite returns naive datetimes
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        if expires_at < datetime.now(timezone.utc):
+            return None
+        return StoredResponse(
+            fingerprint=row.fingerprint,
+            status=row.status,
+            headers=[(name.encode("latin-1"), value.encode("latin-1")) for name, value in row.headers],
+            body=row.body,
+        )
+
+    async def put(self, key: str, response: StoredResponse) -> None:
+        now = datetime.now(timezone.utc)
+        try:
+            async with connection.session() as session:
+                crud = repository.Repository(session, self.model_class)
+                await crud.create_or_update(
+                    self.model_class(
+                        key=key,
+                        fingerprint=response.fingerprint,
+                        status=response.status,
+                        headers=[
+                            [name.decode("latin-1"), value.decode("latin-1")]
+                            for name, value in response.headers
+                        ],
+                        body=response.body,
+                        expires_at=now + timedelta(seconds=self.ttl),
+                    )
+                )
+                self.puts += 1
+                if self.puts % self.purge_every == 0:
+                    await session.execute(
+                        sqlalchemy.delete(self.model_class).where(
+                            self.model_class.expires_at < now
+                        )
+                    )
+        except exc.IntegrityError:
+            # another worker stored the same key first, its response is the one replayed
+            pass
+
+
+async def read_body(
+    receive: types.Receive, max_size: int
+) -> tuple[bytes | None, types.Receive]:
+    """
+    Reads whole request body, returns it with a receive that gives it to the app again.
+    Body is None when it's larger than `max_size`.
+    """
+    chunks = []
+    size = 0
+    more_body = True
+    disconnect = None
+    while more_body:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            disconnect = message
+            break
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > max_size:
+            return None, receive
+        chunks.append(chunk)
+        more_body = message.get("more_body", False)
+    body = b"".join(chunks)
+    sent = False
+
+    async def replay() -> types.Message:
+        nonlocal sent
+        if disconnect is not None:
+            return disconnect
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return body, replay
+
+
+def content_length(scope: types.Scope) -> int:
+    for name, value in scope["headers"]:
+        if name == b"content-length":
+            try:
+                return int(value)
+            except ValueError:
+                return 0
+    return 0
+
+
+class IdempotencyMiddleware:
+    def __init__(
+        self,
+        app: types.ASGIApp,
+        store: IdempotencyStore,
+        header: str = "Idempotency-Key",
+        methods: list[str] | None = None,
+        max_body_size: int = 1_000_000,
+        max_request_size: int = 1_000_000,
+        wait_timeout: float = 10,
+    ) -> None:
+        self.app = app
+        self.store = store
+        self.header = header.lower().encode()
+        self.methods = set(methods or ["POST", "PATCH"])
+        self.max_body_size = max_body_size
+        self.max_request_size = max_request_size
+        self.wait_timeout = wait_timeout
+        self.in_flight: dict[str, asyncio.Future] = {}
+
+    def get_key(self, scope: types.Scope) -> str | None:
+        idempotency_key = None
+        user = {name: b"" for name in SCOPE_HEADERS}
+        for name, value in scope["headers"]:
+            if name == self.header:
+                idempotency_key = value
+            elif name in user:
+                user[name] = value
+        if idempotency_key is None:
+            return None
+        key = b"\0".join(
+            (
+                *user.values(),
+                scope["method"].encode(),
+                scope["path"].encode(),
+                idempotency_key,
+            )
+        )
+        return hashlib.sha256(key).hexdigest()
+
+    async def __call__(
+        self, scope: types.Scope, receive: types.Receive, send: types.Send
+    ) -> None:
+        if scope["type"] != "http" or scope["method"] not in self.methods:
+            await self.app(scope, receive, send)
+            return
+        key = self.get_key(scope)
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+        body = None
+        if content_length(scope) <= self.max_request_size:
+            body, receive = await read_body(receive, self.max_request_size)
+        if body is None:
+            response = responses.PlainTextResponse(
+                "Request body is too large for an idempotency key", status_code=413
+            )
+            await response(scope, receive, send)
+            return
+        fingerprint = hashlib.sha256(body).hexdigest()
+        while True:
+            original = self.in_flight.get(key)
+            if original is not None:
+                try:
+                    await asyncio.wait_for(asyncio.shield(original), self.wait_timeout)
+                except asyncio.TimeoutError:
+                    response = responses.PlainTextResponse(
+                        "A request with this idempotency key is in progress",
+                        status_code=409,
+                    )
+                    await response(scope, receive, send)
+                    return
+                continue
+            stored = await self.store.get(key)
+            if stored is not None:
+                await self.replay(stored, fingerprint, scope, receive, send)
+                return
+            # another duplicate may have started while store was read
+            if key not in self.in_flight:
+                break
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            await self.run(key, fingerprint, scope, receive, send)
+        finally:
+            del self.in_flight[key]
+            future.set_result(None)
+
+    async def replay(
+        self,
+        stored: StoredResponse,
+        fingerprint: str,
+        scope: types.Scope,
+        receive: types.Receive,
+        send: types.Send,
+    ) -> None:
+        if stored.fingerprint != fingerprint:
+            response = responses.PlainTextResponse(
+                "Idempotency key is already used with another request body",
+                status_code=422,
+            )
+            await response(scope, receive, send)
+            return
+        await send(
+            {
+                "type": "http.response.start",
+                "status": stored.status,
+                "headers": stored.headers + [(b"idempotent-replayed", b"true")],
+            }
+        )
+        await send({"type": "http.response.body", "body": stored.body})
+
+    async def run(
+        self,
+        key: str,
+        fingerprint: str,
+        scope: types.Scope,
+        receive: types.Receive,
+        send: types.Send,
+    ) -> None:
+        start: types.Message | None = None
+        chunks: list[bytes] = []
+        size = 0
+        storable = True
+        complete = False
+
+        async def send_wrapper(message: types.Message) -> None:
+            nonlocal start, size, storable, complete
+            if message["type"] == "http.response.start":
+                # copied since outer middlewares may add headers in place
+                start = {**message, "headers": list(message.get("headers", []))}
+                storable = message["status"] < 500
+            elif message["type"] == "http.response.body" and storable:
+                body = message.get("body", b"")
+                size += len(body)
+                if size > self.max_body_size:
+                    storable = False
+                    chunks.clear()
+                else:
+                    chunks.append(body)
+                complete = not message.get("more_body", False)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+        if start is not None and storable and complete:
+            await self.store.put(
+                key,
+                StoredResponse(
+                    fingerprint=fingerprint,
+                    status=start["status"],
+                    headers=list(start.get("headers", [])),
+                    body=b"".join(chunks),
+                ),
+            )
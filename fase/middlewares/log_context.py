@@ -0,0 +1,55 @@
+"""
+Sets `request_id` and `trace_id` fields of log context for each request.
+
+Request id is taken from `X-Request-ID` header or generated, and returned in
+the same response header. Trace id is taken from W3C `traceparent` header.
+"""
+import secrets
+
+from starlette import types
+
+from fase.utils import logging
+
+
+def trace_id_from(traceparent: bytes) -> str | None:
+    parts = traceparent.split(b"-")
+    if len(parts) < 4 or len(parts[1]) != 32:
+        return None
+    return parts[1].decode("latin-1")
+
+
+class LogContextMiddleware:
+    def __init__(self, app: types.ASGIApp, header: str = "X-Request-ID") -> None:
+        self.app = app
+        self.header = header.lower().encode()
+
+    async def __call__(
+        self, scope: types.Scope, receive: types.Receive, send: types.Send
+    ) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        context = {}
+        for name, value in scope["headers"]:
+            if name == self.header:
+                request_id = value.decode("latin-1")[:128]
+            elif name == b"traceparent":
+                trace_id = trace_id_from(value)
+                if trace_id is not None:
+                    context["trace_id"] = trace_id
+        context["request_id"] = request_id = request_id or secrets.token_hex(16)
+        encoded_request_id = request_id.encode("latin-1")
+
+        async def send_wrapper(message: types.Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (self.header, encoded_request_id)
+                ]
+            await send(message)
+
+        token = logging.log_context.set(context)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            logging.log_context.reset(token)
@@ -0,0 +1,256 @@
+"""
+Prometheus text format metrics without any dependency.
+
+Usage:
+    fp.add_metrics(config.MetricsConfig(path="/metrics"))
+"""
+import abc
+import bisect
+import time
+from typing import Any, Callable, Iterable
+
+from starlette import types
+
+from fase.db import connection
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+OVERFLOW = "other"
+UNMATCHED = "unmatched"
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric(abc.ABC):
+    type = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        max_series: int = 1000,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.max_series = max_series
+        self.series: dict[tuple[str, ...], object] = {}
+        self.overflow_labels = (OVERFLOW,) * len(self.labelnames)
+
+    def key(self, labels: tuple[str, ...]) -> tuple[str, ...]:
+        # new label sets after `max_series` are folded into one series
+        # so a misbehaving label can't grow memory without a bound
+        if labels in self.series or len(self.series) < self.max_series:
+            return labels
+        return self.overflow_labels
+
+    def format_labels(self, labels: tuple[str, ...], **extra: str) -> str:
+        pairs = [
+            f'{name}="{escape(value)}"' for name, value in zip(self.labelnames, labels)
+        ]
+        pairs.extend(f'{name}="{value}"' for name, value in extra.items())
+        if not pairs:
+            return ""
+        return "{" + ",".join(pairs) + "}"
+
+    @abc.abstractmethod
+    def samples(self) -> Iterable[str]:
+        pass
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        yield from self.samples()
+
+
+class Counter(Metric):
+    type = "counter"
+    series: dict[tuple[str, ...], float]  # type: ignore[assignment]
+
+    def inc(self, labels: tuple[str, ...] = (), value: float = 1) -> None:
+        key = self.key(labels)
+        self.series[key] = self.series.get(key, 0) + value
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in self.series.items():
+            yield f"{self.name}{self.format_labels(labels)} {format_value(value)}"
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, labels: tuple[str, ...] = ()) -> None:
+        self.series[self.key(labels)] = value
+
+    def dec(self, labels: tuple[str, ...] = (), value: float = 1) -> None:
+        self.inc(labels, -value)
+
+
+class Histogram(Metric):
+    type = "histogram"
+    # labels -> [bucket counts..., sum, count]
+    series: dict[tuple[str, ...], list[float]]  # type: ignore[assignment]
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        max_series: int = 1000,
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames, max_series)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, labels: tuple[str, ...] = ()) -> None:
+        key = self.key(labels)
+        data = self.series.get(key)
+        if data is None:
+            data = self.series[key] = [0] * (len(self.buckets) + 2)
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            data[index] += 1
+        data[-2] += value
+        data[-1] += 1
+
+    def samples(self) -> Iterable[str]:
+        for labels, data in self.series.items():
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, data):
+                cumulative += count
+                yield f"{self.name}_bucket{self.format_labels(labels, le=format_value(bound))} {format_value(cumulative)}"
+            yield f"{self.name}_bucket{self.format_labels(labels, le='+Inf')} {format_value(data[-1])}"
+            yield f"{self.name}_sum{self.format_labels(labels)} {format_value(data[-2])}"
+            yield f"{self.name}_count{self.format_labels(labels)} {format_value(data[-1])}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: dict[str, Metric] = {}
+        self.collectors: dict[Any, Callable[[], None]] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """
+        Returns already registered metric with the same name if there is one
+        """
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = (), **kwargs) -> Counter:
+        return self.register(Counter(name, documentation, labelnames, **kwargs))  # type: ignore[return-value]
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = (), **kwargs) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, **kwargs))  # type: ignore[return-value]
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), **kwargs) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, **kwargs))  # type: ignore[return-value]
+
+    def add_collector(self, collector: Callable[[], None], name: str | None = None) -> None:
+        """
+        `collector` is called before each render to update gauges,
+        it replaces the collector already added with the same `name`
+        """
+        self.collectors[name or collector] = collector
+
+    def render(self) -> str:
+        for collector in self.collectors.values():
+            collector()
+        lines = [line for metric in self.metrics.values() for line in metric.render()]
+        lines.append("")
+        return "\n".join(lines)
+
+
+REGISTRY = Registry()
+
+
+def collect_db_pool(registry: Registry = REGISTRY) -> Callable[[], None]:
+    gauge = registry.gauge(
+        "fase_db_pool_connections",
+        "Connections of the engine pool by state",
+        ("state",),
+    )
+
+    def collector() -> None:
+        engine = connection.ConnectionConfigure.get_engine()
+        if engine is None:
+            return
+        pool = engine.pool
+        for state in ("size", "checkedin", "checkedout", "overflow"):
+            value = getattr(pool, state, None)
+            if callable(value):
+                # QueuePool.overflow() starts at -size and only counts up past it
+                gauge.set(max(0, value()), (state,))
+
+    return collector
+
+
+class MetricsMiddleware:
+    def __init__(
+        self,
+        app: types.ASGIApp,
+        registry: Registry = REGISTRY,
+        max_series: int = 1000,
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.app = app
+        labels = ("method", "route", "status")
+        self.requests = registry.counter(
+            "fase_http_requests_total", "Count of requests", labels, max_series=max_series
+        )
+        self.latency = registry.histogram(
+            "fase_http_request_duration_seconds",
+            "Latency of requests",
+            labels,
+            max_series=max_series,
+            buckets=buckets,
+        )
+        self.response_size = registry.histogram(
+            "fase_http_response_size_bytes",
+            "Size of response bodies",
+            labels,
+            max_series=max_series,
+            buckets=SIZE_BUCKETS,
+        )
+        self.in_flight = registry.gauge(
+            "fase_http_requests_in_flight", "Requests being processed"
+        )
+
+    async def __call__(
+        self, scope: types.Scope, receive: types.Receive, send: types.Send
+    ) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_wrapper(message: types.Message) -> None:
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        self.in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.in_flight.dec()
+            # route template is set by fastapi router, raw path would make labels unbounded
+            route = getattr(scope.get("route"), "path", UNMATCHED)
+            labels = (scope["method"], route, str(status))
+            self.requests.inc(labels)
+            self.latency.observe(time.perf_counter() - start, labels)
+            self.response_size.observe(size, labels)
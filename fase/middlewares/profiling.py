@@ -0,0 +1,210 @@
+"""
+Profiles single requests on demand.
+
+A request is profiled when it has `X-Fase-Profile: <token>` header or it's picked
+by `sample_rate`. Profile is written to `output_dir`, where only the newest
+`max_files` profiles are kept. For requests with the token its file name is returned
+in `X-Fase-Profile` response header, with time spent in db in `X-Fase-Db-Time`.
+
+pyinstrument is used when it's installed (speedscope output, only the profiled
+request is recorded), otherwise cProfile (pstats output, everything running on
+the loop while request is profiled is recorded).
+"""
+import abc
+import asyncio
+import contextvars
+import cProfile
+import os
+import random
+import re
+import secrets
+import time
+
+from sqlalchemy import Engine, event
+from starlette import datastructures, types
+
+from fase.core import config
+
+try:
+    import pyinstrument
+    from pyinstrument import renderers
+except ImportError:  # pragma: no cover
+    pyinstrument = None
+
+# [seconds, count] of db statements of profiled request
+db_timings: contextvars.ContextVar[list[float] | None] = contextvars.ContextVar(
+    "db_timings", default=None
+)
+_listening = False
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if db_timings.get() is not None:
+        conn.info.setdefault("fase_profile_start", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timings = db_timings.get()
+    if timings is None:
+        return
+    starts = conn.info.get("fase_profile_start")
+    if starts:
+        timings[0] += time.perf_counter() - starts.pop()
+        timings[1] += 1
+
+
+def listen_db() -> None:
+    """
+    Listeners are added only when profiling is enabled so queries don't pay for it otherwise
+    """
+    global _listening
+    if _listening:
+        return
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+    _listening = True
+
+
+class Profile(abc.ABC):
+    extension = ""
+
+    @abc.abstractmethod
+    def start(self) -> None:
+        pass
+
+    @abc.abstractmethod
+    def stop(self) -> None:
+        pass
+
+    @abc.abstractmethod
+    def save(self, path: str) -> None:
+        pass
+
+
+class CProfile(Profile):
+    extension = ".pstats"
+
+    def __init__(self) -> None:
+        self.profile = cProfile.Profile()
+
+    def start(self) -> None:
+        self.profile.enable()
+
+    def stop(self) -> None:
+        self.profile.disable()
+
+    def save(self, path: str) -> None:
+        self.profile.dump_stats(path)
+
+
+class PyinstrumentProfile(Profile):
+    extension = ".speedscope.json"
+
+    def __init__(self, interval: float) -> None:
+        self.profiler = pyinstrument.Profiler(interval=interval, async_mode="enabled")
+
+    def start(self) -> None:
+        self.profiler.start()
+
+    def stop(self) -> None:
+        self.profiler.stop()
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as f:
+            f.write(self.profiler.output(renderer=renderers.SpeedscopeRenderer()))
+
+
+EXTENSIONS = (CProfile.extension, PyinstrumentProfile.extension)
+
+
+def save_profile(profile: Profile, path: str, max_files: int) -> None:
+    """
+    Saves `profile` to `path` and removes the oldest profiles past `max_files`
+    """
+    profile.save(path)
+    files = []
+    with os.scandir(os.path.dirname(path)) as entries:
+        for entry in entries:
+            if not entry.name.endswith(EXTENSIONS):
+                continue
+            try:
+                files.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                # removed by another worker
+                pass
+    files.sort()
+    for _, old_path in files[: max(0, len(files) - max_files)]:
+        try:
+            os.remove(old_path)
+        except FileNotFoundError:
+            pass
+
+
+class ProfilingMiddleware:
+    def __init__(self, app: types.ASGIApp, profiling_config: config.ProfilingConfig) -> None:
+        self.app = app
+        self.config = profiling_config
+        self.header = profiling_config.header.lower()
+        self.use_pyinstrument = pyinstrument is not None
+        # only one cProfile can be active in a thread
+        self.max_concurrent = (
+            profiling_config.max_concurrent if self.use_pyinstrument else 1
+        )
+        self.active = 0
+        os.makedirs(profiling_config.output_dir, exist_ok=True)
+        listen_db()
+
+    def has_token(self, scope: types.Scope) -> bool:
+        if not self.config.token:
+            return False
+        value = datastructures.Headers(scope=scope).get(self.header)
+        return value is not None and secrets.compare_digest(
+            value.encode(), self.config.token.encode()
+        )
+
+    def is_sampled(self) -> bool:
+        return self.config.sample_rate > 0 and random.random() < self.config.sample_rate
+
+    def create_profile(self) -> Profile:
+        if self.use_pyinstrument:
+            return PyinstrumentProfile(self.config.interval)
+        return CProfile()
+
+    def get_path(self, scope: types.Scope, profile: Profile) -> str:
+        path = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_") or "root"
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{scope['method']}-{path}-{secrets.token_hex(4)}"
+        return os.path.join(self.config.output_dir, name + profile.extension)
+
+    async def __call__(
+        self, scope: types.Scope, receive: types.Receive, send: types.Send
+    ) -> None:
+        if scope["type"] != "http" or self.active >= self.max_concurrent:
+            await self.app(scope, receive, send)
+            return
+        # only requests with the token learn about the profile
+        requested = self.has_token(scope)
+        if not requested and not self.is_sampled():
+            await self.app(scope, receive, send)
+            return
+        profile = self.create_profile()
+        path = self.get_path(scope, profile)
+        timings = [0.0, 0]
+
+        async def send_wrapper(message: types.Message) -> None:
+            if message["type"] == "http.response.start" and requested:
+                headers = datastructures.MutableHeaders(scope=message)
+                headers[self.config.header] = os.path.basename(path)
+                headers["X-Fase-Db-Time"] = f"{timings[0]:.6f};count={timings[1]}"
+            await send(message)
+
+        self.active += 1
+        token = db_timings.set(timings)
+        profile.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.stop()
+            db_timings.reset(token)
+            self.active -= 1
+            # rendering and writing a large profile would block the loop
+            await asyncio.to_thread(save_profile, profile, path, self.config.max_files)
@@ -0,0 +1,236 @@
+"""
+Token bucket rate limiting.
+
+Usage:
+    fp.add_rate_limit(config.RateLimitConfig(default=config.RateLimitRule(100, 60)))
+
+    router = fastapi.APIRouter(dependencies=[RateLimiter(5, 60).dep()])
+
+Behind a load balancer set `trusted_proxies` to its addresses, client address
+is then taken from `X-Forwarded-For` header added by them.
+"""
+import abc
+import ipaddress
+import math
+import time
+from typing import Iterable
+
+import fastapi
+from starlette import responses, types
+
+from fase import users
+from fase.core import config
+
+IP = "ip"
+USER = "user"
+ROUTE = "route"
+
+
+class RateLimitBackend(abc.ABC):
+    """
+    Shared state of buckets, implement it on top of a shared store
+    (redis, database, ...) when running more than one worker
+    """
+
+    @abc.abstractmethod
+    async def hit(self, key: str, requests: int, period: float) -> float:
+        """
+        Takes one token from bucket of `key`
+
+        Returns:
+            0 if request is allowed otherwise seconds until next token
+        """
+
+
+class MemoryBackend(RateLimitBackend):
+    def __init__(self, compact_interval: float = 60) -> None:
+        self.compact_interval = compact_interval
+        # key -> [tokens, updated_at, period]
+        self.buckets: dict[str, list[float]] = {}
+        self.next_compaction = time.monotonic() + compact_interval
+
+    async def hit(self, key: str, requests: int, period: float) -> float:
+        return self.take(key, requests, period)
+
+    def take(self, key: str, requests: int, period: float) -> float:
+        now = time.monotonic()
+        if now >= self.next_compaction:
+            self.compact(now)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            self.buckets[key] = [requests - 1, now, period]
+            return 0
+        rate = requests / period
+        tokens = min(requests, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0
+        bucket[0] = tokens
+        return (1 - tokens) / rate
+
+    def compact(self, now: float) -> None:
+        # a bucket that has been idle for a whole period is full again,
+        # so it's the same as a missing one
+        self.buckets = {
+            key: bucket
+            for key, bucket in self.buckets.items()
+            if now - bucket[1] < bucket[2]
+        }
+        self.next_compaction = now + self.compact_interval
+
+
+def retry_after_headers(retry_after: float) -> dict[str, str]:
+    return {"Retry-After": str(math.ceil(retry_after))}
+
+
+Network = ipaddress.IPv4Network | ipaddress.IPv6Network
+
+
+def parse_networks(addresses: Iterable[str]) -> list[Network]:
+    return [ipaddress.ip_network(address, strict=False) for address in addresses]
+
+
+def is_trusted(address: str, trusted_proxies: list[Network]) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted_proxies)
+
+
+def client_ip(scope: types.Scope, trusted_proxies: list[Network] | None = None) -> str:
+    """
+    Address of peer, or when peer is a trusted proxy, the rightmost address of
+    `X-Forwarded-For` not added by a trusted proxy. Addresses left of it are
+    sent by the client and can't be trusted.
+    """
+    client = scope.get("client")
+    ip = client[0] if client else "unknown"
+    if not trusted_proxies or not is_trusted(ip, trusted_proxies):
+        return ip
+    forwarded = b",".join(
+        value for name, value in scope["headers"] if name == b"x-forwarded-for"
+    )
+    for address in reversed(forwarded.decode("latin-1").split(",")):
+        address = address.strip()
+        if not address:
+            continue
+        if not is_trusted(address, trusted_proxies):
+            return address
+        ip = address
+    return ip
+
+
+class RateLimitMiddleware:
+    """
+    Rejects requests before they reach routing, so no db session is opened for them.
+
+    Token is not verified yet here, so `user` key falls back to client address,
+    use `RateLimiter` with `user` key to limit by verified token subject.
+    """
+
+    def __init__(
+        self,
+        app: types.ASGIApp,
+        rate_limit_config: config.RateLimitConfig,
+        backend: RateLimitBackend | None = None,
+    ) -> None:
+        self.app = app
+        self.backend = backend or MemoryBackend(rate_limit_config.compact_interval)
+        self.configure(rate_limit_config)
+
+    def configure(self, rate_limit_config: config.RateLimitConfig) -> None:
+        self.trusted_proxies = parse_networks(rate_limit_config.trusted_proxies)
+        self.default = rate_limit_config.default
+        self.paths = sorted(
+            rate_limit_config.paths.items(),
+            key=lambda item: len(item[0]),
+            reverse=True,
+        )
+
+    def match(self, path: str) -> tuple[str, config.RateLimitRule | None]:
+        for prefix, rule in self.paths:
+            if path.startswith(prefix):
+                return prefix, rule
+        return "*", self.default
+
+    def get_key(self, rule: config.RateLimitRule, scope: types.Scope) -> str:
+        if rule.key == ROUTE:
+            return ""
+        return client_ip(scope, self.trusted_proxies)
+
+    async def __call__(
+        self, scope: types.Scope, receive: types.Receive, send: types.Send
+    ) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        prefix, rule = self.match(scope["path"])
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+        retry_after = await self.backend.hit(
+            f"{prefix}:{self.get_key(rule, scope)}",
+            rule.requests,
+            rule.period,
+        )
+        if retry_after:
+            response = responses.PlainTextResponse(
+                "Too Many Requests",
+                status_code=429,
+                headers=retry_after_headers(retry_after),
+            )
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+
+class RateLimiter:
+    """
+    Per router/route limiter, put it before dependencies that open a db session
+
+    Example:
+        router = fastapi.APIRouter(dependencies=[RateLimiter(5, 60).dep()])
+    """
+
+    def __init__(
+        self,
+        requests: int,
+        period: float,
+        key: str = IP,
+        backend: RateLimitBackend | None = None,
+        trusted_proxies: list[str] | None = None,
+    ) -> None:
+        if key not in (IP, USER, ROUTE):
+            raise ValueError(f"unknown rate limit key {key}")
+        self.requests = requests
+        self.period = period
+        self.key = key
+        self.backend = backend or MemoryBackend()
+        self.trusted_proxies = parse_networks(trusted_proxies or [])
+
+    async def check(self, key: str) -> None:
+        retry_after = await self.backend.hit(key, self.requests, self.period)
+        if retry_after:
+            raise fastapi.HTTPException(
+                status_code=fastapi.status.HTTP_429_TOO_MANY_REQUESTS,
+                headers=retry_after_headers(retry_after),
+            )
+
+    def dep(self):
+        if self.key == USER:
+
+            async def user_dependency(user_uid: users.deps.UserUID):
+                await self.check(f"user:{user_uid}")
+
+            return fastapi.Depends(user_dependency)
+
+        async def dependency(request: fastapi.Request):
+            if self.key == ROUTE:
+                route = request.scope.get("route")
+                await self.check(f"route:{getattr(route, 'path', request.url.path)}")
+            else:
+                await self.check(f"ip:{client_ip(request.scope, self.trusted_proxies)}")
+
+        return fastapi.Depends(dependency)
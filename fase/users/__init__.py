@@ -1,4 +1,18 @@
-from fase.users import deps
-from fase.users import routes
-from fase.users import user_manager
-from fase.users.user_manager import UserManagerInterface, DBUserManager
+from typing import TYPE_CHECKING
+
+from fase.utils import lazy
+
+if TYPE_CHECKING:
+    from fase.users import deps, routes, user_manager
+    from fase.users.user_manager import DBUserManager, UserManagerInterface
+
+__getattr__, __dir__ = lazy.attributes(
+    __name__,
+    {
+        "deps": ("fase.users.deps", None),
+        "routes": ("fase.users.routes", None),
+        "user_manager": ("fase.users.user_manager", None),
+        "UserManagerInterface": ("fase.users.user_manager", "UserManagerInterface"),
+        "DBUserManager": ("fase.users.user_manager", "DBUserManager"),
+    },
+)
@@ -4,6 +4,7 @@ import authx
 import fastapi
 
 from fase.users import user_manager
+from fase.utils import logging, tracing
 
 
 def get_user_manager() -> user_manager.UserManagerInterface:
@@ -20,14 +21,19 @@ def token_payload(
     request: fastapi.Request,
     user_manager: UserManager,
 ) -> authx.TokenPayload:
-    return user_manager.get_token_and_verify(request)
+    with tracing.span("auth.verify_token"):
+        payload = user_manager.get_token_and_verify(request)
+    request.state.token_payload = payload
+    logging.bind(user=payload.sub)
+    return payload
 
 
 async def token(
     request: fastapi.Request,
     user_manager: UserManager,
 ) -> authx.RequestToken | None:
-    return await user_manager.get_token_from_request(request)
+    with tracing.span("auth.get_token"):
+        return await user_manager.get_token_from_request(request)
 
 
 Token = Annotated[authx.TokenPayload, fastapi.Depends(token)]
@@ -1,6 +1,8 @@
 import time
+import weakref
 from datetime import timedelta
 from typing import Any
+from typing import Callable
 from typing import Generic
 from typing import TypeVar
 
@@ -15,14 +17,55 @@ class __UNSET:
 
 UNSET = __UNSET()
 
+# every live cache, used by diagnostics to report sizes
+CACHES: "weakref.WeakSet[Cache]" = weakref.WeakSet()
+
 
 class Cache(Generic[T]):
-    def __init__(self, ttl: timedelta | None) -> None:
+    def __init__(
+        self,
+        ttl: timedelta | None,
+        name: str | None = None,
+        max_size: int | None = None,
+        max_weight: int | None = None,
+        weigh: Callable[[T], int] | None = None,
+    ) -> None:
         self.ttl = ttl.total_seconds() if ttl else None
+        self.name = name
+        # oldest entries are evicted when size goes over max_size,
+        # or sum of weigh(value) goes over max_weight
+        self.max_size = max_size
+        self.max_weight = max_weight
+        self.weigh = weigh
+        self.weight = 0
         self.data: dict[str, tuple[T, float]] = {}
+        CACHES.add(self)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def _remove(self, key: str) -> tuple[T, float] | None:
+        value_time = self.data.pop(key, None)
+        if value_time is not None and self.weigh is not None:
+            self.weight -= self.weigh(value_time[0])
+        return value_time
 
     def put(self, key: str, value: T) -> None:
+        # re-inserted so dict order stays the order of put
+        self._remove(key)
         self.data[key] = (value, time.time())
+        if self.weigh is not None:
+            self.weight += self.weigh(value)
+        if self.max_size is not None:
+            while len(self.data) > self.max_size:
+                self._remove(next(iter(self.data)))
+        if self.max_weight is not None:
+            while self.weight > self.max_weight:
+                self._remove(next(iter(self.data)))
+
+    def pop(self, key: str, default: Any = None) -> T | None:
+        value_time = self._remove(key)
+        return default if value_time is None else value_time[0]
 
     def get(self, key: str, default: Any = UNSET) -> T:
         value_time = self.data.get(key, None)
@@ -32,7 +75,7 @@ class Cache(Generic[T]):
             raise KeyError(key)
         value, create_time = value_time
         if self.ttl and time.time() - create_time > self.ttl:
-            self.data.pop(key)
+            self._remove(key)
             if default != UNSET:
                 return default
             raise KeyError(key)
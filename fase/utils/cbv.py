@@ -3,11 +3,17 @@ This is based on
 https://github.com/yuval9313/FastApi-RESTful/tree/master
 """
 import inspect
+from typing import Annotated
 from typing import Any
 from typing import Callable
-from typing import cast
+from typing import Dict
+from typing import FrozenSet
+from typing import get_args
+from typing import get_origin
 from typing import get_type_hints
 from typing import List
+from typing import Optional
+from typing import Set
 from typing import Tuple
 from typing import Type
 from typing import TypeVar
@@ -16,6 +22,7 @@ from typing import Union
 import pydantic
 from fastapi import APIRouter
 from fastapi import Depends
+from fastapi import params
 from fastapi.routing import APIRoute
 from starlette.routing import Route
 from starlette.routing import WebSocketRoute
@@ -31,9 +38,13 @@ T = TypeVar("T")
 CBV_CLASS_KEY = "__cbv_class__"
 INCLUDE_INIT_PARAMS_KEY = "__include_init_params__"
 RETURN_TYPES_FUNC_KEY = "__return_types_func__"
+ROUTER_INDEX_KEY = "__cbv_index__"
+STATELESS_DEPENDENCY_KEY = "__cbv_stateless_dependency__"
 
 
-def cbv(router: APIRouter, *urls: str) -> Callable[[Type[T]], Type[T]]:
+def cbv(
+    router: APIRouter, *urls: str, stateless: bool = False
+) -> Callable[[Type[T]], Type[T]]:
     """
     This function returns a decorator that converts the decorated into a class-based view for the provided router.
 
@@ -44,6 +55,10 @@ def cbv(router: APIRouter, *urls: str) -> Callable[[Type[T]], Type[T]]:
     For more detail, review the documentation at
     https://fastapi-restful.netlify.app/user-guide/class-based-views//#the-cbv-decorator
 
+    With `stateless=True` the class is instantiated once, on first request. Only class attributes
+    with `Depends` are resolved for each request, and set on a shallow copy of that instance.
+    Other class attributes are not treated as request parameters.
+
     Example:
         @cbv(router)
         class ItemCBV:
@@ -54,17 +69,25 @@ def cbv(router: APIRouter, *urls: str) -> Callable[[Type[T]], Type[T]]:
 
     def decorator(cls: Type[T]) -> Type[T]:
         # Define cls as cbv class exclusively when using the decorator
-        return _cbv(router, cls, *urls)
+        return _cbv(router, cls, *urls, stateless=stateless)
 
     return decorator
 
 
-def _cbv(router: APIRouter, cls: Type[T], *urls: str, instance: Any = None) -> Type[T]:
+def _cbv(
+    router: APIRouter,
+    cls: Type[T],
+    *urls: str,
+    instance: Any = None,
+    stateless: bool = False,
+) -> Type[T]:
     """
     Replaces any methods of the provided class `cls` that are endpoints of routes in `router` with updated
     function calls that will properly inject an instance of `cls`.
     """
     _init_cbv(cls, instance)
+    if stateless:
+        _init_stateless_cbv(cls, instance)
     _register_endpoints(router, cls, *urls)
     return cls
 
@@ -117,62 +140,148 @@ def _init_cbv(cls: Type[Any], instance: Any = None) -> None:
         else:
             old_init(self, *args, **kwargs)
 
+    setattr(new_init, "__wrapped__", old_init)
     setattr(cls, "__signature__", new_signature)
     setattr(cls, "__init__", new_init)
     setattr(cls, CBV_CLASS_KEY, True)
 
 
+def _is_request_scoped(cls: Type[Any], name: str, hint: Any) -> bool:
+    if isinstance(getattr(cls, name, None), params.Depends):
+        return True
+    return get_origin(hint) is Annotated and any(
+        isinstance(metadata, params.Depends) for metadata in get_args(hint)[1:]
+    )
+
+
+def _init_stateless_cbv(cls: Type[Any], instance: Any = None) -> None:
+    """
+    Sets a dependency on `cls` that resolves only request-scoped attributes, and sets them on a shallow
+    copy of an instance made once. Unlike `Depends(cls)` it runs on the event loop, not in threadpool.
+    """
+    old_init: Callable[..., Any] = getattr(cls.__init__, "__wrapped__", cls.__init__)
+    request_parameters = [
+        inspect.Parameter(
+            name=name,
+            kind=inspect.Parameter.KEYWORD_ONLY,
+            annotation=hint,
+            default=getattr(cls, name, Ellipsis),
+        )
+        for name, hint in get_type_hints(cls, include_extras=True).items()
+        if not is_classvar(hint) and _is_request_scoped(cls, name, hint)
+    ]
+    shared: List[Any] = [instance] if instance else []
+
+    async def resolve(**request_values: Any) -> Any:
+        if not shared:
+            view = object.__new__(cls)
+            old_init(view)
+            shared.append(view)
+        view = object.__new__(cls)
+        view.__dict__ = {**shared[0].__dict__, **request_values}
+        return view
+
+    setattr(resolve, "__signature__", inspect.Signature(request_parameters))
+    setattr(cls, STATELESS_DEPENDENCY_KEY, resolve)
+
+
+class _RouterIndex:
+    """
+    Roles and endpoint positions of routes of a router, each route is indexed once
+    so registering a class only looks at its own routes
+    """
+
+    def __init__(self) -> None:
+        self.size = 0
+        self.roles: Set[Tuple[str, FrozenSet[str]]] = set()
+        self.positions: Dict[Any, List[int]] = {}
+
+    def update(self, routes: List[Any]) -> None:
+        for position in range(self.size, len(routes)):
+            route = routes[position]
+            if not isinstance(route, APIRoute):
+                raise ValueError("The provided routes should be of type APIRoute")
+            route_methods: Any = route.methods
+            role = (route.path, frozenset(route_methods))
+            if role in self.roles:
+                raise Exception(
+                    "An identical route role has been implemented more then once"
+                )
+            self.roles.add(role)
+            self.positions.setdefault(route.endpoint, []).append(position)
+        self.size = len(routes)
+
+    def find(self, routes: List[Any], functions: Set[Any]) -> Optional[List[int]]:
+        """
+        Sorted positions of routes of `functions`, None when routes were removed
+        from router outside of cbv and positions are stale
+        """
+        positions = []
+        for func in functions:
+            for position in self.positions.get(func, ()):
+                if position >= len(routes) or routes[position].endpoint is not func:
+                    return None
+                positions.append(position)
+        return sorted(positions)
+
+
+def _get_router_index(router: APIRouter, rebuild: bool = False) -> _RouterIndex:
+    index = getattr(router, ROUTER_INDEX_KEY, None)
+    if rebuild or index is None or index.size > len(router.routes):
+        index = _RouterIndex()
+        setattr(router, ROUTER_INDEX_KEY, index)
+    index.update(router.routes)
+    return index
+
+
 def _register_endpoints(router: APIRouter, cls: Type[Any], *urls: str) -> None:
     cbv_router = APIRouter()
     function_members = inspect.getmembers(cls, inspect.isfunction)
+    index = _get_router_index(router)
     for url in urls:
-        _allocate_routes_by_method_name(router, url, function_members)
-    router_roles = []
-    for route in router.routes:
-        if not isinstance(route, APIRoute):
-            raise ValueError("The provided routes should be of type APIRoute")
-
-        route_methods: Any = route.methods
-        cast(Tuple[Any], route_methods)
-        router_roles.append((route.path, tuple(route_methods)))
-
-    if len(set(router_roles)) != len(router_roles):
-        raise Exception("An identical route role has been implemented more then once")
+        _allocate_routes_by_method_name(router, url, function_members, index)
+    index.update(router.routes)
 
     functions_set = {func for _, func in function_members}
-    cbv_routes = [
-        route
-        for route in router.routes
-        if isinstance(route, (Route, WebSocketRoute))
-        and route.endpoint in functions_set
-    ]
+    positions = index.find(router.routes, functions_set)
+    if positions is None:
+        positions = (
+            _get_router_index(router, rebuild=True).find(router.routes, functions_set)
+            or []
+        )
     prefix_length = len(
         router.prefix
     )  # Until 'black' would fix an issue which causes PEP8: E203
-    for route in cbv_routes:
-        router.routes.remove(route)
+    for position in positions:
+        route = router.routes[position]
         route.path = route.path[prefix_length:]
         _update_cbv_route_endpoint_signature(cls, route)
         route.name = cls.__name__ + "." + route.name
         cbv_router.routes.append(route)
+    size = len(router.routes)
     router.include_router(cbv_router)
+    # included routes take the places of the routes they were made from
+    for position, route in zip(positions, router.routes[size:]):
+        router.routes[position] = route
+    del router.routes[size:]
 
 
 def _allocate_routes_by_method_name(
-    router: APIRouter, url: str, function_members: List[Tuple[str, Any]]
+    router: APIRouter,
+    url: str,
+    function_members: List[Tuple[str, Any]],
+    index: _RouterIndex,
 ) -> None:
-    existing_routes_endpoints: List[Tuple[Any, str]] = [
-        (route.endpoint, route.path)
-        for route in router.routes
-        if isinstance(route, APIRoute)
-    ]
     for name, func in function_members:
         if (
             hasattr(router, name)
             and not name.startswith("__")
             and not name.endswith("__")
         ):
-            if (func, url) not in existing_routes_endpoints:
+            if not any(
+                router.routes[position].path == url
+                for position in index.positions.get(func, ())
+            ):
                 response_model = None
                 responses = None
                 kwargs = {}
@@ -202,7 +311,9 @@ def _update_cbv_route_endpoint_signature(
     old_signature = inspect.signature(old_endpoint)
     old_parameters: List[inspect.Parameter] = list(old_signature.parameters.values())
     old_first_parameter = old_parameters[0]
-    new_first_parameter = old_first_parameter.replace(default=Depends(cls))
+    new_first_parameter = old_first_parameter.replace(
+        default=Depends(cls.__dict__.get(STATELESS_DEPENDENCY_KEY, cls))
+    )
     new_parameters = [new_first_parameter] + [
         parameter.replace(kind=inspect.Parameter.KEYWORD_ONLY)
         for parameter in old_parameters[1:]
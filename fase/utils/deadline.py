@@ -0,0 +1,38 @@
+"""
+Request deadline shared through a contextvar, set by `ConcurrencyMiddleware`
+and read by db sessions to limit statement time.
+"""
+import contextlib
+import contextvars
+import time
+from typing import Iterator
+
+deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar(
+    "deadline", default=None
+)
+
+
+def remaining() -> float | None:
+    """
+    Seconds until deadline of current request, None if there is no deadline
+    """
+    value = deadline.get()
+    if value is None:
+        return None
+    return value - time.monotonic()
+
+
+@contextlib.contextmanager
+def timeout(seconds: float) -> Iterator[None]:
+    """
+    Sets a deadline `seconds` from now, an outer earlier deadline is kept
+    """
+    value = time.monotonic() + seconds
+    current = deadline.get()
+    if current is not None:
+        value = min(value, current)
+    token = deadline.set(value)
+    try:
+        yield
+    finally:
+        deadline.reset(token)
@@ -0,0 +1,41 @@
+"""
+PEP 562 lazy attributes for package `__init__` modules.
+
+Usage:
+    __getattr__, __dir__ = lazy.attributes(
+        __name__,
+        {
+            "db": ("fase.db", None),
+            "FastBase": ("fase.core.app", "FastBase"),
+        },
+    )
+"""
+import importlib
+import sys
+from typing import Any, Callable
+
+
+def attributes(
+    module_name: str,
+    lazy_attributes: dict[str, tuple[str, str | None]],
+) -> tuple[Callable[[str], Any], Callable[[], list[str]]]:
+    """
+    `lazy_attributes` maps attribute name to (module, attribute of module),
+    attribute None means the module itself
+    """
+
+    def __getattr__(name: str) -> Any:
+        if name not in lazy_attributes:
+            raise AttributeError(f"module {module_name!r} has no attribute {name!r}")
+        target_module, target_attribute = lazy_attributes[name]
+        value = importlib.import_module(target_module)
+        if target_attribute is not None:
+            value = getattr(value, target_attribute)
+        # cache it so `__getattr__` is not called again for this name
+        setattr(sys.modules[module_name], name, value)
+        return value
+
+    def __dir__() -> list[str]:
+        return sorted(set(vars(sys.modules[module_name])) | set(lazy_attributes))
+
+    return __getattr__, __dir__
@@ -1,7 +1,17 @@
+import abc
+import atexit
+import contextvars
+import functools
+import json
 import logging.handlers
 import os
+import queue
+import random
 import re
+import string
 import sys
+import time
+from typing import Any
 
 
 class ColorCodes:
@@ -70,6 +80,8 @@ class ColorizedArgsFormatter(logging.Formatter):
         record.args = []
 
     def format(self, record):
+        orig_name = record.name
+        orig_levelname = record.levelname
         record.name = f"[{record.name}]".ljust(17)
         record.levelname = f"[{record.levelname}]".ljust(10)
         orig_msg = record.msg
@@ -77,8 +89,11 @@ class ColorizedArgsFormatter(logging.Formatter):
         formatter = self.level_to_formatter.get(record.levelno)
         self.rewrite_record(record)
         formatted = formatter.format(record)
+        # restore log record to original state for other handlers
         record.msg = orig_msg
         record.args = orig_args
+        record.name = orig_name
+        record.levelname = orig_levelname
         return formatted
 
 
@@ -127,8 +142,325 @@ class BraceFormatStyleFormatter(logging.Formatter):
         return formatted
 
 
-def add_file_handler(level: int | str, path: str):
-    root_logger = logging.getLogger()
+# fields added to every json record, like request_id, trace_id and user
+log_context: contextvars.ContextVar[dict[str, Any] | None] = contextvars.ContextVar(
+    "log_context", default=None
+)
+
+
+def bind(**fields: Any):
+    """
+    Adds fields to log context of current request
+    """
+    context = log_context.get()
+    if context is None:
+        log_context.set(fields)
+    else:
+        # same dict is shared with sync dependencies running in threads
+        context.update(fields)
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_brace_template(msg: str) -> tuple[str, ...] | None:
+    """
+    Literal parts around `{}` placeholders of `msg`, n placeholders give n + 1 parts.
+    None when `msg` is not a template of plain `{}` placeholders
+    """
+    if "%" in msg or "{" not in msg:
+        return None
+    parts = []
+    literal_part = ""
+    try:
+        for literal, field_name, format_spec, conversion in string.Formatter().parse(msg):
+            # escaped braces come as separate literals
+            literal_part += literal
+            if field_name is None:
+                continue
+            if field_name or format_spec or conversion:
+                return None
+            parts.append(literal_part)
+            literal_part = ""
+    except ValueError:
+        return None
+    parts.append(literal_part)
+    return tuple(parts)
+
+
+def render_message(record: logging.LogRecord) -> str:
+    """
+    Interpolates brace style messages in one pass, other messages like `getMessage`
+    """
+    msg = record.msg
+    args = record.args
+    if not args or not isinstance(msg, str) or not isinstance(args, tuple):
+        return record.getMessage()
+    parts = parse_brace_template(msg)
+    if parts is None or len(parts) != len(args) + 1:
+        return record.getMessage()
+    rendered = [parts[0]]
+    for arg, part in zip(args, parts[1:]):
+        rendered.append(str(arg))
+        rendered.append(part)
+    return "".join(rendered)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One json object per line, with fields of `log_context`
+    """
+
+    def __init__(self, static_fields: dict[str, Any] | None = None):
+        super().__init__()
+        self.static_fields = static_fields or {}
+        # json.dumps with arguments creates an encoder on every call
+        self.encode = json.JSONEncoder(default=str, ensure_ascii=False).encode
+        self.second = -1
+        self.second_text = ""
+
+    def format_time(self, created: float) -> str:
+        second = int(created)
+        if second != self.second:
+            self.second_text = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+            self.second = second
+        return f"{self.second_text}.{int((created - second) * 1000):03d}Z"
+
+    def format(self, record):
+        data = {
+            "time": self.format_time(record.created),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": render_message(record),
+            "func": record.funcName,
+            "line": record.lineno,
+            **self.static_fields,
+        }
+        context = getattr(record, "context", None)
+        if context is None:
+            context = log_context.get()
+        if context:
+            data.update(context)
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+            data["exception"] = record.exc_text
+        return self.encode(data)
+
+
+class ContextFilter(logging.Filter):
+    """
+    Copies log context to record, so it's kept when record is formatted in another thread
+    """
+
+    def filter(self, record):
+        context = log_context.get()
+        if context:
+            record.context = dict(context)
+        return True
+
+
+def suppressed_message(msg: Any, suppressed: int) -> str:
+    return f"{msg} (suppressed {suppressed} similar messages)"
+
+
+class SuppressingFilter(logging.Filter, abc.ABC):
+    """
+    Decision is kept on the record, so a filter added to every handler decides
+    once per record. A record passed after suppressed ones tells how many were
+    suppressed.
+
+    Loggers of `get_logger` ask filters before the record is created, see `FilteringLogger`.
+    """
+
+    max_keys = 10000
+
+    def __init__(self):
+        super().__init__()
+        self.attribute = f"_fase_passed_{id(self)}"
+
+    def filter(self, record):
+        passed = record.__dict__.get(self.attribute)
+        if passed is None:
+            passed, suppressed = self.decide(
+                record.name,
+                record.levelno,
+                record.msg,
+                (record.pathname, record.lineno),
+            )
+            if passed and suppressed:
+                record.msg = suppressed_message(record.msg, suppressed)
+            record.__dict__[self.attribute] = passed
+        return passed
+
+    @abc.abstractmethod
+    def decide(
+        self, name: str, level: int, msg: Any, site: tuple[str, int]
+    ) -> tuple[bool, int]:
+        """
+        Returns whether record is passed and number of records suppressed since the last passed one
+        """
+        pass
+
+
+class RateLimitFilter(SuppressingFilter):
+    """
+    Passes at most `rate` records per `period` seconds from each call site
+    """
+
+    def __init__(self, rate: float, period: float = 1):
+        super().__init__()
+        self.rate = rate
+        self.per_second = rate / period
+        # call site -> [tokens, updated, suppressed]
+        self.sites: dict[tuple[str, int], list] = {}
+
+    def decide(self, name, level, msg, site):
+        now = time.monotonic()
+        bucket = self.sites.get(site)
+        if bucket is None:
+            if len(self.sites) >= self.max_keys:
+                self.sites.clear()
+            bucket = self.sites[site] = [self.rate, now, 0]
+        bucket[0] = min(self.rate, bucket[0] + (now - bucket[1]) * self.per_second)
+        bucket[1] = now
+        if bucket[0] < 1:
+            bucket[2] += 1
+            return False, 0
+        bucket[0] -= 1
+        suppressed, bucket[2] = bucket[2], 0
+        return True, suppressed
+
+
+class SamplingFilter(SuppressingFilter):
+    """
+    Passes records with probability of their level, levels not in `rates` are all passed
+    """
+
+    def __init__(self, rates: dict[int | str, float]):
+        super().__init__()
+        self.rates = {
+            logging._checkLevel(level): rate  # type: ignore[attr-defined]
+            for level, rate in rates.items()
+        }
+
+    def decide(self, name, level, msg, site):
+        rate = self.rates.get(level)
+        return rate is None or random.random() < rate, 0
+
+
+class DedupFilter(SuppressingFilter):
+    """
+    Passes the first record of each logger, level and message template in
+    `window` seconds, the first one after the window reports the suppressed ones.
+    Records of `max_level` and above are all passed, since records of one template
+    can be different failures with their own tracebacks.
+    """
+
+    def __init__(self, window: float = 10, max_level: int = logging.WARNING):
+        super().__init__()
+        self.window = window
+        self.max_level = max_level
+        # key -> [window start, suppressed]
+        self.seen: dict[tuple[str, int, str], list] = {}
+
+    def decide(self, name, level, msg, site):
+        if level >= self.max_level:
+            return True, 0
+        now = time.monotonic()
+        key = (name, level, msg if isinstance(msg, str) else str(msg))
+        seen = self.seen.get(key)
+        if seen is not None and now - seen[0] < self.window:
+            seen[1] += 1
+            return False, 0
+        if seen is None and len(self.seen) >= self.max_keys:
+            self.seen = {
+                seen_key: value
+                for seen_key, value in self.seen.items()
+                if now - value[0] < self.window
+            }
+        suppressed = seen[1] if seen is not None else 0
+        self.seen[key] = [now, 0]
+        return True, suppressed
+
+
+def create_filters(
+    rate_limit: float | None = None,
+    rate_limit_period: float = 1,
+    sampling: dict[str, float] | None = None,
+    dedup_window: float | None = None,
+) -> list[logging.Filter]:
+    filters: list[logging.Filter] = []
+    # cheapest first, later filters don't see suppressed records
+    if sampling:
+        filters.append(SamplingFilter(dict(sampling)))
+    if rate_limit:
+        filters.append(RateLimitFilter(rate_limit, rate_limit_period))
+    if dedup_window:
+        filters.append(DedupFilter(dedup_window))
+    return filters
+
+
+# filters asked by `FilteringLogger` before a record is created
+_early_filters: list[SuppressingFilter] = []
+
+
+def caller_site() -> tuple[str, int]:
+    """
+    File and line of the log call, the same as `pathname` and `lineno` of its record
+    """
+    frame = sys._getframe(2)
+    while frame is not None and os.path.normcase(frame.f_code.co_filename) == logging._srcfile:  # type: ignore[attr-defined]
+        frame = frame.f_back
+    if frame is None:
+        return "(unknown file)", 0
+    return frame.f_code.co_filename, frame.f_lineno
+
+
+class FilteringLogger(logging.Logger):
+    """
+    Runs suppressing filters before the record is created, so a suppressed
+    call doesn't pay for record creation and stack walk
+    """
+
+    def _log(self, level, msg, args, exc_info=None, extra=None, stack_info=False, stacklevel=1):
+        if _early_filters:
+            site = caller_site()
+            decided = {}
+            for log_filter in _early_filters:
+                passed, suppressed = log_filter.decide(self.name, level, msg, site)
+                if not passed:
+                    return
+                if suppressed:
+                    msg = suppressed_message(msg, suppressed)
+                decided[log_filter.attribute] = True
+            # handlers don't decide again
+            extra = {**extra, **decided} if extra else decided
+        # this frame is skipped when caller of the record is found
+        super()._log(level, msg, args, exc_info, extra, stack_info, stacklevel + 1)
+
+
+class CachedFormatter(logging.Formatter):
+    """
+    Formats each record once for all handlers sharing this formatter
+    """
+
+    def __init__(self, formatter: logging.Formatter):
+        super().__init__()
+        self.formatter = formatter
+        self.attribute = f"_fase_formatted_{id(self)}"
+
+    def format(self, record):
+        formatted = record.__dict__.get(self.attribute)
+        if formatted is None:
+            formatted = self.formatter.format(record)
+            setattr(record, self.attribute, formatted)
+        return formatted
+
+
+FILE_FORMAT = "%(asctime)s - %(name)25s - %(levelname)8s - %(message)s - %(funcName)s - %(lineno)d - %(threadName)-12s"
+file_formatter = CachedFormatter(BraceFormatStyleFormatter(FILE_FORMAT))
+
+
+def create_file_handler(level: int | str, path: str) -> logging.Handler:
     level_name = logging.getLevelName(level)
     file_handler = logging.handlers.RotatingFileHandler(
         os.path.join(path, f"{level_name}.log"),
@@ -136,30 +468,215 @@ def add_file_handler(level: int | str, path: str):
         backupCount=5,
     )
     file_handler.setLevel(level)
-    file_format = "%(asctime)s - %(name)25s - %(levelname)8s - %(message)s - %(funcName)s - %(lineno)d - %(threadName)-12s"
-    file_handler.setFormatter(BraceFormatStyleFormatter(file_format))
-    root_logger.addHandler(file_handler)
+    file_handler.setFormatter(file_formatter)
+    return file_handler
+
+
+def add_file_handler(level: int | str, path: str):
+    logging.getLogger().addHandler(create_file_handler(level, path))
+
+
+DROP = "drop"
+DROP_OLDEST = "drop_oldest"
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts records in a bounded queue without blocking, when it's full the new
+    record or the oldest one in queue is dropped
+    """
+
+    def __init__(self, log_queue: queue.Queue, overflow: str = DROP):
+        if overflow not in (DROP, DROP_OLDEST):
+            raise ValueError(f"unknown overflow policy {overflow}")
+        super().__init__(log_queue)
+        self.overflow = overflow
+        self.enqueued = 0
+        self.dropped = 0
+
+    def prepare(self, record):
+        # formatting is left to the listener thread, records are not pickled
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            self.enqueued += 1
+            return
+        except queue.Full:
+            self.dropped += 1
+            if self.overflow == DROP:
+                return
+        try:
+            self.queue.get_nowait()
+            self.queue.task_done()
+            self.queue.put_nowait(record)
+            self.enqueued += 1
+        except (queue.Empty, queue.Full):
+            pass
+
+
+_queue_handler: DroppingQueueHandler | None = None
+_listener: logging.handlers.QueueListener | None = None
+# level of console follows `set_level`, file handlers keep their own levels
+_console_handler: logging.Handler | None = None
+# process listener thread runs in, threads are not copied to forked processes
+_listener_pid: int | None = None
 
 
-def init_logging(level: int | str, file_path: str = "/tmp"):
+TEXT = "text"
+JSON = "json"
+
+
+def create_handlers(
+    level: int | str,
+    file_path: str,
+    log_format: str = TEXT,
+) -> list[logging.Handler]:
+    console_handler = logging.StreamHandler(stream=sys.stdout)
+    console_handler.setLevel(level)
+    handlers: list[logging.Handler] = [console_handler] + [
+        create_file_handler(file_level, path=file_path)
+        for file_level in (logging.DEBUG, logging.INFO, logging.WARNING, logging.ERROR)
+    ]
+    if log_format == JSON:
+        # console and files write the same line, so it's formatted once
+        json_formatter = CachedFormatter(JsonFormatter())
+        for handler in handlers:
+            handler.setFormatter(json_formatter)
+    elif log_format == TEXT:
+        console_format = "[%(asctime)s] %(levelname)-8s %(name)s %(message)s [%(funcName)s::%(lineno)d]"
+        console_handler.setFormatter(ColorizedArgsFormatter(console_format))
+    else:
+        raise ValueError(f"unknown log format {log_format}")
+    return handlers
+
+
+def sync_level(level: int | str | None = None):
+    """
+    Sets root level to the lowest level a handler would emit, so records no
+    handler wants are dropped in the log call before they are created
+    """
     root_logger = logging.getLogger()
-    root_logger.handlers.clear()
+    if level is None:
+        level = root_logger.level
+    level = logging._checkLevel(level)  # type: ignore[attr-defined]
+    handlers = _listener.handlers if _listener is not None else root_logger.handlers
+    handler_levels = [handler.level for handler in handlers]
+    if handler_levels:
+        level = max(level, min(handler_levels))
     root_logger.setLevel(level)
 
-    console_level = level
-    console_handler = logging.StreamHandler(stream=sys.stdout)
-    console_handler.setLevel(console_level)
-    console_format = "[%(asctime)s] %(levelname)-8s %(name)s %(message)s [%(funcName)s::%(lineno)d]"
-    colored_formatter = ColorizedArgsFormatter(console_format)
-    console_handler.setFormatter(colored_formatter)
-    root_logger.addHandler(console_handler)
 
-    add_file_handler(logging.DEBUG, path=file_path)
-    add_file_handler(logging.INFO, path=file_path)
-    add_file_handler(logging.WARNING, path=file_path)
-    add_file_handler(logging.ERROR, path=file_path)
+def init_logging(
+    level: int | str,
+    file_path: str = "/tmp",
+    queue_size: int | None = None,
+    overflow: str = DROP,
+    log_format: str = TEXT,
+    filters: list[logging.Filter] | None = None,
+):
+    """
+    With `queue_size` log calls only put records in a queue, and a listener
+    thread writes them to console and files.
+    `filters` are added to every handler, or only to queue handler so
+    suppressed records are not queued.
+    """
+    global _queue_handler, _listener, _console_handler, _listener_pid
+    stop_queue()
+    _early_filters[:] = [
+        log_filter for log_filter in filters or [] if isinstance(log_filter, SuppressingFilter)
+    ]
+    root_logger = logging.getLogger()
+    root_logger.handlers.clear()
+
+    handlers = create_handlers(level, file_path, log_format)
+    _console_handler = handlers[0]
+    if not queue_size:
+        for handler in handlers:
+            for log_filter in filters or []:
+                handler.addFilter(log_filter)
+            root_logger.addHandler(handler)
+        sync_level(level)
+        return
+    log_queue: queue.Queue = queue.Queue(queue_size)
+    _queue_handler = DroppingQueueHandler(log_queue, overflow=overflow)
+    for log_filter in filters or []:
+        _queue_handler.addFilter(log_filter)
+    # context is read on the loop side, records are formatted in listener thread
+    _queue_handler.addFilter(ContextFilter())
+    _listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    _listener.start()
+    _listener_pid = os.getpid()
+    root_logger.addHandler(_queue_handler)
+    sync_level(level)
+
+
+def start_queue():
+    """
+    Starts a listener thread in a process forked after `init_logging`, called
+    from lifespan of each worker. Records queued in the worker before it are lost.
+    """
+    global _listener, _listener_pid
+    if _queue_handler is None or _listener is None or _listener_pid == os.getpid():
+        return
+    # queue of parent may have been locked by its listener thread at fork
+    log_queue: queue.Queue = queue.Queue(_queue_handler.queue.maxsize)  # type: ignore[attr-defined]
+    _queue_handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(
+        log_queue, *_listener.handlers, respect_handler_level=True
+    )
+    _listener.start()
+    _listener_pid = os.getpid()
+
+
+def flush_queue():
+    """
+    Blocks until listener has handled every queued record
+    """
+    if _queue_handler is not None and _listener is not None:
+        _queue_handler.queue.join()  # type: ignore[attr-defined]
+
+
+def stop_queue():
+    """
+    Writes queued records and stops listener thread, called on exit
+    """
+    global _queue_handler, _listener
+    if _listener is not None:
+        logging.getLogger().removeHandler(_queue_handler)  # type: ignore[arg-type]
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+        _queue_handler = None
+
+
+def queue_stats() -> dict[str, int] | None:
+    # read by diagnostics
+    if _queue_handler is None:
+        return None
+    return {
+        "size": _queue_handler.queue.qsize(),  # type: ignore[attr-defined]
+        "enqueued": _queue_handler.enqueued,
+        "dropped": _queue_handler.dropped,
+    }
+
+
+atexit.register(stop_queue)
+
+
+def set_level(level: int | str):
+    if _console_handler is not None:
+        _console_handler.setLevel(level)
+    sync_level(level)
 
 
 def get_logger(name: str) -> logging.Logger:
     logger = logging.getLogger(name)
+    if type(logger) is logging.Logger:
+        # only fase loggers check filters early, class of other loggers is not changed
+        logger.__class__ = FilteringLogger
     return logger
@@ -0,0 +1,207 @@
+"""
+Event loop lag monitor and blocking call detector.
+
+A task sleeps `interval` in a loop and records how late it wakes up. A watchdog
+thread logs stack of loop thread and the route being served when loop doesn't
+wake up for `threshold` seconds.
+
+In tests:
+    async with LoopMonitor(strict_ms=50):
+        ...  # raises BlockingCallError on exit if loop was blocked over 50ms
+"""
+import asyncio
+import contextlib
+import contextvars
+import sys
+import threading
+import time
+import traceback
+import weakref
+from typing import Any
+
+from starlette import types
+
+from fase.middlewares import metrics
+from fase.utils import logging
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+logger = logging.get_logger("loop_monitor")
+
+
+# scope of request being served, tasks started by the request inherit it
+current_scope: contextvars.ContextVar[types.Scope | None] = contextvars.ContextVar(
+    "current_scope", default=None
+)
+
+
+class BlockingCallError(Exception):
+    pass
+
+
+class LoopMonitor:
+    def __init__(
+        self,
+        interval: float = 0.1,
+        threshold: float = 0.1,
+        strict_ms: float | None = None,
+        registry: metrics.Registry | None = None,
+    ) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self.strict_ms = strict_ms
+        # task -> scope of request it's serving, kept by `task_factory`
+        self.scopes: weakref.WeakKeyDictionary[asyncio.Task, types.Scope] = (
+            weakref.WeakKeyDictionary()
+        )
+        self.previous_factory: Any = None
+        self.histogram = (
+            registry.histogram(
+                "fase_event_loop_lag_seconds",
+                "Delay of event loop in running a ready callback",
+                buckets=LAG_BUCKETS,
+            )
+            if registry
+            else None
+        )
+        self.violations: list[str] = []
+        self.heartbeat = time.monotonic()
+        self.reported_heartbeat = 0.0
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.loop_thread_id: int | None = None
+        self.task: asyncio.Task | None = None
+        self.stopped = threading.Event()
+        self.thread: threading.Thread | None = None
+
+    async def run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - start - self.interval)
+            self.heartbeat = time.monotonic()
+            if self.histogram is not None:
+                self.histogram.observe(lag)
+            if self.strict_ms is not None and lag * 1000 > self.strict_ms:
+                self.violations.append(f"event loop blocked for {lag * 1000:.1f}ms")
+
+    def task_factory(
+        self, loop: asyncio.AbstractEventLoop, coro: Any, **kwargs: Any
+    ) -> asyncio.Future:
+        """
+        Remembers scope of tasks created while serving a request, like the one
+        `ConcurrencyMiddleware` runs the app in. Context of other tasks can't be
+        read from watchdog thread.
+        """
+        if self.previous_factory is not None:
+            task = self.previous_factory(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+        context = kwargs.get("context")
+        scope = current_scope.get() if context is None else context.get(current_scope)
+        if scope is not None:
+            self.scopes[task] = scope
+        return task
+
+    def current_route(self) -> str:
+        # read from watchdog thread, at worst it's the route of previous task
+        task = asyncio.current_task(self.loop) if self.loop is not None else None
+        scope = self.scopes.get(task) if task is not None else None
+        if scope is None:
+            return "unknown"
+        return getattr(scope.get("route"), "path", scope["path"])
+
+    def watch(self) -> None:
+        while not self.stopped.wait(self.threshold / 2):
+            heartbeat = self.heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked < self.threshold or heartbeat == self.reported_heartbeat:
+                continue
+            self.reported_heartbeat = heartbeat
+            frame = sys._current_frames().get(self.loop_thread_id)  # type: ignore[arg-type]
+            stack = "".join(traceback.format_stack(frame)) if frame else ""
+            route = self.current_route()
+            logger.warning(
+                "event loop blocked for at least %.3fs serving %s\n%s",
+                blocked,
+                route,
+                stack,
+            )
+            if self.strict_ms is not None:
+                self.violations.append(
+                    f"event loop blocked for at least {blocked * 1000:.1f}ms serving {route}\n{stack}"
+                )
+
+    def start(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.previous_factory = self.loop.get_task_factory()
+        self.loop.set_task_factory(self.task_factory)
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self.violations = []
+        self.stopped.clear()
+        self.task = asyncio.create_task(self.run())
+        self.thread = threading.Thread(target=self.watch, name="fase-loop-monitor", daemon=True)
+        self.thread.start()
+
+    async def stop(self) -> None:
+        self.stopped.set()
+        if self.loop is not None:
+            self.loop.set_task_factory(self.previous_factory)
+            self.previous_factory = None
+        if self.task is not None:
+            self.task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.task
+            self.task = None
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.check()
+
+    def check(self) -> None:
+        """
+        Raises if loop was blocked more than `strict_ms`
+        """
+        if self.strict_ms is not None and self.violations:
+            raise BlockingCallError("\n".join(self.violations))
+
+    async def __aenter__(self) -> "LoopMonitor":
+        self.start()
+        return self
+
+    async def __aexit__(self, *_: Any) -> None:
+        await self.stop()
+
+    @contextlib.asynccontextmanager
+    async def lifespan(self, _app: Any):
+        self.start()
+        try:
+            yield
+        finally:
+            await self.stop()
+
+
+class LoopMonitorMiddleware:
+    """
+    Sets `current_scope` and remembers the request of the current task, so
+    blocking calls can be reported with route
+    """
+
+    def __init__(self, app: types.ASGIApp, monitor: LoopMonitor) -> None:
+        self.app = app
+        self.monitor = monitor
+
+    async def __call__(
+        self, scope: types.Scope, receive: types.Receive, send: types.Send
+    ) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = current_scope.set(scope)
+        task = asyncio.current_task()
+        if task is not None:
+            self.monitor.scopes[task] = scope
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_scope.reset(token)
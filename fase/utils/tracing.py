@@ -0,0 +1,516 @@
+"""
+Request scoped tracing spans propagated through contextvars.
+
+Usage:
+    fp.add_tracing(config.TracingConfig(sample_rate=0.1, exporter="log"))
+
+    async def handler():
+        with tracing.span("render", items=10):
+            ...
+
+Root span of each request is created by `TracingMiddleware`, a span only
+records when there is a sampled span above it, otherwise `span` returns a
+shared no-op context manager. Requests with `traceparent` header keep its
+sampling decision, others are sampled with `sample_rate`.
+
+Spans of a trace are exported together when root span ends. `OTLPExporter`
+posts OTLP/HTTP json to a collector, `scripts/otlp_collector.py` is a stand-in
+for a local collector that appends received payloads to a file.
+"""
+import abc
+import contextvars
+import functools
+import json
+import queue
+import random
+import threading
+import time
+import urllib.request
+from typing import Any, Callable
+
+from starlette import types
+
+from fase.utils import logging
+
+logger = logging.get_logger("tracing")
+
+
+class Span:
+    __slots__ = (
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "name",
+        "start",
+        "end",
+        "attributes",
+        "status",
+        "sampled",
+        "trace",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: str | None,
+        sampled: bool,
+        trace: list["Span"] | None,
+        attributes: dict[str, Any] | None = None,
+    ) -> None:
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.sampled = sampled
+        # spans of the trace finished in this process, shared by all spans of it
+        self.trace = trace
+        self.attributes = attributes or {}
+        self.status = "ok"
+        self.start = time.time_ns()
+        self.end = 0
+
+    @property
+    def duration(self) -> float:
+        return (self.end - self.start) / 1e9
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def finish(self) -> None:
+        self.end = time.time_ns()
+        if self.trace is not None:
+            self.trace.append(self)
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "end": self.end,
+            "duration": self.duration,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+current_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+class Exporter(abc.ABC):
+    @abc.abstractmethod
+    def export(self, spans: list[Span]) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class LogExporter(Exporter):
+    """
+    Logs one line for each trace with time of its spans
+    """
+
+    def export(self, spans: list[Span]) -> None:
+        root = spans[-1]
+        children = ", ".join(
+            f"{span.name} {span.duration * 1000:.2f}ms" for span in spans[:-1]
+        )
+        logger.info(
+            "trace %s %s %.2fms [%s]",
+            root.trace_id,
+            root.name,
+            root.duration * 1000,
+            children,
+        )
+
+
+class BackgroundExporter(Exporter):
+    """
+    Hands traces to a thread, traces are dropped when its queue is full
+    """
+
+    def __init__(self, queue_size: int = 1000) -> None:
+        self.queue: queue.Queue[list[Span] | None] = queue.Queue(queue_size)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self.run, name=type(self).__name__, daemon=True)
+        self.thread.start()
+
+    def export(self, spans: list[Span]) -> None:
+        try:
+            self.queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self) -> None:
+        while True:
+            spans = self.queue.get()
+            if spans is None:
+                return
+            batch = [spans]
+            while len(batch) < 100:
+                try:
+                    spans = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if spans is None:
+                    self.write_safe(batch)
+                    return
+                batch.append(spans)
+            self.write_safe(batch)
+
+    def write_safe(self, batch: list[list[Span]]) -> None:
+        try:
+            self.write(batch)
+        except Exception:
+            logger.exception("failed to export %s traces", len(batch))
+
+    @abc.abstractmethod
+    def write(self, batch: list[list[Span]]) -> None:
+        pass
+
+    def close(self) -> None:
+        if not self.thread.is_alive():
+            return
+        self.queue.put(None)
+        self.thread.join()
+
+
+class FileExporter(BackgroundExporter):
+    """
+    Appends spans to `path` as json lines
+    """
+
+    def __init__(self, path: str, queue_size: int = 1000) -> None:
+        self.path = path
+        super().__init__(queue_size)
+
+    def write(self, batch: list[list[Span]]) -> None:
+        with open(self.path, "a") as f:
+            for spans in batch:
+                for span in spans:
+                    f.write(json.dumps(span.to_dict(), default=str) + "\n")
+
+
+def otlp_value(value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OTLPExporter(BackgroundExporter):
+    """
+    Posts spans as OTLP/HTTP json, like to an opentelemetry collector on localhost
+    """
+
+    def __init__(
+        self,
+        endpoint: str = "http://127.0.0.1:4318/v1/traces",
+        service_name: str = "fase",
+        queue_size: int = 1000,
+        timeout: float = 5,
+    ) -> None:
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+        super().__init__(queue_size)
+
+    def payload(self, batch: list[list[Span]]) -> dict[str, Any]:
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {"key": "service.name", "value": otlp_value(self.service_name)}
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "fase"},
+                            "spans": [
+                                {
+                                    "traceId": span.trace_id,
+                                    "spanId": span.span_id,
+                                    "parentSpanId": span.parent_id or "",
+                                    "name": span.name,
+                                    "startTimeUnixNano": str(span.start),
+                                    "endTimeUnixNano": str(span.end),
+                                    "status": {"code": 1 if span.status == "ok" else 2},
+                                    "attributes": [
+                                        {"key": key, "value": otlp_value(value)}
+                                        for key, value in span.attributes.items()
+                                    ],
+                                }
+                                for spans in batch
+                                for span in spans
+                            ],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    def write(self, batch: list[list[Span]]) -> None:
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(self.payload(batch)).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+
+class Tracer:
+    def __init__(self, exporter: Exporter, sample_rate: float = 1) -> None:
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    def start_trace(self, name: str, traceparent: str | None = None, **attributes: Any) -> Span:
+        """
+        Root span of this process, continues the trace of `traceparent` when it's valid
+        """
+        parent = parse_traceparent(traceparent) if traceparent else None
+        if parent is None:
+            trace_id = f"{random.getrandbits(128):032x}"
+            parent_id = None
+            sampled = random.random() < self.sample_rate
+        else:
+            trace_id, parent_id, sampled = parent
+        return Span(
+            name,
+            trace_id=trace_id,
+            parent_id=parent_id,
+            sampled=sampled,
+            trace=[] if sampled else None,
+            attributes=attributes if sampled else None,
+        )
+
+    def end_trace(self, root: Span) -> None:
+        root.finish()
+        if root.trace:
+            self.exporter.export(root.trace)
+
+
+tracer: Tracer | None = None
+
+
+def configure(exporter: Exporter, sample_rate: float = 1) -> Tracer:
+    global tracer
+    if tracer is not None:
+        tracer.exporter.close()
+    tracer = Tracer(exporter, sample_rate)
+    return tracer
+
+
+def parse_traceparent(value: str) -> tuple[str, str, bool] | None:
+    parts = value.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        flags = int(parts[3][:2], 16)
+        int(parts[1], 16)
+        int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+def inject(headers: dict[str, str]) -> dict[str, str]:
+    """
+    Adds `traceparent` of current span to headers of an outgoing request
+    """
+    parent = current_span.get()
+    if parent is not None:
+        headers["traceparent"] = parent.traceparent()
+    return headers
+
+
+class _SpanContext:
+    __slots__ = ("name", "attributes", "activate", "span", "token")
+
+    def __init__(self, name: str, attributes: dict[str, Any], activate: bool) -> None:
+        self.name = name
+        self.attributes = attributes
+        self.activate = activate
+        self.token: contextvars.Token | None = None
+
+    def __enter__(self) -> Span:
+        parent = current_span.get()
+        self.span = Span(
+            self.name,
+            trace_id=parent.trace_id,  # type: ignore[union-attr]
+            parent_id=parent.span_id,  # type: ignore[union-attr]
+            sampled=True,
+            trace=parent.trace,  # type: ignore[union-attr]
+            attributes=self.attributes,
+        )
+        if self.activate:
+            self.token = current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if exc_type is not None:
+            self.span.status = "error"
+            self.span.attributes["error"] = repr(exc)
+        if self.token is not None:
+            current_span.reset(self.token)
+        self.span.finish()
+
+
+class _NoopSpan:
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *_: Any) -> None:
+        pass
+
+    def set(self, **_: Any) -> None:
+        pass
+
+
+NOOP = _NoopSpan()
+
+
+def span(name: str, activate: bool = True, **attributes: Any):
+    """
+    Child span of current span, it's a no-op when current trace is not sampled.
+    With `activate=False` spans created under it are not its children.
+    """
+    parent = current_span.get()
+    if parent is None or not parent.sampled:
+        return NOOP
+    return _SpanContext(name, attributes, activate)
+
+
+def traced(name: str | None = None) -> Callable:
+    """
+    Decorator for async functions, records a span for each call
+    """
+
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            parent = current_span.get()
+            if parent is None or not parent.sampled:
+                return await func(*args, **kwargs)
+            with _SpanContext(span_name, {}, True):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class TracingMiddleware:
+    """
+    Starts root span of each request and returns its `traceparent` header
+    """
+
+    def __init__(self, app: types.ASGIApp, tracer: Tracer) -> None:
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(
+        self, scope: types.Scope, receive: types.Receive, send: types.Send
+    ) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        traceparent = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        root = self.tracer.start_trace(f"HTTP {scope['method']}", traceparent)
+        encoded_traceparent = root.traceparent().encode()
+        status = None
+
+        async def send_wrapper(message: types.Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"traceparent", encoded_traceparent)
+                ]
+            await send(message)
+
+        token = current_span.set(root)
+        if root.sampled:
+            logging.bind(trace_id=root.trace_id)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as error:
+            root.status = "error"
+            root.attributes["error"] = repr(error)
+            raise
+        finally:
+            current_span.reset(token)
+            if root.sampled:
+                route = scope.get("route")
+                root.set(
+                    **{
+                        "http.method": scope["method"],
+                        "http.route": getattr(route, "path", scope["path"]),
+                        "http.status_code": status or 500,
+                    }
+                )
+                if status is not None and status >= 500:
+                    root.status = "error"
+            self.tracer.end_trace(root)
+
+
+_listening = False
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    parent = current_span.get()
+    if parent is None or not parent.sampled:
+        return
+    span_context = _SpanContext("db.query", {"db.statement": statement[:500]}, False)
+    span_context.__enter__()
+    conn.info.setdefault("fase_spans", []).append(span_context)
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get("fase_spans")
+    if spans:
+        spans.pop().__exit__(None, None, None)
+
+
+def handle_error(exception_context):
+    spans = exception_context.connection.info.get("fase_spans") if exception_context.connection else None
+    if spans:
+        error = exception_context.original_exception
+        spans.pop().__exit__(type(error), error, None)
+
+
+def listen_db() -> None:
+    """
+    Records a span for each statement, listeners are added only when tracing is enabled
+    """
+    global _listening
+    if _listening:
+        return
+    from sqlalchemy import Engine, event
+
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(Engine, "handle_error", handle_error)
+    _listening = True
+
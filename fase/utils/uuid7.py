@@ -0,0 +1,78 @@
+"""
+Time ordered UUIDv7 (RFC 9562) generation.
+
+The first 48 bits are unix time in milliseconds, so new keys are appended to
+the end of a B-tree index instead of being scattered like uuid4 keys. Keys
+made in the same millisecond by this process are increasing: a 42 bit counter
+starting from a random value is incremented for each key, and time is moved
+one millisecond ahead when it overflows. The last 32 bits are random.
+
+Layout:
+    unix_ts_ms (48) | ver (4) | counter high (12) | var (2) | counter low (30) | random (32)
+"""
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+COUNTER_BITS = 42
+COUNTER_LOW_BITS = 30
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+
+def _random_bits(bits: int) -> int:
+    return int.from_bytes(os.urandom((bits + 7) // 8), "big") >> (-bits % 8)
+
+
+def uuid7() -> uuid.UUID:
+    global _last_ms, _counter
+    with _lock:
+        ms = time.time_ns() // 1_000_000
+        if ms > _last_ms:
+            _last_ms = ms
+            # highest bit is left zero so the counter has room to grow in this millisecond
+            _counter = _random_bits(COUNTER_BITS - 1)
+        else:
+            # same millisecond, or clock went back
+            _counter += 1
+            if _counter >> COUNTER_BITS:
+                _last_ms += 1
+                _counter = _random_bits(COUNTER_BITS - 1)
+        ms = _last_ms
+        counter = _counter
+    return uuid.UUID(
+        int=(ms << 80)
+        | (0x7 << 76)
+        | ((counter >> COUNTER_LOW_BITS) << 64)
+        | (0b10 << 62)
+        | ((counter & ((1 << COUNTER_LOW_BITS) - 1)) << 32)
+        | _random_bits(32)
+    )
+
+
+def timestamp_ms(value: uuid.UUID) -> int:
+    if value.version != 7:
+        raise ValueError(f"{value} is not a UUIDv7")
+    return value.int >> 80
+
+
+def timestamp(value: uuid.UUID) -> datetime:
+    """
+    Creation time of a UUIDv7, in UTC with millisecond precision
+    """
+    return datetime.fromtimestamp(timestamp_ms(value) / 1000, timezone.utc)
+
+
+def lower_bound(moment: datetime) -> uuid.UUID:
+    """
+    Smallest UUIDv7 of `moment`, `id >= lower_bound(start)` selects keys created from
+    start using primary key index. Naive datetimes are taken as UTC
+    """
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    ms = int(moment.timestamp() * 1000)
+    return uuid.UUID(int=(ms << 80) | (0x7 << 76) | (0b10 << 62))
@@ -0,0 +1,65 @@
+"""
+Fails when importing fase modules gets slower than their budget, or pulls in
+a heavy dependency that should only be imported when it's used.
+
+Usage:
+    python scripts/check_import_time.py
+"""
+import os
+import subprocess
+import sys
+
+# modules are imported from this checkout, not an installed fase
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# module -> cumulative import time budget in milliseconds
+BUDGETS = {
+    "fase": 20,
+    "fase.db": 20,
+    "fase.users": 20,
+    "fase.core.config": 50,
+    "fase.cli.main": 300,
+}
+# imported when an attribute that needs them is used, never by the modules above
+HEAVY = {"fastapi", "sqlalchemy", "dynaconf"}
+# best of runs is taken, the first one may also compile bytecode
+RUNS = 3
+
+
+def import_times(module: str) -> dict[str, float]:
+    """
+    Cumulative import time of every module imported by `import module`, in milliseconds
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        cwd=ROOT,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative) / 1000
+    return times
+
+
+def main() -> int:
+    failed = False
+    for module, budget in BUDGETS.items():
+        runs = [import_times(module) for _ in range(RUNS)]
+        elapsed = min(times[module] for times in runs)
+        imported = HEAVY.intersection(runs[0])
+        ok = elapsed <= budget and not imported
+        failed |= not ok
+        print(
+            f"{'ok  ' if ok else 'FAIL'} import {module}: {elapsed:.1f}ms, budget {budget}ms"
+            + (f", imports {sorted(imported)}" if imported else "")
+        )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
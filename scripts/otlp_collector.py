@@ -0,0 +1,56 @@
+"""
+Stand-in for a local OTLP collector, appends each payload `OTLPExporter` posts
+to a file as a json line.
+
+Usage:
+    python scripts/otlp_collector.py [port] [output]
+
+    [default.tracing]
+    exporter = "otlp"
+    endpoint = "http://127.0.0.1:4318/v1/traces"
+"""
+import http.server
+import os
+import sys
+import threading
+from typing import Any
+
+
+class Collector(http.server.ThreadingHTTPServer):
+    def __init__(self, address: tuple[str, int], output: str) -> None:
+        self.output = output
+        self.lock = threading.Lock()
+        super().__init__(address, CollectorHandler)
+
+
+class CollectorHandler(http.server.BaseHTTPRequestHandler):
+    server: Collector
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.server.lock, open(self.server.output, "ab") as f:
+            f.write(body.replace(b"\n", b"") + b"\n")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def main() -> int:
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 4318
+    output = sys.argv[2] if len(sys.argv) > 2 else os.path.join(os.getcwd(), "spans.jsonl")
+    with Collector(("127.0.0.1", port), output) as collector:
+        print(f"collecting spans on http://127.0.0.1:{port}/v1/traces to {output}")
+        try:
+            collector.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())